@@ -20,6 +20,84 @@ environ.Env.read_env(BASE_DIR / ".env")
 
 HF_TOKEN = env("HF_TOKEN")
 
+# model_registry: 已加载模型的内存上限（MB），0 表示不限制；
+# 超出时按 LRU 卸载 MODEL_EVICTABLE_SUBFOLDERS 里的模型
+MODEL_MEMORY_BUDGET_MB = env.int("MODEL_MEMORY_BUDGET_MB", default=0)
+MODEL_EVICTABLE_SUBFOLDERS = env.list("MODEL_EVICTABLE_SUBFOLDERS", default=["TPE_fine_tuned_bert"])
+# 推理精度: fp32 / int8（Linear 层动态量化）/ bf16（硬件支持时）
+MODEL_PRECISION = env.str("MODEL_PRECISION", default="fp32")
+# 推理后端: eager / torchscript / compile / onnx，导出的模型缓存在 MODEL_EXPORT_DIR
+MODEL_BACKEND = env.str("MODEL_BACKEND", default="eager")
+MODEL_EXPORT_DIR = env.str("MODEL_EXPORT_DIR", default=str(BASE_DIR / "model_exports"))
+
+# span_model_runner: 每个 forward pass 的 (问题, 句子) 数量
+SPAN_BATCH_SIZE = env.int("SPAN_BATCH_SIZE", default=32)
+
+# attribute_predictor: PIT/Purpose/TPE/DDN 分类器每个 batch 的 span 数量
+ATTRIBUTE_BATCH_SIZE = env.int("ATTRIBUTE_BATCH_SIZE", default=64)
+
+# prediction_cache: span 属性预测的内存 LRU 条数；PREDICTION_CACHE_PATH 非空时启用 SQLite 磁盘缓存
+PREDICTION_CACHE_SIZE = env.int("PREDICTION_CACHE_SIZE", default=50000)
+PREDICTION_CACHE_PATH = env.str("PREDICTION_CACHE_PATH", default="")
+
+# model_runner: 段落分类每个 batch 的段落数量
+PARAGRAPH_BATCH_SIZE = env.int("PARAGRAPH_BATCH_SIZE", default=16)
+
+# extraction_pipeline: 分句方式 parser（en_core_web_sm 只保留依存分析，结果不变）/ sentencizer（规则分句，最快），
+# 以及 nlp.pipe 每批的段落数
+SENTENCE_SEGMENTER = env.str("SENTENCE_SEGMENTER", default="parser")
+SENTENCE_BATCH_SIZE = env.int("SENTENCE_BATCH_SIZE", default=64)
+
+# services/analysis_jobs: 异步分析任务的线程数、每隔多少个段落写一次 checkpoint、
+# 心跳超过多少秒的任务视为 worker 已挂掉并重新领取
+ANALYSIS_JOB_WORKERS = env.int("ANALYSIS_JOB_WORKERS", default=2)
+JOB_CHECKPOINT_PARAGRAPHS = env.int("JOB_CHECKPOINT_PARAGRAPHS", default=8)
+JOB_STALE_SECONDS = env.int("JOB_STALE_SECONDS", default=600)
+
+# services/policy_analysis: 同一个 URL 同一内容版本的完整分析结果在 Django cache 里保留的秒数，各接口共用
+POLICY_ANALYSIS_CACHE_SECONDS = env.int("POLICY_ANALYSIS_CACHE_SECONDS", default=3600)
+# 只统计 "Does" 句子的接口先判断 Does/Does Not，其它属性的 QA 只给 "Does" 的句子跑（结果不变，
+# 响应里多一项 evaluation 报告跳过的 QA 数）；CollectedPersonalInfoView 也可以按请求传 "staged"
+STAGED_EVALUATION = env.bool("STAGED_EVALUATION", default=False)
+# views_stream: 流式接口每块最多推理多少个段落（第一块一个段落，之后翻倍到这个上限）
+STREAM_MAX_PARAGRAPHS = env.int("STREAM_MAX_PARAGRAPHS", default=8)
+
+# services/single_flight: 同一 URL 并发分析时等别的请求/进程结果的最长秒数（超时就自己算，0 表示
+# 一直等到持有者算完或挂掉）、跨进程锁的租期（计算期间自动续租，持有锁的进程挂掉后多久可以被抢）和等锁时的轮询间隔
+SINGLE_FLIGHT_WAIT_SECONDS = env.int("SINGLE_FLIGHT_WAIT_SECONDS", default=0)
+SINGLE_FLIGHT_LOCK_SECONDS = env.int("SINGLE_FLIGHT_LOCK_SECONDS", default=60)
+SINGLE_FLIGHT_POLL_SECONDS = env.float("SINGLE_FLIGHT_POLL_SECONDS", default=0.5)
+
+# content_store: 按段落/句子内容（+ 模型 revision）存推理结果，不同 URL 之间共享
+CONTENT_STORE_ENABLED = env.bool("CONTENT_STORE_ENABLED", default=True)
+# ContentResult 表的上限：超过多少天的结果删掉、最多保留多少行（0 表示不限）；
+# 每个进程写入时最多每 CONTENT_STORE_PRUNE_SECONDS 秒清理一次（0 表示只用 manage.py prune_content_store）
+CONTENT_STORE_MAX_AGE_DAYS = env.int("CONTENT_STORE_MAX_AGE_DAYS", default=90)
+CONTENT_STORE_MAX_ROWS = env.int("CONTENT_STORE_MAX_ROWS", default=1000000)
+CONTENT_STORE_PRUNE_SECONDS = env.int("CONTENT_STORE_PRUNE_SECONDS", default=3600)
+
+# document_fetcher: 下载隐私政策页面的连接/读取超时（秒）、正文大小上限（字节，解压后）和连接池大小
+FETCH_CONNECT_TIMEOUT = env.float("FETCH_CONNECT_TIMEOUT", default=5)
+FETCH_READ_TIMEOUT = env.float("FETCH_READ_TIMEOUT", default=10)
+FETCH_MAX_BYTES = env.int("FETCH_MAX_BYTES", default=5 * 1024 * 1024)
+FETCH_POOL_SIZE = env.int("FETCH_POOL_SIZE", default=10)
+
+# shared_cache: 同一台机器所有 worker 共用的 Django cache（SQLite 文件，值压缩，超过 SHARED_CACHE_MAX_MB
+# 按 LRU 淘汰），views_api_cached 和 policy_analysis 的结果一个 worker 算过其它 worker 直接命中；
+# SHARED_CACHE_PATH 为空时退回每个进程各自的 LocMemCache
+SHARED_CACHE_PATH = env.str("SHARED_CACHE_PATH", default=str(BASE_DIR / "shared_cache.sqlite3"))
+SHARED_CACHE_MAX_MB = env.int("SHARED_CACHE_MAX_MB", default=512)
+if SHARED_CACHE_PATH:
+    CACHES = {
+        "default": {
+            "BACKEND": "privacy_classification_app.shared_cache.SharedCache",
+            "LOCATION": SHARED_CACHE_PATH,
+            "OPTIONS": {"MAX_BYTES": SHARED_CACHE_MAX_MB * 1024 * 1024},
+        }
+    }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
 
 
 
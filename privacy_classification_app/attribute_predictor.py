@@ -4,16 +4,16 @@ from transformers import AutoTokenizer, AutoModelForSequenceClassification,BertF
 '''
 for deployment
 '''
-from .load_models import load_model_and_tokenizer,load_label_mapping
-
-pit_model, pit_tokenizer = load_model_and_tokenizer("PIT_fine_tuned_bert")
-purpose_model, purpose_tokenizer = load_model_and_tokenizer("PP_fine_tuned_bert")
-tpe_model, tpe_tokenizer = load_model_and_tokenizer("TPE_fine_tuned_bert")
-ddn_model, ddn_tokenizer = load_model_and_tokenizer("DDN_fine_tuned_bert", use_bert=True)
-
-id_to_pit_label = load_label_mapping("PIT_fine_tuned_bert")
-id_to_purpose_label = load_label_mapping("PP_fine_tuned_bert")
-id_to_tpe_label = load_label_mapping("TPE_fine_tuned_bert")
+from .load_models import load_label_mapping
+from .model_registry import effective_precision, get_model, get_revision
+from . import content_store, prediction_cache
+from django.conf import settings
+
+PIT_SUBFOLDER = "PIT_fine_tuned_bert"
+PURPOSE_SUBFOLDER = "PP_fine_tuned_bert"
+TPE_SUBFOLDER = "TPE_fine_tuned_bert"
+DDN_SUBFOLDER = "DDN_fine_tuned_bert"
+# 模型和 label mapping 都在第一次预测时才加载（见 model_registry）
 '''
 above change for online deployment
 '''
@@ -53,14 +53,62 @@ ddn_id_to_label = {
     1: "Does Not"
 }
 
-def predict_does_not_label(span_text: str) -> str:
-    inputs = ddn_tokenizer(span_text, return_tensors="pt", padding=True, truncation=True, max_length=128)
+ATTRIBUTE_BATCH_SIZE = getattr(settings, "ATTRIBUTE_BATCH_SIZE", 64)
+
+
+def _classify_batch(texts, subfolder, id_to_label, max_length, default="unknown",
+                    model_class=AutoModelForSequenceClassification, batch_size=ATTRIBUTE_BATCH_SIZE):
+    """
+    批量分类：先查 prediction_cache（进程内），再查 content_store（所有 worker 共享），
+    只对都没命中的 span 去重、按长度排序，
+    再动态 padding 到每个 batch 里最长的一条，不再 pad 到 max_length。
+    全部命中时不加载模型。返回与 texts 顺序一致的 label。
+    """
+    if not texts:
+        return []
+    mid = prediction_cache.model_id(subfolder, get_revision(subfolder), effective_precision())
+
+    normalized = [prediction_cache.normalize_span(text) for text in texts]
+    labels = prediction_cache.get_many(subfolder, mid, list(dict.fromkeys(normalized)))
+    stored = content_store.get_many("value", mid, [text for text in dict.fromkeys(normalized) if text not in labels])
+    if stored:
+        prediction_cache.set_many(subfolder, mid, stored)
+        labels.update(stored)
+    unique_texts = sorted(set(normalized) - set(labels), key=len)
+    new_labels = {}
+    if unique_texts:
+        model, tokenizer = get_model(subfolder, model_class=model_class)
+    for start in range(0, len(unique_texts), batch_size):
+        batch = unique_texts[start:start + batch_size]
+        encoding = tokenizer(
+            batch,
+            padding="longest",
+            truncation=True,
+            max_length=max_length,
+            return_tensors="pt"
+        )
+        with torch.no_grad():
+            outputs = model(**encoding)
+            predicted_label_ids = torch.argmax(outputs.logits, dim=1).tolist()
+        for text, label_id in zip(batch, predicted_label_ids):
+            new_labels[text] = id_to_label.get(label_id, default)
+
+    if new_labels:
+        prediction_cache.set_many(subfolder, mid, new_labels)
+        content_store.set_many("value", mid, new_labels)
+        labels.update(new_labels)
+    return [labels[text] for text in normalized]
+
+
+def predict_does_not_label_batch(span_texts):
+    return _classify_batch(
+        span_texts, DDN_SUBFOLDER, ddn_id_to_label, max_length=128,
+        default="Unknown", model_class=BertForSequenceClassification
+    )
 
-    with torch.no_grad():
-        outputs = ddn_model(**inputs)
-        pred_id = torch.argmax(outputs.logits).item()
 
-    return ddn_id_to_label.get(pred_id, "Unknown")
+def predict_does_not_label(span_text: str) -> str:
+    return predict_does_not_label_batch([span_text])[0]
 
 '''
 Hide following code
@@ -80,43 +128,59 @@ with open(f"{TPE_MODEL_PATH}/label_mapping.json", "r") as f:
     tpe_label_mapping = json.load(f)
 id_to_tpe_label = {v: k for k, v in tpe_label_mapping.items()}
 '''
+def predict_tpe_value_batch(text_spans):
+    return _classify_batch(text_spans, TPE_SUBFOLDER, load_label_mapping(TPE_SUBFOLDER), max_length=256)
+
+
+def predict_pit_value_batch(text_spans):
+    return _classify_batch(text_spans, PIT_SUBFOLDER, load_label_mapping(PIT_SUBFOLDER), max_length=256)
+
+
+def predict_purpose_value_batch(text_spans):
+    return _classify_batch(text_spans, PURPOSE_SUBFOLDER, load_label_mapping(PURPOSE_SUBFOLDER), max_length=512)
+
+
 def predict_tpe_value(text_span: str) -> str:
-    encoding = tpe_tokenizer(
-        text_span,
-        padding="max_length",
-        truncation=True,
-        max_length=256,
-        return_tensors="pt"
-    )
-    with torch.no_grad():
-        outputs = tpe_model(**encoding)
-        predicted_label_id = torch.argmax(outputs.logits, dim=1).item()
-    return id_to_tpe_label.get(predicted_label_id, "unknown")
+    return predict_tpe_value_batch([text_span])[0]
 
 
 def predict_pit_value(text_span: str) -> str:
-    encoding = pit_tokenizer(
-        text_span,
-        padding="max_length",
-        truncation=True,
-        max_length=256,
-        return_tensors="pt"
-    )
-    with torch.no_grad():
-        outputs = pit_model(**encoding)
-        predicted_label_id = torch.argmax(outputs.logits, dim=1).item()
-    return id_to_pit_label.get(predicted_label_id, "unknown")
+    return predict_pit_value_batch([text_span])[0]
 
 
 def predict_purpose_value(text_span: str) -> str:
-    encoding = purpose_tokenizer(
-        text_span,
-        padding="max_length",
-        truncation=True,
-        max_length=512,
-        return_tensors="pt"
-    )
-    with torch.no_grad():
-        outputs = purpose_model(**encoding)
-        predicted_label_id = torch.argmax(outputs.logits, dim=1).item()
-    return id_to_purpose_label.get(predicted_label_id, "unknown")
\ No newline at end of file
+    return predict_purpose_value_batch([text_span])[0]
+
+
+def load_attribute_models():
+    return {
+        PIT_SUBFOLDER: get_model(PIT_SUBFOLDER),
+        PURPOSE_SUBFOLDER: get_model(PURPOSE_SUBFOLDER),
+        TPE_SUBFOLDER: get_model(TPE_SUBFOLDER),
+        DDN_SUBFOLDER: get_model(DDN_SUBFOLDER, model_class=BertForSequenceClassification),
+    }
+
+
+ATTRIBUTE_BATCH_PREDICTORS = {
+    "Personal Information Type": predict_pit_value_batch,
+    "Purpose": predict_purpose_value_batch,
+    "Does/Does Not": predict_does_not_label_batch,
+    "Third Party Entity": predict_tpe_value_batch,
+}
+
+
+def predict_attribute_values(queries):
+    """
+    queries: [(attribute, span_text), ...]
+    按属性分组，每种属性只跑一次批量推理，返回与 queries 顺序一致的预测值。
+    """
+    by_attr = {}
+    for i, (attr, text) in enumerate(queries):
+        by_attr.setdefault(attr, []).append(i)
+
+    results = [None] * len(queries)
+    for attr, indices in by_attr.items():
+        predicted = ATTRIBUTE_BATCH_PREDICTORS[attr]([queries[i][1] for i in indices])
+        for i, value in zip(indices, predicted):
+            results[i] = value
+    return results
@@ -0,0 +1,140 @@
+"""
+content_store.py
+按内容寻址的结果库。很多隐私政策是同一个模板生成的（Termly、iubenda、Shopify ...），
+同一个段落/句子不管出现在哪个 URL，只需要推理一次，之后都只是一次查表。
+
+key = sha256(kind, 模型 id, 文本)，模型 id 包含 subfolder、revision 和精度，
+模型更新后旧结果自然不再命中。存在数据库（ContentResult 表）里，所有 worker 共享：
+
+- "paragraph": 段落分类的 sigmoid 概率（阈值在读取后再应用）
+- "sentences": 段落的分句结果（模型 id 是 spaCy 模型版本）
+- "attribute_spans": 某个属性的问题在句子上抽取到的 span（和类别无关，按属性分开存，
+  只需要部分属性的接口不用把其它属性也跑一遍）
+- "value": PIT / Purpose / TPE / DDN 分类器对 span 文本的预测值
+
+文本由调用方决定是否先 normalize：对 tokenizer 等价的文本（段落、句子、span）
+应该先 normalize_text，分句结果要原样返回句子，所以用原文。
+
+表的大小有上限：超过 CONTENT_STORE_MAX_AGE_DAYS 天的结果删掉，再只保留最新的
+CONTENT_STORE_MAX_ROWS 行。写入时每个进程最多每 CONTENT_STORE_PRUNE_SECONDS 秒清理一次，
+也可以用 manage.py prune_content_store 手动清理。删掉的结果下次用到时重新推理一次。
+"""
+import contextvars
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .prediction_cache import normalize_span as normalize_text
+
+CONTENT_STORE_ENABLED = getattr(settings, "CONTENT_STORE_ENABLED", True)
+CONTENT_STORE_MAX_AGE_DAYS = getattr(settings, "CONTENT_STORE_MAX_AGE_DAYS", 90)
+CONTENT_STORE_MAX_ROWS = getattr(settings, "CONTENT_STORE_MAX_ROWS", 1000000)
+CONTENT_STORE_PRUNE_SECONDS = getattr(settings, "CONTENT_STORE_PRUNE_SECONDS", 3600)
+CHUNK_SIZE = 500  # SQLite 单条语句的参数个数有上限
+
+_bypass = contextvars.ContextVar("content_store_bypass", default=False)
+_stats = {}
+_lock = threading.Lock()
+_last_prune = {"at": None}
+
+
+def content_key(kind, mid, text):
+    return hashlib.sha256(f"{kind}\0{mid}\0{text}".encode("utf-8")).hexdigest()
+
+
+def enabled():
+    return CONTENT_STORE_ENABLED and not _bypass.get()
+
+
+@contextmanager
+def bypass():
+    """with 块内不读也不写（例如 parity 报告要测真实的推理延迟）。"""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def _count(kind, hits, misses):
+    with _lock:
+        counter = _stats.setdefault(kind, {"hits": 0, "misses": 0})
+        counter["hits"] += hits
+        counter["misses"] += misses
+
+
+def get_many(kind, mid, texts):
+    """返回 {text: value}，只包含命中的文本。"""
+    if not enabled() or not texts:
+        return {}
+    from .models import ContentResult
+
+    keys = {content_key(kind, mid, text): text for text in texts}
+    key_list = list(keys)
+    found = {}
+    for start in range(0, len(key_list), CHUNK_SIZE):
+        rows = ContentResult.objects.filter(key__in=key_list[start:start + CHUNK_SIZE]).values_list("key", "value")
+        found.update((keys[key], value) for key, value in rows)
+    _count(kind, len(found), len(keys) - len(found))
+    return found
+
+
+def set_many(kind, mid, values):
+    """values: {text: value}，value 需要能 JSON 序列化。已存在的 key 不覆盖（同样的输入结果一样）。"""
+    if not enabled() or not values:
+        return
+    from .models import ContentResult
+
+    ContentResult.objects.bulk_create(
+        [
+            ContentResult(key=content_key(kind, mid, text), kind=kind, model_id=mid, value=value)
+            for text, value in values.items()
+        ],
+        batch_size=CHUNK_SIZE,
+        ignore_conflicts=True,
+    )
+    _maybe_prune()
+
+
+def prune(max_age_days=None, max_rows=None):
+    """
+    删掉超过 max_age_days 天的结果，再只保留最新的 max_rows 行（默认取设置，0 表示不限）。
+    返回删除的行数。
+    """
+    from .models import ContentResult
+
+    max_age_days = CONTENT_STORE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    max_rows = CONTENT_STORE_MAX_ROWS if max_rows is None else max_rows
+    deleted = 0
+    if max_age_days:
+        cutoff = timezone.now() - timedelta(days=max_age_days)
+        deleted += ContentResult.objects.filter(created_at__lt=cutoff).delete()[0]
+    if max_rows:
+        # 第 max_rows + 1 新的那一行的时间，它和更旧的都删掉
+        oldest_kept = list(
+            ContentResult.objects.order_by("-created_at").values_list("created_at", flat=True)[max_rows:max_rows + 1]
+        )
+        if oldest_kept:
+            deleted += ContentResult.objects.filter(created_at__lte=oldest_kept[0]).delete()[0]
+    return deleted
+
+
+def _maybe_prune():
+    if not CONTENT_STORE_PRUNE_SECONDS:
+        return
+    now = time.monotonic()
+    with _lock:
+        if _last_prune["at"] is not None and now - _last_prune["at"] < CONTENT_STORE_PRUNE_SECONDS:
+            return
+        _last_prune["at"] = now
+    prune()
+
+
+def stats():
+    with _lock:
+        return {"enabled": CONTENT_STORE_ENABLED, "kinds": {kind: dict(c) for kind, c in _stats.items()}}
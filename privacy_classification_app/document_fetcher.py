@@ -0,0 +1,130 @@
+"""
+document_fetcher.py
+隐私政策页面的下载和解析，一次请求里每个 URL 只下载、解析一次：
+fetch_document() 返回的 PolicyDocument 同时交给日期检测（utils.find_last_updated）
+和段落抽取（views.paragraphs_from_document），两者共用同一遍 HTML 扫描（见 html_extraction）。
+
+传入上一次保存的 ETag / Last-Modified 时会发条件请求（If-None-Match / If-Modified-Since），
+服务器返回 304 时不下载正文，document.not_modified 为 True。
+
+下载本身：
+- 每个 worker 进程一个 requests.Session（连接池 + keep-alive，不用每次重新握手）
+- 声明支持 gzip / deflate（装了 Brotli 时还有 br），由 urllib3 解压
+- 流式读取，解压后超过 FETCH_MAX_BYTES 立即断开并抛 DocumentTooLarge，
+  Content-Length 已经超出的话连正文都不读
+- 连接超时和读取超时分开配置（FETCH_CONNECT_TIMEOUT / FETCH_READ_TIMEOUT）
+"""
+import os
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.compat import chardet
+from urllib3.util.request import ACCEPT_ENCODING
+
+from .html_extraction import extract_policy_content
+
+FETCH_CONNECT_TIMEOUT = getattr(settings, "FETCH_CONNECT_TIMEOUT", 5)
+FETCH_READ_TIMEOUT = getattr(settings, "FETCH_READ_TIMEOUT", 10)
+FETCH_MAX_BYTES = getattr(settings, "FETCH_MAX_BYTES", 5 * 1024 * 1024)
+FETCH_POOL_SIZE = getattr(settings, "FETCH_POOL_SIZE", 10)
+CHUNK_SIZE = 64 * 1024
+
+HEADERS = {"User-Agent": "Mozilla/5.0", "Accept-Encoding": ACCEPT_ENCODING}
+
+_session = {"pid": None, "session": None}
+_session_lock = threading.Lock()
+
+
+class DocumentTooLarge(requests.RequestException):
+    """页面（解压后）超过 FETCH_MAX_BYTES。"""
+
+
+class PolicyDocument:
+    """一次下载的结果；content 第一次用到时才解析，之后共用同一份。"""
+
+    def __init__(self, url, status_code, text="", etag=None, last_modified=None):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self._content = None
+
+    @property
+    def not_modified(self):
+        return self.status_code == 304
+
+    @property
+    def ok(self):
+        return self.status_code == 200
+
+    @property
+    def content(self):
+        """(paragraphs, last_updated)，一遍扫描同时得到。"""
+        if self._content is None:
+            self._content = extract_policy_content(self.text)
+        return self._content
+
+
+def get_session():
+    """每个进程一个 Session（gunicorn fork 之后不能共用父进程的连接池）。"""
+    with _session_lock:
+        if _session["pid"] != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=FETCH_POOL_SIZE, pool_maxsize=FETCH_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(HEADERS)
+            _session.update(pid=os.getpid(), session=session)
+        return _session["session"]
+
+
+def _read_body(response, max_bytes):
+    """流式读取正文（已解压），超过 max_bytes 立即停止。"""
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise DocumentTooLarge(f"{response.url}: Content-Length {content_length} exceeds {max_bytes} bytes")
+
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_bytes:
+            raise DocumentTooLarge(f"{response.url}: body exceeds {max_bytes} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _decode(response, body):
+    # 和 requests 的 response.text 一样：优先用响应头里的编码，没有再猜
+    encoding = response.encoding or (chardet.detect(body)["encoding"] if chardet else None) or "utf-8"
+    return str(body, encoding, errors="replace")
+
+
+def fetch_document(url, etag=None, last_modified=None, max_bytes=None):
+    """下载 url；etag / last_modified 是上一次响应里的校验值，有的话发条件请求。"""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    response = get_session().get(
+        url, headers=headers, timeout=(FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT), stream=True
+    )
+    # with 块结束时把连接放回连接池（提前中止时关闭连接）
+    with response:
+        text = ""
+        if response.status_code != 304:
+            text = _decode(response, _read_body(response, max_bytes or FETCH_MAX_BYTES))
+
+    return PolicyDocument(
+        url,
+        response.status_code,
+        text=text,
+        # 304 响应可能不带校验值，沿用请求里的
+        etag=response.headers.get("ETag") or etag,
+        last_modified=response.headers.get("Last-Modified") or last_modified,
+    )
@@ -1,17 +1,69 @@
+from functools import lru_cache
+
 import spacy
-nlp = spacy.load("en_core_web_sm")
-from .span_model_runner import run_span_model, load_span_model
+from django.conf import settings
+
+# 分句方式："parser"（默认）用 en_core_web_sm 的依存分析定句子边界，但不加载用不到的
+# tagger / lemmatizer / ner，结果和完整 pipeline 一样；"sentencizer" 是纯规则分句，最快
+SENTENCE_SEGMENTER = getattr(settings, "SENTENCE_SEGMENTER", "parser")
+SENTENCE_BATCH_SIZE = getattr(settings, "SENTENCE_BATCH_SIZE", 64)
+
+
+def load_sentence_splitter(segmenter=SENTENCE_SEGMENTER):
+    if segmenter == "parser":
+        return spacy.load("en_core_web_sm", exclude=["tagger", "attribute_ruler", "lemmatizer", "ner"])
+    if segmenter == "sentencizer":
+        splitter = spacy.blank("en")
+        splitter.add_pipe("sentencizer")
+        return splitter
+    raise ValueError(f"Unsupported SENTENCE_SEGMENTER: {segmenter}")
 
-span_model, span_tokenizer = load_span_model()
+
+@lru_cache(maxsize=None)
+def sentence_splitter():
+    # 第一次分句时才加载：import 本模块（比如跑测试）不需要装好 spaCy 模型
+    return load_sentence_splitter()
+
+
+from .span_model_runner import SUBFOLDER as SPAN_SUBFOLDER, run_span_model_batch
+from .attribute_predictor import predict_attribute_values
+from .model_registry import effective_precision
+from .inference_backend import model_revision
+from . import content_store, prediction_cache
 
 FIRST_PARTY_ATTRS = ["Does/Does Not", "Personal Information Type", "Purpose"]
 THIRD_PARTY_ATTRS = ["Personal Information Type", "Does/Does Not", "Third Party Entity", "Purpose"]
 
-def split_into_sentences(text):
-    doc = nlp(text)
+def _doc_sentences(doc):
     return [sent.text.strip() for sent in doc.sents]
 
 
+def split_into_sentences(text):
+    return _doc_sentences(sentence_splitter()(text))
+
+
+def _splitter_id():
+    meta = sentence_splitter().meta
+    return f"spacy:{SENTENCE_SEGMENTER}:{meta.get('lang')}_{meta.get('name')}@{meta.get('version')}"
+
+
+def split_paragraphs_into_sentences(paragraphs):
+    """
+    整篇 policy 的段落用一次 spaCy pipe 批量分句。
+    分句结果也存进 content_store，见过的段落不用再跑 spaCy。
+    """
+    unique = list(dict.fromkeys(paragraphs))
+    sentences = content_store.get_many("sentences", _splitter_id(), unique)
+    misses = [para for para in unique if para not in sentences]
+    new_sentences = {
+        para: _doc_sentences(doc)
+        for para, doc in zip(misses, sentence_splitter().pipe(misses, batch_size=SENTENCE_BATCH_SIZE))
+    }
+    content_store.set_many("sentences", _splitter_id(), new_sentences)
+    sentences.update(new_sentences)
+    return [sentences[para] for para in paragraphs]
+
+
 
 def is_target_paragraph(label_list):
     return ("First Party Collection/Use" in label_list) or ("Third Party Sharing/Collection" in label_list)
@@ -23,26 +75,114 @@ def get_attributes_for_label(label):
         return THIRD_PARTY_ATTRS
     return []
 
-def extract_from_paragraph(paragraph_text, labels, model, tokenizer):
-    results = []
+def _target_labels(labels):
+    return [l for l in labels if l in ["First Party Collection/Use", "Third Party Sharing/Collection"]]
 
-    target_labels = [l for l in labels if l in ["First Party Collection/Use", "Third Party Sharing/Collection"]]
-    if not target_labels:
-        return results
 
-    sentences = split_into_sentences(paragraph_text)
+def _span_key(sentence, attr):
+    # span 结果只取决于属性（决定问题）和句子内容；同一句子在两个类别下共用
+    return f"{attr}\n{content_store.normalize_text(sentence)}"
 
-    for sentence in sentences:
-        for label in target_labels:
-            attributes = get_attributes_for_label(label)
-            spans = run_span_model(sentence, label, attributes, model, tokenizer)
-            results.append({
-                "sentence": sentence,
-                "category": label,
-                "attributes": spans
-            })
+
+def sentence_items(paragraphs_with_labels):
+    """
+    只分句，不跑 span 模型：每个段落对应一个 [{"sentence", "category", "attributes": {}}, ...]。
+    句子在段落的每个目标类别下各一项，attributes 之后由 fill_spans 按需填。
+    """
+    targets = [para for para, labels in paragraphs_with_labels if _target_labels(labels)]
+    split = dict(zip(targets, split_paragraphs_into_sentences(targets)))
+    return [
+        [
+            {"sentence": sentence, "category": label, "attributes": {}}
+            for sentence in split[para]
+            for label in _target_labels(labels)
+        ] if para in split else []
+        for para, labels in paragraphs_with_labels
+    ]
+
+
+def plan_span_jobs(items, attributes=None):
+    """
+    需要跑的 (句子, 属性) QA：句子类别下的属性，只取 attributes 里声明的（None 表示全部），
+    已经填过的跳过。返回 [(item, attr), ...]。
+    """
+    return [
+        (item, attr)
+        for item in items
+        for attr in get_attributes_for_label(item["category"])
+        if (attributes is None or attr in attributes) and attr not in item["attributes"]
+    ]
+
+
+def extract_spans(pairs, model, tokenizer):
+    """
+    pairs: [(sentence, attr), ...]，返回一一对应的 span 列表。
+    先查 content_store，只有没见过的 (属性, 句子) 才一起批量跑 span 模型。
+    """
+    if not pairs:
+        return []
+    mid = prediction_cache.model_id(SPAN_SUBFOLDER, model_revision(model), effective_precision(model.device))
+    keys = [_span_key(sentence, attr) for sentence, attr in pairs]
+    stored = content_store.get_many("attribute_spans", mid, list(dict.fromkeys(keys)))
+
+    missing = {}
+    for key, pair in zip(keys, pairs):
+        if key not in stored and key not in missing:
+            missing[key] = pair
+    new_spans = dict(zip(missing, run_span_model_batch(list(missing.values()), model, tokenizer)))
+    content_store.set_many("attribute_spans", mid, new_spans)
+    stored.update(new_spans)
+    return [list(stored[key]) for key in keys]
+
+
+def fill_spans(items, model, tokenizer, attributes=None):
+    """按 plan_span_jobs 给句子补上 attributes 里声明的属性 span（原地修改），返回跑了多少个 QA。"""
+    jobs = plan_span_jobs(items, attributes)
+    spans = extract_spans([(item["sentence"], attr) for item, attr in jobs], model, tokenizer)
+    for (item, attr), attr_spans in zip(jobs, spans):
+        item["attributes"][attr] = attr_spans
+    for item in {id(item): item for item, _ in jobs}.values():
+        # 属性保持 get_attributes_for_label 的顺序，和一次全部抽取时一样
+        item["attributes"] = {
+            attr: item["attributes"][attr]
+            for attr in get_attributes_for_label(item["category"]) if attr in item["attributes"]
+        }
+    return len(jobs)
+
+
+def extract_from_paragraphs(paragraphs_with_labels, model, tokenizer, attributes=None):
+    """
+    整篇 policy 一起抽取，paragraphs_with_labels: [(paragraph_text, labels), ...]
+    attributes: 只抽取这些属性（None 表示类别下的全部属性），其它 QA 不跑
+    返回: 每个段落对应一个 extract_from_paragraph 格式的结果列表
+    """
+    results = sentence_items(paragraphs_with_labels)
+    fill_spans([item for items in results for item in items], model, tokenizer, attributes)
     return results
 
+
+def extract_from_paragraph(paragraph_text, labels, model, tokenizer, attributes=None):
+    return extract_from_paragraphs([(paragraph_text, labels)], model, tokenizer, attributes)[0]
+
+def predict_sentence_values(sentence_items):
+    """
+    对每个句子在其类别下的属性，用 ", " 连接 span 后预测属性值，整篇 policy 一次批量完成。
+    返回与 sentence_items 一一对应的 predicted_values 字典。
+    """
+    queries = []
+    owners = []
+    for i, item in enumerate(sentence_items):
+        for attr in get_attributes_for_label(item["category"]):
+            joined = ", ".join(item["attributes"].get(attr, []))
+            if joined:
+                queries.append((attr, joined))
+                owners.append((i, attr))
+
+    predicted_values = [{} for _ in sentence_items]
+    for (i, attr), value in zip(owners, predict_attribute_values(queries)):
+        predicted_values[i][attr] = value
+    return predicted_values
+
 def highlight_spans(sentence, attributes, category, predicted_values=None):
     html = sentence
     for attr_type, spans in attributes.items():
@@ -0,0 +1,178 @@
+"""
+html_extraction.py
+一遍扫描 HTML，同时得到段落列表和 “Last Updated” 日期。
+
+以前是两棵 html.parser 的 BeautifulSoup 树：段落抽取遍历所有 <p>，日期检测再对整篇 get_text()。
+这里直接在 html.parser 的事件流上做，不建树，结果与原来的做法一致：
+- 段落：每个 <p> 里所有文本片段 strip 后拼接（= p.get_text(strip=True)），只保留长度 > 30 的
+- 日期：整篇文本（= soup.get_text()）里第一个关键字后 100 个字符内的日期
+
+为了和 BeautifulSoup 的 html.parser 树保持一致：结束标签会关闭到最近的同名标签为止，
+void 元素（br、img ...）立即关闭，script / style / template / rt / rp 里的文本和注释不算正文，
+纯空白的文本片段压缩成一个空格或换行（pre / textarea 里除外）。
+"""
+import re
+from html.entities import html5
+from html.parser import HTMLParser
+
+MIN_PARAGRAPH_LENGTH = 30
+DATE_KEYWORDS = ["last updated", "effective date", "last modified"]
+DATE_PATTERN = re.compile(r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})')
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta",
+    "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex",
+    "nextid", "spacer",
+}
+NON_TEXT_ELEMENTS = {"script", "style", "template", "rt", "rp"}
+PRESERVE_WHITESPACE = {"pre", "textarea"}
+ASCII_SPACES = " \n\t\x0c\r"
+
+
+class _PolicyHTMLParser(HTMLParser):
+
+    def __init__(self):
+        # 字符引用自己处理，和 BeautifulSoup 的规则一致
+        super().__init__(convert_charrefs=False)
+        self.stack = []  # 打开的标签：(name, 段落下标或 None)
+        self.open_paragraphs = []
+        self.non_text_depth = 0  # 打开的 NON_TEXT_ELEMENTS 个数
+        self.preserve_depth = 0  # 打开的 PRESERVE_WHITESPACE 个数
+        self.paragraph_parts = []  # 每个 <p> 一个列表，按开始标签出现的顺序
+        self.text_parts = []
+        self.data = []
+        self.closed_void = []
+
+    def _flush(self):
+        """一段连续文本结束（遇到任何标签 / 注释）。"""
+        if not self.data:
+            return
+        text = "".join(self.data)
+        self.data = []
+        if self.non_text_depth:
+            return
+        if not self.preserve_depth and not text.strip(ASCII_SPACES):
+            text = "\n" if "\n" in text else " "
+        self.text_parts.append(text)
+        stripped = text.strip()
+        if stripped:
+            for index in self.open_paragraphs:
+                self.paragraph_parts[index].append(stripped)
+
+    def _push(self, tag):
+        self._flush()
+        index = None
+        if tag == "p":
+            index = len(self.paragraph_parts)
+            self.paragraph_parts.append([])
+            self.open_paragraphs.append(index)
+        self.non_text_depth += tag in NON_TEXT_ELEMENTS
+        self.preserve_depth += tag in PRESERVE_WHITESPACE
+        self.stack.append((tag, index))
+
+    def _pop(self):
+        name, index = self.stack.pop()
+        if index is not None:
+            self.open_paragraphs.remove(index)
+        self.non_text_depth -= name in NON_TEXT_ELEMENTS
+        self.preserve_depth -= name in PRESERVE_WHITESPACE
+
+    def handle_starttag(self, tag, attrs):
+        self._push(tag)
+        if tag in VOID_ELEMENTS:
+            # void 元素立即关闭，之后多余的 </br> 之类忽略一次
+            self._pop()
+            self.closed_void.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # <p/> 这种自闭合写法：开始后马上关闭
+        self._push(tag)
+        self._close(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_void:
+            self.closed_void.remove(tag)
+            return
+        self._close(tag)
+
+    def _close(self, tag):
+        self._flush()
+        if not any(name == tag for name, _ in self.stack):
+            return
+        while self.stack:
+            name, _ = self.stack[-1]
+            self._pop()
+            if name == tag:
+                break
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_charref(self, name):
+        try:
+            codepoint = int(name[1:], 16) if name[:1] in ("x", "X") else int(name)
+        except ValueError:
+            codepoint = None
+        data = None
+        if codepoint is not None and codepoint < 256:
+            # 很多页面的 &#150; 之类其实是 windows-1252
+            try:
+                data = bytes([codepoint]).decode("windows-1252")
+            except UnicodeDecodeError:
+                pass
+        if not data and codepoint is not None:
+            try:
+                data = chr(codepoint)
+            except (ValueError, OverflowError):
+                pass
+        self.data.append(data or "\N{REPLACEMENT CHARACTER}")
+
+    def handle_entityref(self, name):
+        self.data.append(html5.get(name + ";", "&" + name))
+
+    def _handle_special(self, text=None):
+        # 注释、声明等单独成段，不算正文；CDATA 算
+        self._flush()
+        if text is not None:
+            self.data.append(text)
+            self._flush()
+
+    def handle_comment(self, data):
+        self._handle_special()
+
+    def handle_decl(self, decl):
+        self._handle_special()
+
+    def handle_pi(self, data):
+        self._handle_special()
+
+    def unknown_decl(self, data):
+        self._handle_special(data[len("CDATA["):] if data.upper().startswith("CDATA[") else None)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def find_date(text):
+    """在整篇文本里找 “Last Updated” 之类关键字后面的日期，返回 YYYY-MM-DD 格式 或 None。"""
+    text = text.lower()
+    for keyword in DATE_KEYWORDS:
+        idx = text.find(keyword)
+        if idx != -1:
+            match = DATE_PATTERN.search(text[idx: idx + 100])
+            if match:
+                return match.group(1)
+    return None
+
+
+def extract_policy_content(html):
+    """一遍扫描，返回 (paragraphs, last_updated)。"""
+    parser = _PolicyHTMLParser()
+    parser.feed(html)
+    parser.close()
+    paragraphs = ["".join(parts) for parts in parser.paragraph_parts]
+    return (
+        [p for p in paragraphs if len(p) > MIN_PARAGRAPH_LENGTH],
+        find_date("".join(parser.text_parts)),
+    )
@@ -0,0 +1,219 @@
+"""
+inference_backend.py
+可插拔的推理后端，由 MODEL_BACKEND 选择：
+
+- "eager"（默认）：直接调用 HuggingFace PyTorch 模型
+- "torchscript"：torch.jit.trace 导出到磁盘，之后直接加载 .pt
+- "compile"：torch.compile，不落盘
+- "onnx"：导出 .onnx 到磁盘，用 ONNX Runtime（CPU）推理；int8 时用 ORT 动态量化
+
+导出的文件放在 MODEL_EXPORT_DIR/<subfolder>/<backend>-<precision>/，
+meta.json 记录模型 revision，revision 变了会自动重新导出。
+导出先写临时文件再 os.replace，meta.json 最后写（同样是原子替换），所以别的 worker 不会读到
+写了一半的模型；多个 worker 同时启动时用文件锁排队，只有一个导出，其它的等它写完直接加载。
+包装后的模型和 HF 模型一样调用：model(**inputs) 返回带 .logits 或
+.start_logits/.end_logits 的对象，所以 predict 函数不需要改。
+"""
+import json
+import logging
+import os
+
+import torch
+from django.conf import settings
+from filelock import FileLock
+from transformers.modeling_outputs import ModelOutput
+
+MODEL_BACKEND = getattr(settings, "MODEL_BACKEND", "eager")
+MODEL_EXPORT_DIR = getattr(settings, "MODEL_EXPORT_DIR", os.path.join(settings.BASE_DIR, "model_exports"))
+BACKENDS = ("eager", "torchscript", "compile", "onnx")
+
+INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+logger = logging.getLogger(__name__)
+
+
+def model_revision(model):
+    return config_revision(model.config)
+
+
+def config_revision(config):
+    # 从 hub 加载时 config 上会有 commit hash；本地模型退回到路径
+    return getattr(config, "_commit_hash", None) or getattr(config, "_name_or_path", "")
+
+
+def _example_inputs(model):
+    # 第二行带 padding，保证 trace 到的是使用 attention_mask 的分支
+    input_ids = torch.tensor([[101, 2000, 2001, 2002, 102], [101, 2000, 102, 0, 0]])
+    input_ids = input_ids.clamp(max=model.config.vocab_size - 1)
+    attention_mask = (input_ids != 0).long()
+    token_type_ids = torch.zeros_like(input_ids)
+    return {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+
+
+def _output_names(model, example):
+    with torch.no_grad():
+        outputs = model(**example)
+    return [name for name in ("logits", "start_logits", "end_logits") if getattr(outputs, name, None) is not None]
+
+
+class ExportedModel:
+    """TorchScript / ONNX 模型的统一包装，调用方式与 HF 模型相同。"""
+
+    def __init__(self, runner, output_names, config, nbytes, device=torch.device("cpu")):
+        self._runner = runner
+        self.output_names = output_names
+        self.config = config
+        self.nbytes = nbytes
+        self.device = device
+
+    def __call__(self, **inputs):
+        outputs = self._runner({name: inputs[name] for name in INPUT_NAMES if name in inputs})
+        return ModelOutput(**dict(zip(self.output_names, outputs)))
+
+    def eval(self):
+        return self
+
+
+def _export_dir(subfolder, backend, precision):
+    return os.path.join(MODEL_EXPORT_DIR, subfolder, f"{backend}-{precision}")
+
+
+def _is_fresh(export_dir, filename, revision):
+    meta_path = os.path.join(export_dir, "meta.json")
+    if not os.path.exists(os.path.join(export_dir, filename)) or not os.path.exists(meta_path):
+        return False
+    with open(meta_path, "r") as f:
+        return json.load(f).get("revision") == revision
+
+
+def _replace(path, write):
+    """write(临时路径) 写完后原子地替换 path，失败时删掉临时文件。"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _write_meta(export_dir, revision, output_names):
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump({"revision": revision, "output_names": output_names}, f)
+
+    _replace(os.path.join(export_dir, "meta.json"), write)
+
+
+def _export(export_dir, filename, revision, output_names, write):
+    """revision 对不上时用 write(临时路径) 重新导出，返回模型文件路径。"""
+    path = os.path.join(export_dir, filename)
+    if _is_fresh(export_dir, filename, revision):
+        return path
+    os.makedirs(export_dir, exist_ok=True)
+    with FileLock(os.path.join(export_dir, "export.lock")):
+        # 等锁期间可能已经被别的 worker 导出好了
+        if not _is_fresh(export_dir, filename, revision):
+            logger.info("Exporting %s (revision %s)", path, revision)
+            _replace(path, write)
+            _write_meta(export_dir, revision, output_names)
+    return path
+
+
+def _torchscript(model, subfolder, precision):
+    example = _example_inputs(model)
+    output_names = _output_names(model, example)
+    device = next(model.parameters()).device
+
+    def write(tmp):
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example_kwarg_inputs=example, strict=False)
+        torch.jit.save(traced, tmp)
+
+    path = _export(
+        _export_dir(subfolder, "torchscript", precision), "model.pt", model_revision(model), output_names, write
+    )
+    scripted = torch.jit.load(path, map_location=device)
+    scripted.eval()
+
+    def run(inputs):
+        with torch.no_grad():
+            outputs = scripted(**inputs)
+        return [outputs[name] for name in output_names]
+
+    return ExportedModel(run, output_names, model.config, os.path.getsize(path), device)
+
+
+def _onnx(model, subfolder, precision):
+    import numpy as np
+    import onnxruntime as ort
+
+    example = _example_inputs(model)
+    output_names = _output_names(model, example)
+
+    def write(tmp):
+        fp32_path = f"{tmp}.fp32" if precision == "int8" else tmp
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES}
+        dynamic_axes.update({name: {0: "batch"} for name in output_names})
+        try:
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    tuple(example[name] for name in INPUT_NAMES),
+                    fp32_path,
+                    input_names=INPUT_NAMES,
+                    output_names=output_names,
+                    dynamic_axes=dynamic_axes,
+                    opset_version=17,
+                    dynamo=False,
+                )
+            if precision == "int8":
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                quantize_dynamic(fp32_path, tmp, weight_type=QuantType.QInt8)
+        finally:
+            if fp32_path != tmp and os.path.exists(fp32_path):
+                os.remove(fp32_path)
+
+    path = _export(_export_dir(subfolder, "onnx", precision), "model.onnx", model_revision(model), output_names, write)
+    session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+    session_inputs = {i.name for i in session.get_inputs()}
+
+    def run(inputs):
+        feed = {
+            name: value.cpu().numpy().astype(np.int64)
+            for name, value in inputs.items() if name in session_inputs
+        }
+        return [torch.from_numpy(output) for output in session.run(output_names, feed)]
+
+    return ExportedModel(run, output_names, model.config, os.path.getsize(path))
+
+
+def resolve_backend(precision, device=None, backend=None):
+    """不支持的组合回退：onnx 只走 CPU 且不支持 bf16；torchscript 不支持 int8 量化后的模型。"""
+    backend = backend or MODEL_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported MODEL_BACKEND: {backend}")
+    on_cuda = device is not None and torch.device(device).type == "cuda"
+    if backend == "onnx" and (on_cuda or precision == "bf16"):
+        logger.warning("onnx backend supports fp32/int8 on CPU only, using eager")
+        return "eager"
+    if backend == "torchscript" and precision == "int8":
+        logger.warning("torchscript backend does not trace dynamically quantized models, using eager")
+        return "eager"
+    return backend
+
+
+def wrap_model(model, subfolder, precision, backend):
+    """
+    把已经加载好（并已按 precision 处理）的 HF 模型包装成指定后端。
+    onnx 需要 fp32 的原始模型，int8 量化在 ORT 里做。
+    """
+    if backend == "eager":
+        return model
+    if backend == "compile":
+        return torch.compile(model)
+    if backend == "torchscript":
+        return _torchscript(model, subfolder, precision)
+    if backend == "onnx":
+        return _onnx(model, subfolder, precision)
+    raise ValueError(f"Unsupported backend: {backend}")
@@ -3,7 +3,8 @@
 import os
 import json
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, BertForSequenceClassification
+from functools import lru_cache
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification, BertForSequenceClassification
 from django.conf import settings
 from huggingface_hub import hf_hub_download
 HF_TOKEN = settings.HF_TOKEN
@@ -45,27 +46,28 @@ def load_model_and_tokenizer(subfolder, use_bert=False, use_token_classification
 
 
 
-def load_model_and_tokenizer(subfolder, use_bert=False):
-    if use_bert:
-        model = BertForSequenceClassification.from_pretrained(
-            BASE_REPO,
-            subfolder=subfolder,
-            token=HF_TOKEN
-        )
-    else:
-        model = AutoModelForSequenceClassification.from_pretrained(
-            BASE_REPO,
-            subfolder=subfolder,
-            token=HF_TOKEN
-        )
+def load_model_and_tokenizer(subfolder, use_bert=False, model_class=None, repo=BASE_REPO):
+    if model_class is None:
+        model_class = BertForSequenceClassification if use_bert else AutoModelForSequenceClassification
+    model = model_class.from_pretrained(
+        repo,
+        subfolder=subfolder,
+        token=HF_TOKEN
+    )
     tokenizer = AutoTokenizer.from_pretrained(
-        BASE_REPO,
+        repo,
         subfolder=subfolder,
         token=HF_TOKEN
     )
     model.eval()
     return model, tokenizer
 
+
+def load_model_config(subfolder, repo=BASE_REPO):
+    # 只下载 config.json，不加载权重
+    return AutoConfig.from_pretrained(repo, subfolder=subfolder, token=HF_TOKEN)
+
+@lru_cache(maxsize=None)
 def load_label_mapping(subfolder):
 
     file_path = hf_hub_download(
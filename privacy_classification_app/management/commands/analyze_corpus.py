@@ -0,0 +1,72 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...document_fetcher import FETCH_POOL_SIZE
+from ...services.corpus_analysis import load_targets, run_corpus
+
+
+class Command(BaseCommand):
+    help = (
+        "Analyze a corpus of privacy policies offline and store the results like the analyze-and-store endpoint. "
+        "Pages are fetched in threads while a pool of processes, each loading the models once, runs inference."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "source",
+            help="Text file with one policy URL per line, or a directory of saved .html/.htm pages "
+                 "(stored under file:// URLs)"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=min(4, os.cpu_count() or 1),
+            help="Inference processes; each one loads its own copy of the models"
+        )
+        parser.add_argument("--fetch-workers", type=int, default=FETCH_POOL_SIZE, help="Download threads")
+        parser.add_argument(
+            "--torch-threads", type=int,
+            help="torch threads per process (default: CPU count divided by --workers)"
+        )
+        parser.add_argument("--output", help="Write the full report as JSON to this path")
+
+    def handle(self, *args, **options):
+        targets = load_targets(options["source"])
+        if not targets:
+            raise CommandError(f"No policies found in {options['source']}")
+        if options["workers"] < 1 or options["fetch_workers"] < 1:
+            raise CommandError("--workers and --fetch-workers must be at least 1")
+
+        torch_threads = options["torch_threads"] or max(1, (os.cpu_count() or 1) // options["workers"])
+        self.stdout.write(
+            f"Policies: {len(targets)}  workers: {options['workers']} x {torch_threads} torch threads  "
+            f"fetch workers: {options['fetch_workers']}"
+        )
+
+        def on_result(item):
+            if item["status"] == "failed":
+                self.stderr.write(f"  failed ({item['stage']}): {item['url']}: {item['error']}")
+            elif options["verbosity"] >= 2:
+                self.stdout.write(f"  {item['status']}: {item['url']} {item['changes'] or ''}")
+
+        report = run_corpus(
+            targets, options["workers"], options["fetch_workers"], torch_threads=torch_threads, on_result=on_result
+        )
+
+        self.stdout.write(
+            f"Analyzed: {report['analyzed']}  unchanged: {report['unchanged']}  failed: {report['failed']}"
+        )
+        self.stdout.write(f"Sentences analyzed: {report['sentences']}")
+        self.stdout.write(f"Wall time: {report['wall_seconds']}s (including model loading)")
+        self.stdout.write(
+            f"Throughput: {report['policies_per_minute']} policies/min, "
+            f"{report['sentences_per_second']} sentences/s"
+        )
+        self.stdout.write(
+            f"Mean per policy: fetch {report['mean_fetch_seconds']}s, analysis {report['mean_analysis_seconds']}s"
+        )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
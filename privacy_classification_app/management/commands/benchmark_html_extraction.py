@@ -0,0 +1,81 @@
+import os
+import re
+import time
+
+from bs4 import BeautifulSoup
+from django.core.management.base import BaseCommand, CommandError
+
+from ...html_extraction import extract_policy_content
+
+
+def _legacy_extract(html):
+    """原来的做法：段落抽取和日期检测各建一棵 html.parser 的 BeautifulSoup 树。"""
+    soup = BeautifulSoup(html, 'html.parser')
+    paragraphs = [p.get_text(strip=True) for p in soup.find_all('p')]
+    paragraphs = [p for p in paragraphs if len(p) > 30]
+
+    text = BeautifulSoup(html, 'html.parser').get_text().lower()
+    for keyword in ["last updated", "effective date", "last modified"]:
+        idx = text.find(keyword)
+        if idx != -1:
+            match = re.search(r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})', text[idx: idx + 100])
+            if match:
+                return paragraphs, match.group(1)
+    return paragraphs, None
+
+
+def _load_pages(path):
+    if os.path.isdir(path):
+        paths = [
+            os.path.join(path, name) for name in sorted(os.listdir(path))
+            if name.endswith((".html", ".htm"))
+        ]
+    else:
+        paths = [path]
+    pages = []
+    for page_path in paths:
+        with open(page_path, "r", encoding="utf-8", errors="replace") as f:
+            pages.append((page_path, f.read()))
+    return pages
+
+
+def _time(func, html, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(html)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+class Command(BaseCommand):
+    help = "Benchmark single-pass HTML extraction against the BeautifulSoup implementation on stored pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("pages", help=".html file, or a directory of stored .html/.htm pages")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per page; the fastest one is reported")
+
+    def handle(self, *args, **options):
+        pages = _load_pages(options["pages"])
+        if not pages:
+            raise CommandError(f"No HTML pages found in {options['pages']}")
+
+        legacy_total = single_total = 0.0
+        mismatches = []
+        for page_path, html in pages:
+            legacy, legacy_time = _time(_legacy_extract, html, options["repeat"])
+            single, single_time = _time(extract_policy_content, html, options["repeat"])
+            legacy_total += legacy_time
+            single_total += single_time
+            if legacy != single:
+                mismatches.append(page_path)
+
+        size_mb = sum(len(html.encode("utf-8")) for _, html in pages) / (1024 * 1024)
+        self.stdout.write(f"Pages: {len(pages)} ({size_mb:.1f} MB)")
+        self.stdout.write(f"BeautifulSoup x2: {legacy_total:.3f}s ({legacy_total / len(pages) * 1000:.1f} ms/page)")
+        self.stdout.write(f"Single pass:      {single_total:.3f}s ({single_total / len(pages) * 1000:.1f} ms/page)")
+        self.stdout.write(f"Speedup: {legacy_total / single_total:.1f}x")
+        self.stdout.write(f"Identical output: {len(pages) - len(mismatches)}/{len(pages)}")
+        for page_path in mismatches:
+            self.stdout.write(f"  differs: {page_path}")
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from transformers import AutoModelForQuestionAnswering, AutoModelForSequenceClassification, BertForSequenceClassification
+
+from ... import attribute_predictor, model_runner, span_model_runner
+from ...inference_backend import MODEL_BACKEND, MODEL_EXPORT_DIR, ExportedModel
+from ...load_models import load_model_and_tokenizer
+from ...model_registry import MODEL_PRECISION, PRECISIONS, prepare_model
+
+EXPORT_BACKENDS = ("torchscript", "onnx")
+
+EXPORTED_MODELS = [
+    (model_runner.SUBFOLDER, AutoModelForSequenceClassification),
+    (span_model_runner.SUBFOLDER, AutoModelForQuestionAnswering),
+    (attribute_predictor.PIT_SUBFOLDER, AutoModelForSequenceClassification),
+    (attribute_predictor.PURPOSE_SUBFOLDER, AutoModelForSequenceClassification),
+    (attribute_predictor.TPE_SUBFOLDER, AutoModelForSequenceClassification),
+    (attribute_predictor.DDN_SUBFOLDER, BertForSequenceClassification),
+]
+
+
+class Command(BaseCommand):
+    help = "Export every fine-tuned model to TorchScript or ONNX and cache the artifacts on disk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend", choices=EXPORT_BACKENDS,
+            default=MODEL_BACKEND if MODEL_BACKEND in EXPORT_BACKENDS else "onnx"
+        )
+        parser.add_argument("--precision", choices=PRECISIONS, default=MODEL_PRECISION)
+
+    def handle(self, *args, **options):
+        backend = options["backend"]
+        precision = options["precision"]
+        if (backend, precision) in (("torchscript", "int8"), ("onnx", "bf16")):
+            raise CommandError(f"{backend} backend does not support {precision}")
+
+        for subfolder, model_class in EXPORTED_MODELS:
+            model, _ = load_model_and_tokenizer(subfolder, model_class=model_class)
+            exported = prepare_model(model, subfolder, precision, backend=backend)
+            if not isinstance(exported, ExportedModel):
+                raise CommandError(f"Could not export {subfolder} to {backend}-{precision}")
+            self.stdout.write(f"{subfolder}: {backend}-{precision} ({exported.nbytes / (1024 * 1024):.1f} MB)")
+
+        self.stdout.write(f"Artifacts cached in {MODEL_EXPORT_DIR}")
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...model_registry import PRECISIONS
+from ...services.precision_parity import load_corpus, run_precision_parity
+
+
+class Command(BaseCommand):
+    help = "Compare int8/bf16 inference against fp32 on a stored corpus of policy paragraphs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("corpus", help=".txt file with one paragraph per line, or a directory of .txt files")
+        parser.add_argument("--precision", default="int8", choices=[p for p in PRECISIONS if p != "fp32"])
+        parser.add_argument("--output", help="Write the full report as JSON to this path")
+
+    def handle(self, *args, **options):
+        paragraphs = load_corpus(options["corpus"])
+        if not paragraphs:
+            raise CommandError(f"No paragraphs found in {options['corpus']}")
+
+        report = run_precision_parity(paragraphs, options["precision"])
+
+        precision = report["precision"]
+        self.stdout.write(f"Paragraphs: {report['paragraphs']}  precision: fp32 vs {precision}")
+        if report["fallback"]:
+            self.stdout.write(self.style.WARNING(
+                f"{precision} is not supported here, models ran as {', '.join(report['effective_precision'])}"
+            ))
+        self.stdout.write(
+            f"Paragraph label agreement: {report['paragraph_labels']['agreement']} "
+            f"(max prob diff {report['paragraph_labels']['max_probability_diff']})"
+        )
+        self.stdout.write(f"Span exact match: {report['spans']['exact_match']} over {report['spans']['total']} spans")
+        for attr, stats in report["attributes"].items():
+            self.stdout.write(f"  {attr}: {stats['agreement']} over {stats['total']}")
+        for stage, timing in report["latency_seconds"].items():
+            self.stdout.write(f"Latency {stage}: fp32 {timing['fp32']}s, {precision} {timing[precision]}s")
+        self.stdout.write(
+            f"Model memory: fp32 {report['memory_mb']['fp32']} MB, {precision} {report['memory_mb'][precision]} MB"
+        )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
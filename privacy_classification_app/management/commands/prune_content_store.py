@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from ...content_store import CONTENT_STORE_MAX_AGE_DAYS, CONTENT_STORE_MAX_ROWS, prune
+
+
+class Command(BaseCommand):
+    help = "Delete stored paragraph/sentence/span results that are too old or beyond the row limit."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age-days", type=int, default=CONTENT_STORE_MAX_AGE_DAYS,
+            help="Delete results stored more than this many days ago (0 = no age limit)"
+        )
+        parser.add_argument(
+            "--max-rows", type=int, default=CONTENT_STORE_MAX_ROWS,
+            help="Keep at most this many of the newest results (0 = no row limit)"
+        )
+
+    def handle(self, *args, **options):
+        deleted = prune(max_age_days=options["max_age_days"], max_rows=options["max_rows"])
+        self.stdout.write(f"Deleted {deleted} stored results")
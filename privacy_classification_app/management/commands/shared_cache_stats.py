@@ -0,0 +1,21 @@
+import json
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Show entries, size and hit/miss/eviction counts of the node-wide shared cache (all workers combined)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clear", action="store_true", help="Remove all cached entries (counters are kept)")
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, "stats"):
+            raise CommandError("The default cache is not the shared cache (SHARED_CACHE_PATH is empty)")
+        if options["clear"]:
+            cache.clear()
+        stats = cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+        self.stdout.write(json.dumps(stats, indent=2))
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.21 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyzedSentence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField()),
+                ('category', models.CharField(max_length=100)),
+                ('sentence', models.TextField()),
+                ('attribute', models.CharField(max_length=100)),
+                ('span', models.TextField()),
+                ('predicted_value', models.TextField()),
+                ('does_or_not_value', models.CharField(blank=True, max_length=20, null=True)),
+                ('does_or_not_span', models.TextField(blank=True, null=True)),
+                ('purpose_value', models.TextField(blank=True, null=True)),
+                ('purpose_span', models.TextField(blank=True, null=True)),
+                ('third_party_entity', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ContentResult',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=20)),
+                ('model_id', models.CharField(max_length=255)),
+                ('value', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PolicyCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(unique=True)),
+                ('last_updated_date', models.CharField(blank=True, max_length=100, null=True)),
+                ('cached_result', models.JSONField()),
+                ('last_checked', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.21 on 2026-10-18 08:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_classification_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analyzedsentence',
+            name='paragraph_key',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='policycache',
+            name='paragraphs',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
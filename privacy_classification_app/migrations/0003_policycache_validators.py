@@ -0,0 +1,23 @@
+# Generated by Django 4.2.21 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_classification_app', '0002_incremental_reanalysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='policycache',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='policycache',
+            name='http_last_modified',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_classification_app', '0004_analysisjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='analysisjob',
+            index=models.Index(fields=['url', 'status'], name='job_url_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='analysisjob',
+            index=models.Index(fields=['status', 'heartbeat'], name='job_status_heartbeat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='analyzedsentence',
+            index=models.Index(fields=['url', 'category', 'attribute', 'does_or_not_value'], name='sentence_question_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='analyzedsentence',
+            index=models.Index(fields=['url', 'paragraph_key'], name='sentence_paragraph_idx'),
+        ),
+    ]
@@ -0,0 +1,205 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:25
+
+import hashlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+PIT = "Personal Information Type"
+
+
+def _legacy_records(rows):
+    """
+    没有段落记录的旧数据（paragraph_key 为空）只能从 AnalyzedSentence 行还原：
+    按 (段落, 句子, 类别) 分组，句子级的预测值从 PIT 行或对应属性的行上取。
+    """
+    items = {}
+    for row in rows:
+        item = items.setdefault((row.paragraph_key, row.sentence, row.category), {
+            "sentence": row.sentence,
+            "category": row.category,
+            "attributes": {},
+            "predicted_values": {"Personal Information Type": {}},
+        })
+        item["attributes"].setdefault(row.attribute, []).append(row.span)
+        values = item["predicted_values"]
+        if row.attribute == PIT:
+            values[PIT][row.span] = row.predicted_value
+            values.setdefault("Does/Does Not", row.does_or_not_value)
+            values.setdefault("Purpose", row.purpose_value)
+            if row.third_party_entity is not None:
+                values.setdefault("Third Party Entity", row.third_party_entity)
+        elif row.attribute in ("Does/Does Not", "Purpose", "Third Party Entity"):
+            values.setdefault(row.attribute, row.predicted_value)
+
+    records = {}
+    for (key, _, _), item in items.items():
+        item["predicted_values"].setdefault("Does/Does Not", "Unknown")
+        item["predicted_values"].setdefault("Purpose", "Unknown")
+        records.setdefault(key, {"key": key, "sentences": []})["sentences"].append(item)
+    return list(records.values())
+
+
+def copy_analyses(apps, schema_editor):
+    """PolicyCache / AnalyzedSentence -> Policy / PolicyVersion / Sentence / PolicySentence / Span。"""
+    PolicyCache = apps.get_model("privacy_classification_app", "PolicyCache")
+    AnalyzedSentence = apps.get_model("privacy_classification_app", "AnalyzedSentence")
+    Policy = apps.get_model("privacy_classification_app", "Policy")
+    PolicyVersion = apps.get_model("privacy_classification_app", "PolicyVersion")
+    Sentence = apps.get_model("privacy_classification_app", "Sentence")
+    PolicySentence = apps.get_model("privacy_classification_app", "PolicySentence")
+    Span = apps.get_model("privacy_classification_app", "Span")
+
+    sentence_ids = {}
+
+    def sentence_id(text):
+        if text not in sentence_ids:
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            sentence_ids[text] = Sentence.objects.get_or_create(hash=digest, defaults={"text": text})[0].id
+        return sentence_ids[text]
+
+    def save_version(url, last_updated, records, etag=None, http_last_modified=None):
+        policy = Policy.objects.create(url=url, etag=etag, http_last_modified=http_last_modified)
+        version = PolicyVersion.objects.create(
+            policy=policy,
+            last_updated_date=last_updated,
+            # 旧数据的段落 key 是空字符串，和任何新段落都对不上，下次更新会整篇重新分析
+            paragraph_keys=[record["key"] for record in records]
+        )
+        saved_keys = set()
+        for record in records:
+            if record["key"] in saved_keys:
+                continue
+            saved_keys.add(record["key"])
+            for item in record["sentences"]:
+                values = item["predicted_values"]
+                row = PolicySentence.objects.create(
+                    version=version,
+                    paragraph_key=record["key"],
+                    sentence_id=sentence_id(item["sentence"]),
+                    category=item["category"],
+                    does_or_not_value=values["Does/Does Not"],
+                    purpose_value=values["Purpose"],
+                    third_party_entity=values.get("Third Party Entity")
+                )
+                spans = []
+                for attr, attr_spans in item["attributes"].items():
+                    for span in attr_spans:
+                        start = item["sentence"].find(span)
+                        spans.append(Span(
+                            policy_sentence=row,
+                            attribute=attr,
+                            start=start if start != -1 else None,
+                            end=start + len(span) if start != -1 else None,
+                            text="" if start != -1 else span,
+                            predicted_value=values[PIT].get(span) if attr == PIT else None
+                        ))
+                Span.objects.bulk_create(spans)
+
+    migrated = set()
+    for cached in PolicyCache.objects.order_by("id").iterator():
+        records = cached.paragraphs
+        if not records:
+            records = _legacy_records(AnalyzedSentence.objects.filter(url=cached.url).order_by("id"))
+        if records:
+            save_version(cached.url, cached.last_updated_date, records, cached.etag, cached.http_last_modified)
+        else:
+            # 最早的 analyze_and_store_pipeline 读的是不存在的 result["categories"]，一行 AnalyzedSentence
+            # 都没存。这时建版本的话，页面日期没变就会一直返回空结果；只建 Policy，下次请求整篇重新分析
+            Policy.objects.create(url=cached.url)
+        migrated.add(cached.url)
+
+    # 只有 AnalyzedSentence 行、没有 PolicyCache 的 URL
+    for url in AnalyzedSentence.objects.exclude(url__in=migrated).values_list("url", flat=True).distinct():
+        save_version(url, None, _legacy_records(AnalyzedSentence.objects.filter(url=url).order_by("id")))
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_classification_app', '0005_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Policy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(unique=True)),
+                ('etag', models.CharField(blank=True, max_length=255, null=True)),
+                ('http_last_modified', models.CharField(blank=True, max_length=100, null=True)),
+                ('last_checked', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PolicySentence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paragraph_key', models.CharField(max_length=64)),
+                ('category', models.CharField(max_length=100)),
+                ('does_or_not_value', models.CharField(max_length=20)),
+                ('purpose_value', models.TextField()),
+                ('third_party_entity', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PolicyVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_updated_date', models.CharField(blank=True, max_length=100, null=True)),
+                ('paragraph_keys', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('policy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='privacy_classification_app.policy')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Sentence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64, unique=True)),
+                ('text', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Span',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attribute', models.CharField(max_length=100)),
+                ('start', models.PositiveIntegerField(blank=True, null=True)),
+                ('end', models.PositiveIntegerField(blank=True, null=True)),
+                ('text', models.TextField(blank=True, default='')),
+                ('predicted_value', models.TextField(blank=True, null=True)),
+                ('policy_sentence', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='spans', to='privacy_classification_app.policysentence')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='policysentence',
+            name='sentence',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='occurrences', to='privacy_classification_app.sentence'),
+        ),
+        migrations.AddField(
+            model_name='policysentence',
+            name='version',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sentences', to='privacy_classification_app.policyversion'),
+        ),
+        migrations.AddIndex(
+            model_name='span',
+            index=models.Index(fields=['policy_sentence', 'attribute'], name='span_attribute_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='policysentence',
+            index=models.Index(fields=['version', 'category', 'does_or_not_value'], name='policy_sentence_question_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='policysentence',
+            index=models.Index(fields=['version', 'paragraph_key'], name='policy_sentence_paragraph_idx'),
+        ),
+        migrations.RunPython(copy_analyses, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='AnalyzedSentence',
+        ),
+        migrations.DeleteModel(
+            name='PolicyCache',
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_classification_app', '0006_normalized_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisLock',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('owner', models.CharField(max_length=255)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.21 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_classification_app', '0007_analysislock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contentresult',
+            index=models.Index(fields=['created_at'], name='content_result_created_idx'),
+        ),
+    ]
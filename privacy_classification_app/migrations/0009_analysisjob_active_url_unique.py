@@ -0,0 +1,33 @@
+# Generated by Django 4.2.21 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+ACTIVE_STATUSES = ["pending", "running"]
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    """加约束之前，同一 URL 多出来的未完成任务（保留最早的那个）标成失败。"""
+    AnalysisJob = apps.get_model("privacy_classification_app", "AnalysisJob")
+    kept = {}
+    for job in AnalysisJob.objects.filter(status__in=ACTIVE_STATUSES).order_by("created_at"):
+        if job.url in kept:
+            job.status = "failed"
+            job.error = f"Duplicate of job {kept[job.url]}"
+            job.save(update_fields=["status", "error"])
+        else:
+            kept[job.url] = job.id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_classification_app', '0008_contentresult_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='analysisjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('url',), name='job_active_url_unique'),
+        ),
+    ]
@@ -0,0 +1,248 @@
+"""
+model_registry.py
+进程级模型注册表：每个 (repo, subfolder) 在一个 worker 里只加载一次。
+
+- 懒加载：第一次 get_model() 时才从 HuggingFace 下载/加载
+- 线程安全：同一个模型并发请求只会加载一次
+- memory_report() 汇报每个模型占用的内存
+- 配置了 MODEL_MEMORY_BUDGET_MB 时，超出预算会按 LRU 顺序
+  卸载 MODEL_EVICTABLE_SUBFOLDERS 里的模型（默认只有 TPE 分类器）
+- MODEL_PRECISION 控制推理精度："fp32"（默认）、"int8"（Linear 层动态量化）、
+  "bf16"（CPU/GPU 支持时才启用，否则回退 fp32）
+- MODEL_BACKEND 控制推理后端，见 inference_backend
+"""
+import contextvars
+import gc
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+import torch
+from django.conf import settings
+from transformers import AutoModelForSequenceClassification
+
+from .inference_backend import ExportedModel, config_revision, model_revision, resolve_backend, wrap_model
+from .load_models import BASE_REPO, load_model_and_tokenizer, load_model_config
+
+MODEL_MEMORY_BUDGET_MB = getattr(settings, "MODEL_MEMORY_BUDGET_MB", 0)
+EVICTABLE_SUBFOLDERS = set(getattr(settings, "MODEL_EVICTABLE_SUBFOLDERS", ["TPE_fine_tuned_bert"]))
+MODEL_PRECISION = getattr(settings, "MODEL_PRECISION", "fp32")
+PRECISIONS = ("fp32", "int8", "bf16")
+
+logger = logging.getLogger(__name__)
+
+# use_precision() 的临时覆盖（parity 报告要在同一进程里对比 fp32 和低精度）
+_precision_override = contextvars.ContextVar("model_precision", default=None)
+
+# key: (repo, subfolder, precision) -> entry dict, 按最近使用排序（最旧的在前）
+_models = OrderedDict()
+_lock = threading.Lock()
+_load_locks = {}
+# (repo, subfolder) -> 模型 revision，模型卸载后也保留
+_revisions = {}
+
+
+def _tensor_nbytes(value):
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        # 动态量化后的 Linear 把 weight/bias 打包成 tuple 放在 state_dict 里
+        return sum(_tensor_nbytes(v) for v in value)
+    return 0
+
+
+def _model_nbytes(model):
+    if isinstance(model, ExportedModel):
+        return model.nbytes
+    return sum(_tensor_nbytes(value) for value in model.state_dict().values())
+
+
+def bf16_supported(device=None):
+    if device is not None and torch.device(device).type == "cuda":
+        return torch.cuda.is_bf16_supported()
+    checks = [getattr(torch.cpu, name, None) for name in ("_is_avx512_bf16_supported", "_is_amx_tile_supported")]
+    return any(check() for check in checks if check is not None)
+
+
+def current_precision():
+    return _precision_override.get() or MODEL_PRECISION
+
+
+def effective_precision(device=None):
+    """当前设置下 device 上实际使用的精度（不支持时已回退到 fp32）。"""
+    return _resolve_precision(current_precision(), device)
+
+
+@contextmanager
+def use_precision(precision):
+    """在 with 块内让 get_model() 默认使用指定精度。"""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported precision: {precision}")
+    token = _precision_override.set(precision)
+    try:
+        yield
+    finally:
+        _precision_override.reset(token)
+
+
+@lru_cache(maxsize=None)
+def _resolve_precision(precision, device):
+    """不支持的组合回退到 fp32：int8 动态量化只支持 CPU，bf16 需要硬件支持。"""
+    on_cuda = device is not None and torch.device(device).type == "cuda"
+    if precision == "int8" and on_cuda:
+        logger.warning("int8 dynamic quantization is CPU-only, using fp32 on %s", device)
+        return "fp32"
+    if precision == "bf16" and not bf16_supported(device):
+        logger.warning("bf16 is not supported on this %s, using fp32", "GPU" if on_cuda else "CPU")
+        return "fp32"
+    return precision
+
+
+def _apply_precision(model, precision):
+    if precision == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif precision == "bf16":
+        model = model.to(torch.bfloat16)
+    model.eval()
+    return model
+
+
+def prepare_model(model, subfolder, precision, device=None, backend=None):
+    """把刚加载的 fp32 模型移到 device、转换精度并包装成推理后端（默认 MODEL_BACKEND）。"""
+    backend = resolve_backend(precision, device, backend)
+    if device is not None:
+        model.to(device)
+    # onnx 从 fp32 导出，int8 量化在 ONNX Runtime 里做
+    if backend != "onnx":
+        model = _apply_precision(model, precision)
+    return wrap_model(model, subfolder, precision, backend)
+
+
+def _touch(key):
+    entry = _models[key]
+    entry["hits"] += 1
+    entry["last_used"] = time.time()
+    _models.move_to_end(key)
+    return entry["model"], entry["tokenizer"]
+
+
+def _total_bytes():
+    return sum(entry["bytes"] for entry in _models.values())
+
+
+def _enforce_budget(keep):
+    """超出内存预算时，按 LRU 卸载可卸载的模型（不卸载刚加载的 keep）。调用方持有 _lock。"""
+    if not MODEL_MEMORY_BUDGET_MB:
+        return
+    budget = MODEL_MEMORY_BUDGET_MB * 1024 * 1024
+    evicted = False
+    while _total_bytes() > budget:
+        victim = next(
+            (key for key in _models if key != keep and key[1] in EVICTABLE_SUBFOLDERS),
+            None
+        )
+        if victim is None:
+            break
+        del _models[victim]
+        evicted = True
+    if evicted:
+        gc.collect()
+
+
+def get_model(subfolder, model_class=AutoModelForSequenceClassification, device=None, repo=BASE_REPO,
+              precision=None):
+    """
+    返回 (model, tokenizer)，同一进程内同一个 (repo, subfolder, precision) 只加载一次。
+    precision 默认取 current_precision()。
+    调用方不要长期持有返回的引用，否则模型被卸载后内存也不会释放。
+    """
+    precision = _resolve_precision(precision or current_precision(), device)
+    key = (repo, subfolder, precision)
+    with _lock:
+        if key in _models:
+            return _touch(key)
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    with load_lock:
+        # 等锁期间可能已经被别的线程加载好了
+        with _lock:
+            if key in _models:
+                return _touch(key)
+
+        model, tokenizer = load_model_and_tokenizer(subfolder, model_class=model_class, repo=repo)
+        revision = model_revision(model)
+        model = prepare_model(model, subfolder, precision, device)
+
+        with _lock:
+            _models[key] = {
+                "model": model,
+                "tokenizer": tokenizer,
+                "bytes": _model_nbytes(model),
+                "hits": 0,
+                "loaded_at": time.time(),
+                "last_used": time.time(),
+            }
+            _revisions[(repo, subfolder)] = revision
+            result = _touch(key)
+            _enforce_budget(keep=key)
+        return result
+
+
+def get_revision(subfolder, repo=BASE_REPO):
+    """
+    模型的 revision（预测缓存的 key 用），不加载模型，也不算一次使用：
+    加载过就用加载时记下的，没加载过只读 config。
+    """
+    key = (repo, subfolder)
+    with _lock:
+        revision = _revisions.get(key)
+    if revision is None:
+        revision = config_revision(load_model_config(subfolder, repo=repo))
+        with _lock:
+            revision = _revisions.setdefault(key, revision)
+    return revision
+
+
+def evict(subfolder, repo=BASE_REPO, precision=None):
+    """手动卸载一个模型（不指定 precision 时卸载所有精度），返回是否真的卸载了。"""
+    with _lock:
+        keys = [
+            key for key in _models
+            if key[:2] == (repo, subfolder) and precision in (None, key[2])
+        ]
+        for key in keys:
+            del _models[key]
+        removed = bool(keys)
+    if removed:
+        gc.collect()
+    return removed
+
+
+def memory_report():
+    """每个已加载模型的内存占用和使用次数，按最近使用排序。"""
+    with _lock:
+        models = [
+            {
+                "repo": repo,
+                "subfolder": subfolder,
+                "precision": precision,
+                "bytes": entry["bytes"],
+                "mb": round(entry["bytes"] / (1024 * 1024), 1),
+                "hits": entry["hits"],
+                "evictable": subfolder in EVICTABLE_SUBFOLDERS,
+                "loaded_at": entry["loaded_at"],
+                "last_used": entry["last_used"],
+            }
+            for (repo, subfolder, precision), entry in _models.items()
+        ]
+        total = _total_bytes()
+    return {
+        "models": models,
+        "total_bytes": total,
+        "total_mb": round(total / (1024 * 1024), 1),
+        "budget_mb": MODEL_MEMORY_BUDGET_MB or None,
+        "precision": current_precision(),
+    }
@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
@@ -13,24 +14,19 @@ model.to(device)
 model.eval()
 '''
 from django.conf import settings
+from .model_registry import effective_precision, get_model
+from .inference_backend import model_revision
+from . import content_store, prediction_cache
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 BASE_REPO = "mianyangacd/privacy-policy-spanbert"
 SUBFOLDER = "fine_tuned_bert_5"
 HF_TOKEN = settings.HF_TOKEN
+PARAGRAPH_BATCH_SIZE = getattr(settings, "PARAGRAPH_BATCH_SIZE", 16)
 
-tokenizer = AutoTokenizer.from_pretrained(
-    BASE_REPO,
-    subfolder=SUBFOLDER,
-    token=HF_TOKEN
-)
-model = AutoModelForSequenceClassification.from_pretrained(
-    BASE_REPO,
-    subfolder=SUBFOLDER,
-    token=HF_TOKEN
-)
 
-model.to(device)
-model.eval()
+def load_paragraph_model():
+    # 通过 model_registry 懒加载，整个进程共用一份
+    return get_model(SUBFOLDER, device=device)
 
 '''
 category labels sequences are matters!!
@@ -51,16 +47,67 @@ category_labels = [
     "User Choice/Control"
 ]
 
-def predict_paragraph_category(paragraph, threshold=0.5):
-    inputs = tokenizer(paragraph, return_tensors="pt", truncation=True, padding=True, max_length=512)
-    inputs = {key: val.to(device) for key, val in inputs.items()}
+def predict_paragraph_categories(paragraphs, threshold=0.5, batch_size=PARAGRAPH_BATCH_SIZE):
+    """
+    批量段落分类：先查 content_store，见过的段落直接用存下来的概率；
+    其余的按 token 长度分桶（排序后切 batch），每个 batch 只 pad 到桶内最长的段落。
+    返回 (labels, probs)：
+      - labels: 与 paragraphs 顺序一致，每项是预测的 label 列表（没有则为 ["None"]）
+      - probs: shape 为 (len(paragraphs), len(category_labels)) 的 sigmoid 概率矩阵
+    """
+    probs = np.zeros((len(paragraphs), len(category_labels)), dtype=np.float32)
+    if not paragraphs:
+        return [], probs
+
+    model, tokenizer = load_paragraph_model()
+    mid = prediction_cache.model_id(SUBFOLDER, model_revision(model), effective_precision(device))
+    normalized = [content_store.normalize_text(p) for p in paragraphs]
+    stored = content_store.get_many("paragraph", mid, list(dict.fromkeys(normalized)))
+    for i, text in enumerate(normalized):
+        if text in stored:
+            probs[i] = stored[text]
+
+    # 同一篇里重复的段落也只跑一次
+    pending = {}
+    for i, text in enumerate(normalized):
+        if text not in stored:
+            pending.setdefault(text, i)
+    todo = list(pending.values())
+
+    if todo:
+        encodings = tokenizer([paragraphs[i] for i in todo], truncation=True, max_length=512)
+        input_ids = encodings["input_ids"]
+        order = sorted(range(len(todo)), key=lambda j: len(input_ids[j]))
 
-    with torch.no_grad():
-        outputs = model(**inputs)
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            width = max(len(input_ids[j]) for j in bucket)
 
-    logits = outputs.logits
-    probs = torch.sigmoid(logits).cpu().numpy()[0]
-    preds = (probs > threshold).astype(int)
+            batch = {key: torch.zeros((len(bucket), width), dtype=torch.long) for key in encodings.keys()}
+            batch["input_ids"].fill_(tokenizer.pad_token_id)
+            for row, j in enumerate(bucket):
+                for key in encodings.keys():
+                    values = encodings[key][j]
+                    batch[key][row, :len(values)] = torch.tensor(values)
+            batch = {key: val.to(device) for key, val in batch.items()}
 
-    predicted = [category_labels[i] for i in range(len(category_labels)) if preds[i] == 1]
-    return predicted if predicted else ["None"]
\ No newline at end of file
+            with torch.no_grad():
+                outputs = model(**batch)
+            probs[[todo[j] for j in bucket]] = torch.sigmoid(outputs.logits.float()).cpu().numpy()
+
+        for i, text in enumerate(normalized):
+            if text in pending:
+                probs[i] = probs[pending[text]]
+        content_store.set_many("paragraph", mid, {text: probs[i].tolist() for text, i in pending.items()})
+
+    preds = probs > threshold
+    labels = []
+    for row in preds:
+        predicted = [category_labels[i] for i in range(len(category_labels)) if row[i]]
+        labels.append(predicted if predicted else ["None"])
+    return labels, probs
+
+
+def predict_paragraph_category(paragraph, threshold=0.5):
+    labels, _ = predict_paragraph_categories([paragraph], threshold=threshold)
+    return labels[0]
@@ -1,33 +1,154 @@
+import uuid
+
 from django.db import models
 
-class PolicyCache(models.Model):
+class Policy(models.Model):
     url = models.URLField(unique=True)
-    last_updated_date = models.CharField(max_length=100, null=True, blank=True)
-    cached_result = models.JSONField()
+    # 上一次响应的 ETag / Last-Modified，检查更新时发条件请求，304 就不用重新下载
+    etag = models.CharField(max_length=255, null=True, blank=True)
+    http_last_modified = models.CharField(max_length=100, null=True, blank=True)
     last_checked = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.url
 
 
-class AnalyzedSentence(models.Model):
-    url = models.URLField()
+class PolicyVersion(models.Model):
+    # 每个 Policy 只保留当前版本；内容变了就建新版本，没改动的段落的句子直接移过去
+    # （见 services/analysis_manager.py）
+    policy = models.ForeignKey(Policy, on_delete=models.CASCADE, related_name="versions")
+    last_updated_date = models.CharField(max_length=100, null=True, blank=True)
+    # 按页面顺序的段落 key（规范化文本的 sha256），下一版本用来对齐段落
+    paragraph_keys = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.policy.url} | {self.last_updated_date}"
+
+
+class Sentence(models.Model):
+    # 句子原文只存一份，所有政策、所有版本共用
+    hash = models.CharField(max_length=64, unique=True)  # sha256(text)
+    text = models.TextField()
+
+    def __str__(self):
+        return self.text[:80]
+
+
+class PolicySentence(models.Model):
+    # 某个版本里一个句子按某个类别的分析结果；句子级的预测值（所有 span 一起预测的）放在这里
+    # 下面两个组合索引都以 version 开头，不需要再单独建索引
+    version = models.ForeignKey(PolicyVersion, on_delete=models.CASCADE, related_name="sentences", db_index=False)
+    paragraph_key = models.CharField(max_length=64)
+    sentence = models.ForeignKey(Sentence, on_delete=models.PROTECT, related_name="occurrences")
     category = models.CharField(max_length=100)  # e.g., "First Party Collection/Use"
-    sentence = models.TextField()
 
+    does_or_not_value = models.CharField(max_length=20)  # 没有 span 时为 "Unknown"
+    purpose_value = models.TextField()  # 第一个 Purpose span 的预测值，没有 span 时为 "Unknown"
+    third_party_entity = models.TextField(null=True, blank=True)  # 没有 TPE span 时为 NULL
+
+    class Meta:
+        indexes = [
+            # 问题查询：当前版本里某个类别（+ Does / Does Not）的句子
+            models.Index(fields=["version", "category", "does_or_not_value"], name="policy_sentence_question_idx"),
+            # 新版本按段落移动没改动的句子
+            models.Index(fields=["version", "paragraph_key"], name="policy_sentence_paragraph_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.category} | {self.does_or_not_value} | {self.sentence_id}"
+
+
+class Span(models.Model):
+    policy_sentence = models.ForeignKey(
+        PolicySentence, on_delete=models.CASCADE, related_name="spans", db_index=False
+    )  # span_attribute_idx 以它开头
     attribute = models.CharField(max_length=100)  # e.g., "Personal Information Type"
-    span = models.TextField()
-    predicted_value = models.TextField()
+    # span 在句子里的位置；句子里找不到原文时为 NULL，文本存在 text 里
+    start = models.PositiveIntegerField(null=True, blank=True)
+    end = models.PositiveIntegerField(null=True, blank=True)
+    text = models.TextField(blank=True, default="")
+    # Personal Information Type 的 span 各自的预测值（不在句子里的 span 为 NULL）；
+    # 其它属性的预测值在 PolicySentence 上
+    predicted_value = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["policy_sentence", "attribute"], name="span_attribute_idx"),
+        ]
+
+    def get_text(self, sentence_text):
+        if self.start is None:
+            return self.text
+        return sentence_text[self.start:self.end]
+
+    def __str__(self):
+        return f"{self.attribute} | {self.predicted_value}"
+
+
+class ContentResult(models.Model):
+    # 按内容寻址的推理结果，见 content_store.py
+    key = models.CharField(max_length=64, primary_key=True)  # sha256(kind, model_id, text)
+    kind = models.CharField(max_length=20)  # paragraph / sentences / attribute_spans / value
+    model_id = models.CharField(max_length=255)
+    value = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
 
-    does_or_not_value = models.CharField(max_length=20, null=True, blank=True)
-    does_or_not_span = models.TextField(null=True, blank=True)
+    class Meta:
+        indexes = [
+            # content_store.prune 按时间删旧结果
+            models.Index(fields=["created_at"], name="content_result_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} | {self.model_id} | {self.key[:12]}"
 
-    purpose_value = models.TextField(null=True, blank=True)
-    purpose_span = models.TextField(null=True, blank=True)
 
-    third_party_entity = models.TextField(null=True, blank=True)
+class AnalysisJob(models.Model):
+    # 异步分析任务，数据库表就是队列，见 services/analysis_jobs.py
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
 
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    url = models.URLField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    total_paragraphs = models.IntegerField(null=True, blank=True)
+    completed_paragraphs = models.IntegerField(default=0)
+    # 下载下来的段落、已经完成的段落记录、页面校验值；进程崩了从这里继续
+    checkpoint = models.JSONField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True, default="")
+    heartbeat = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # submit_job 找同一 URL 未完成的任务；resume_stale_jobs 找 pending / 心跳超时的任务
+            models.Index(fields=["url", "status"], name="job_url_status_idx"),
+            models.Index(fields=["status", "heartbeat"], name="job_status_heartbeat_idx"),
+        ]
+        constraints = [
+            # 同一个 URL 同时最多一个未完成的任务，并发提交时后建的那个会失败（见 submit_job）
+            models.UniqueConstraint(
+                fields=["url"], condition=models.Q(status__in=["pending", "running"]), name="job_active_url_unique"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.url} | {self.status} | {self.completed_paragraphs}/{self.total_paragraphs}"
+
+
+class AnalysisLock(models.Model):
+    # services/single_flight.py 的跨进程锁：一行就是一把锁，过期的锁可以被别的进程抢走
+    key = models.CharField(max_length=64, primary_key=True)
+    owner = models.CharField(max_length=255)
+    expires_at = models.DateTimeField()
 
     def __str__(self):
-        return f"{self.url} | {self.attribute} | {self.predicted_value}"
+        return f"{self.key[:12]} | {self.owner} | {self.expires_at}"
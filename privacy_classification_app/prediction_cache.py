@@ -0,0 +1,152 @@
+"""
+prediction_cache.py
+span 级属性预测的记忆化缓存，放在 PIT / Purpose / TPE / DDN 分类器前面。
+
+- key: (模型 id, 规范化后的 span 文本)，模型 id 包含 subfolder、revision 和精度，
+  模型 revision 一变，旧的缓存自然失效
+- 内存里是有上限的 LRU（PREDICTION_CACHE_SIZE 条）
+- 配置了 PREDICTION_CACHE_PATH 时，还有一层 SQLite 磁盘缓存，重启后仍然有效；
+  第一次见到某个 subfolder 的新 revision 时会删除它旧 revision 的记录（其它精度的不删，
+  切换 MODEL_PRECISION 或跑 precision_parity 不会清掉另一种精度的缓存）
+- stats() 返回每个模型的 hit / miss 计数
+"""
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+PREDICTION_CACHE_SIZE = getattr(settings, "PREDICTION_CACHE_SIZE", 50000)
+PREDICTION_CACHE_PATH = getattr(settings, "PREDICTION_CACHE_PATH", "")
+
+_memory = OrderedDict()
+_stats = {}
+_lock = threading.Lock()
+
+_db = {"pid": None, "conn": None}
+_db_lock = threading.Lock()
+_checked_models = set()
+
+
+def normalize_span(text):
+    # 只合并空白：对 BERT tokenizer 来说结果完全一样
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def model_id(subfolder, revision, precision):
+    return f"{subfolder}@{revision}:{precision}"
+
+
+def _counter(mid):
+    return _stats.setdefault(mid, {"hits": 0, "disk_hits": 0, "misses": 0})
+
+
+def _connection():
+    """每个进程一个连接（gunicorn fork 之后不能共用父进程的连接）。调用方持有 _db_lock。"""
+    if not PREDICTION_CACHE_PATH:
+        return None
+    if _db["pid"] != os.getpid():
+        conn = sqlite3.connect(PREDICTION_CACHE_PATH, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS span_predictions ("
+            " subfolder TEXT NOT NULL, model_id TEXT NOT NULL, text TEXT NOT NULL, label TEXT NOT NULL,"
+            " PRIMARY KEY (model_id, text))"
+        )
+        conn.commit()
+        _db.update(pid=os.getpid(), conn=conn)
+        _checked_models.clear()
+    return _db["conn"]
+
+
+def _invalidate_old_revisions(conn, subfolder, mid):
+    # model_id 是 "{subfolder}@{revision}:{precision}"，同一个 revision 的所有精度前缀相同
+    prefix = mid.rsplit(":", 1)[0] + ":"
+    if prefix in _checked_models:
+        return
+    conn.execute(
+        "DELETE FROM span_predictions WHERE subfolder = ? AND substr(model_id, 1, ?) != ?",
+        (subfolder, len(prefix), prefix)
+    )
+    conn.commit()
+    _checked_models.add(prefix)
+
+
+def _remember(mid, text, label):
+    _memory[(mid, text)] = label
+    _memory.move_to_end((mid, text))
+    while len(_memory) > PREDICTION_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+
+def get_many(subfolder, mid, texts):
+    """返回 {text: label}，只包含命中的文本。texts 应该已经 normalize_span 过。"""
+    found = {}
+    with _lock:
+        counter = _counter(mid)
+        for text in texts:
+            key = (mid, text)
+            if key in _memory:
+                _memory.move_to_end(key)
+                found[text] = _memory[key]
+        counter["hits"] += len(found)
+
+    missing = [text for text in texts if text not in found]
+    if missing:
+        with _db_lock:
+            conn = _connection()
+            if conn is not None:
+                _invalidate_old_revisions(conn, subfolder, mid)
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = conn.execute(
+                        f"SELECT text, label FROM span_predictions WHERE model_id = ? "
+                        f"AND text IN ({','.join('?' * len(chunk))})",
+                        [mid, *chunk]
+                    ).fetchall()
+                    found.update(rows)
+
+    with _lock:
+        counter = _counter(mid)
+        for text in missing:
+            if text in found:
+                counter["disk_hits"] += 1
+                _remember(mid, text, found[text])
+            else:
+                counter["misses"] += 1
+    return found
+
+
+def set_many(subfolder, mid, labels):
+    """labels: {text: label}"""
+    with _lock:
+        for text, label in labels.items():
+            _remember(mid, text, label)
+
+    with _db_lock:
+        conn = _connection()
+        if conn is not None:
+            conn.executemany(
+                "INSERT OR REPLACE INTO span_predictions (subfolder, model_id, text, label) VALUES (?, ?, ?, ?)",
+                [(subfolder, mid, text, label) for text, label in labels.items()]
+            )
+            conn.commit()
+
+
+def stats():
+    with _lock:
+        return {
+            "size": len(_memory),
+            "max_size": PREDICTION_CACHE_SIZE,
+            "disk_path": PREDICTION_CACHE_PATH or None,
+            "models": {mid: dict(counter) for mid, counter in _stats.items()},
+        }
+
+
+def clear():
+    """清空内存缓存和计数（磁盘缓存保留）。"""
+    with _lock:
+        _memory.clear()
+        _stats.clear()
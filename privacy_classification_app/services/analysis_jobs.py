@@ -0,0 +1,201 @@
+"""
+analysis_jobs.py
+异步分析任务：POST 立即返回 job id，分析在本进程的线程池里跑（ANALYSIS_JOB_WORKERS 个线程），
+AnalysisJob 表本身就是队列，不需要外部 broker。结果和 analyze_and_store_pipeline 一样存成
+政策的新版本。
+
+- 每分析完 JOB_CHECKPOINT_PARAGRAPHS 个段落，就把段落记录写回 checkpoint，同时更新进度和心跳
+  （设成 1 就是每个段落一个 checkpoint，代价是段落之间不再一起批量推理）
+- worker 进程被杀掉后，心跳超过 JOB_STALE_SECONDS 的 running 任务会被重新领取，从 checkpoint 继续；
+  没人处理的 pending 任务（比如重启前还在排队的）也一样。提交任务和查询状态时都会检查一次
+- 领取任务是一条带条件的 UPDATE，多个 worker 进程同时检查也只有一个能领到
+- 同一个 URL 已经有未完成的任务时，直接返回那个任务；表上有 (url, 未完成) 的部分唯一约束，
+  两个请求同时提交也只会建一个任务
+- 任务和同步的 analyze_and_store_pipeline 共用同一个 single_flight（analysis_flight），同一个 URL
+  同时只有一个在分析；等过别人的，直接用别人刚存好的版本（这时不更新进度）
+"""
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import AnalysisJob
+from ..views import paragraphs_from_document
+from .analysis_manager import align_paragraphs, analysis_flight, check_policy, store_policy_analysis
+from .privacy_pipeline import analyze_paragraphs
+
+ANALYSIS_JOB_WORKERS = getattr(settings, "ANALYSIS_JOB_WORKERS", 2)
+JOB_CHECKPOINT_PARAGRAPHS = getattr(settings, "JOB_CHECKPOINT_PARAGRAPHS", 8)
+JOB_STALE_SECONDS = getattr(settings, "JOB_STALE_SECONDS", 600)
+ACTIVE_STATUSES = ["pending", "running"]
+
+logger = logging.getLogger(__name__)
+
+_pool = {"pid": None, "executor": None}
+_scheduled = set()
+_lock = threading.Lock()
+
+
+class LostClaim(Exception):
+    """任务被别的 worker 重新领取了（本进程被当成已经挂掉）。"""
+
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _executor():
+    """每个进程一个线程池（gunicorn fork 之后不能用父进程的线程）。调用方持有 _lock。"""
+    if _pool["pid"] != os.getpid():
+        _pool.update(
+            pid=os.getpid(),
+            executor=ThreadPoolExecutor(max_workers=ANALYSIS_JOB_WORKERS, thread_name_prefix="analysis-job")
+        )
+        _scheduled.clear()
+    return _pool["executor"]
+
+
+def _schedule(job_id):
+    with _lock:
+        executor = _executor()
+        if job_id in _scheduled:
+            return
+        _scheduled.add(job_id)
+        executor.submit(run_job, job_id)
+
+
+def _claimable():
+    cutoff = timezone.now() - timedelta(seconds=JOB_STALE_SECONDS)
+    return Q(status="pending") | Q(status="running", heartbeat__lt=cutoff)
+
+
+def resume_stale_jobs():
+    """把没人处理的 pending 任务和心跳超时的 running 任务放进本进程的线程池。"""
+    for job_id in AnalysisJob.objects.filter(_claimable()).values_list("id", flat=True):
+        _schedule(job_id)
+
+
+def _active_job(url):
+    return AnalysisJob.objects.filter(url=url, status__in=ACTIVE_STATUSES).order_by("created_at").first()
+
+
+def submit_job(url):
+    """创建（或复用同一 URL 未完成的）任务并放进线程池，立即返回 AnalysisJob。"""
+    job = _active_job(url)
+    while job is None:
+        try:
+            with transaction.atomic():
+                job = AnalysisJob.objects.create(url=url)
+        except IntegrityError:
+            # 另一个请求刚建好了同一 URL 的任务（唯一约束），用它的
+            job = _active_job(url)
+    resume_stale_jobs()
+    return job
+
+
+def job_status(job):
+    return {
+        "job_id": str(job.id),
+        "url": job.url,
+        "status": job.status,
+        "completed_paragraphs": job.completed_paragraphs,
+        "total_paragraphs": job.total_paragraphs,
+        "result": job.result if job.status == "done" else None,
+        "error": job.error if job.status == "failed" else None,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+def _claim(job_id):
+    return AnalysisJob.objects.filter(_claimable(), id=job_id).update(
+        status="running", worker=_worker_id(), heartbeat=timezone.now()
+    ) == 1
+
+
+def _update(job, **fields):
+    """只有还持有任务时才写；被别的 worker 接手了就抛 LostClaim。"""
+    updated = AnalysisJob.objects.filter(id=job.id, status="running", worker=_worker_id()).update(
+        heartbeat=timezone.now(), updated_at=timezone.now(), **fields
+    )
+    if not updated:
+        raise LostClaim(str(job.id))
+
+
+def _save_checkpoint(job, checkpoint):
+    _update(
+        job,
+        checkpoint=checkpoint,
+        total_paragraphs=len(checkpoint["paragraphs"]),
+        completed_paragraphs=sum(record is not None for record in checkpoint["records"]),
+    )
+
+
+def _run(job):
+    result, _ = analysis_flight(job.url, lambda: (_analyze(job), None))
+    # 完成后 checkpoint 没用了，段落记录已经存进表里
+    _update(job, status="done", result=result, checkpoint=None)
+
+
+def _analyze(job):
+    """检查并分析 job.url（有 checkpoint 就从那里继续），存成新版本，返回结果。"""
+    checkpoint = job.checkpoint
+    if checkpoint is None:
+        old_records, document, last_updated, fresh_result = check_policy(job.url)
+        if fresh_result is not None:
+            total = len(old_records)
+            _update(job, total_paragraphs=total, completed_paragraphs=total)
+            return fresh_result
+
+        paragraphs = paragraphs_from_document(document)
+        # 和上一版本对齐，没改动的段落直接算完成
+        records, changes = align_paragraphs(old_records, paragraphs)
+        logger.info("Job %s for %s: %s", job.id, job.url, changes)
+        checkpoint = {
+            "paragraphs": paragraphs,
+            "records": records,
+            "last_updated": last_updated,
+            "etag": document.etag,
+            "http_last_modified": document.last_modified,
+        }
+        _save_checkpoint(job, checkpoint)
+
+    todo = [j for j, record in enumerate(checkpoint["records"]) if record is None]
+    for start in range(0, len(todo), JOB_CHECKPOINT_PARAGRAPHS):
+        chunk = todo[start:start + JOB_CHECKPOINT_PARAGRAPHS]
+        for j, record in zip(chunk, analyze_paragraphs([checkpoint["paragraphs"][j] for j in chunk])):
+            checkpoint["records"][j] = record
+        _save_checkpoint(job, checkpoint)
+
+    return store_policy_analysis(
+        job.url, checkpoint["records"], checkpoint["last_updated"],
+        checkpoint["etag"], checkpoint["http_last_modified"]
+    )
+
+
+def run_job(job_id):
+    with _lock:
+        _scheduled.discard(job_id)
+    try:
+        if not _claim(job_id):
+            return
+        job = AnalysisJob.objects.get(id=job_id)
+        try:
+            _run(job)
+        except LostClaim:
+            logger.warning("Job %s was taken over by another worker", job_id)
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            AnalysisJob.objects.filter(id=job_id, worker=_worker_id()).update(
+                status="failed", error=str(e) or repr(e), updated_at=timezone.now()
+            )
+    finally:
+        # 线程池里的线程不会经过 request 结束的清理，自己关掉数据库连接
+        connection.close()
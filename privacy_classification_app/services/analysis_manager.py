@@ -1,54 +1,302 @@
 # privacy_classification_app/services/analysis_manager.py
 
-from ..models import PolicyCache, AnalyzedSentence
-from ..utils import extract_last_updated
-from .privacy_pipeline import run_privacy_pipeline
+import hashlib
+import logging
+from difflib import SequenceMatcher
 
-def analyze_and_store_pipeline(url):
-    last_updated = extract_last_updated(url)
-
-    cached = PolicyCache.objects.filter(url=url).first()
-    if cached and cached.last_updated_date == last_updated:
-        return cached.cached_result
-
-    # 分析隐私政策
-    result = run_privacy_pipeline(url)
-
-    # 更新 PolicyCache
-    if cached:
-        cached.cached_result = result
-        cached.last_updated_date = last_updated
-        cached.save()
-    else:
-        PolicyCache.objects.create(
-            url=url,
-            cached_result=result,
-            last_updated_date=last_updated
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from ..models import Policy, PolicySentence, PolicyVersion, Sentence, Span
+from ..document_fetcher import fetch_document
+from ..extraction_pipeline import get_attributes_for_label
+from ..utils import find_last_updated
+from ..views import paragraphs_from_document
+from .privacy_pipeline import analyze_paragraphs, build_pipeline_result, paragraph_key
+from .single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+# 每条 INSERT 的行数
+BULK_CREATE_BATCH_SIZE = 500
+
+
+def align_paragraphs(old_records, paragraphs):
+    """
+    把新版本的段落和上一版本的分析记录对齐（按规范化文本的 hash 做 diff）。
+    返回 (records, changes)：
+      - records: 与 paragraphs 一一对应，没改动的段落直接复用旧记录，新增/改动的为 None
+      - changes: 段落数统计 {"unchanged", "moved", "analyzed", "removed"}
+    diff 里位置对不上、但旧版本里有一样文本的段落（顺序调整）也直接复用，算 moved。
+    """
+    old_keys = [record["key"] for record in old_records]
+    new_keys = [paragraph_key(para) for para in paragraphs]
+    records = [None] * len(paragraphs)
+    used = set()
+
+    matcher = SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    for i, j, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            records[j + offset] = old_records[i + offset]
+            used.add(i + offset)
+    unchanged = len(used)
+
+    by_key = {}
+    for i, key in enumerate(old_keys):
+        if i not in used:
+            by_key.setdefault(key, []).append(i)
+    for j, key in enumerate(new_keys):
+        if records[j] is None and by_key.get(key):
+            i = by_key[key].pop(0)
+            records[j] = old_records[i]
+            used.add(i)
+
+    changes = {
+        "unchanged": unchanged,
+        "moved": len(used) - unchanged,
+        "analyzed": sum(record is None for record in records),
+        "removed": len(old_records) - len(used),
+    }
+    return records, changes
+
+
+def analyze_incrementally(paragraphs, old_records):
+    """只对新增或改动过的段落做推理，返回 (records, changes)；changes["sentences"] 是推理过的句子数。"""
+    records, changes = align_paragraphs(old_records, paragraphs)
+    todo = [j for j, record in enumerate(records) if record is None]
+    for j, record in zip(todo, analyze_paragraphs([paragraphs[j] for j in todo])):
+        records[j] = record
+    changes["sentences"] = sum(len(records[j]["sentences"]) for j in todo)
+    return records, changes
+
+
+def sentence_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _sentence_ids(texts):
+    """句子文本 -> Sentence id；还没存过的句子先插入。"""
+    by_hash = {sentence_hash(text): text for text in texts}
+    hashes = list(by_hash)
+    ids = {}
+    for start in range(0, len(hashes), BULK_CREATE_BATCH_SIZE):
+        ids.update(Sentence.objects.filter(hash__in=hashes[start:start + BULK_CREATE_BATCH_SIZE]).values_list("hash", "id"))
+
+    missing = [h for h in hashes if h not in ids]
+    if missing:
+        Sentence.objects.bulk_create(
+            [Sentence(hash=h, text=by_hash[h]) for h in missing],
+            batch_size=BULK_CREATE_BATCH_SIZE, ignore_conflicts=True
+        )
+        for start in range(0, len(missing), BULK_CREATE_BATCH_SIZE):
+            ids.update(Sentence.objects.filter(hash__in=missing[start:start + BULK_CREATE_BATCH_SIZE]).values_list("hash", "id"))
+    return {by_hash[h]: sentence_id for h, sentence_id in ids.items()}
+
+
+def _span_offsets(span, sentence):
+    """(start, end, text)：句子里能找到原文时只存位置，否则存文本。"""
+    start = sentence.find(span)
+    if start == -1:
+        return None, None, span
+    return start, start + len(span), ""
+
+
+def _save_sentences(version, records):
+    """把段落记录里的句子和 span 写进 version（records 里的 key 不能重复）。"""
+    items = [(record["key"], item) for record in records for item in record["sentences"]]
+    sentence_ids = _sentence_ids([item["sentence"] for _, item in items])
+
+    rows = [
+        PolicySentence(
+            version=version,
+            paragraph_key=key,
+            sentence_id=sentence_ids[item["sentence"]],
+            category=item["category"],
+            does_or_not_value=item["predicted_values"]["Does/Does Not"],
+            purpose_value=item["predicted_values"]["Purpose"],
+            third_party_entity=item["predicted_values"].get("Third Party Entity")
+        )
+        for key, item in items
+    ]
+    PolicySentence.objects.bulk_create(rows, batch_size=BULK_CREATE_BATCH_SIZE)
+
+    spans = []
+    for row, (_, item) in zip(rows, items):
+        pit_values = item["predicted_values"]["Personal Information Type"]
+        for attr, attr_spans in item["attributes"].items():
+            for span in attr_spans:
+                start, end, text = _span_offsets(span, item["sentence"])
+                spans.append(Span(
+                    policy_sentence=row,
+                    attribute=attr,
+                    start=start,
+                    end=end,
+                    text=text,
+                    predicted_value=pit_values.get(span) if attr == "Personal Information Type" else None
+                ))
+    Span.objects.bulk_create(spans, batch_size=BULK_CREATE_BATCH_SIZE)
+
+
+def load_records(version):
+    """
+    从表里还原 version 的段落记录（与 paragraph_keys 一一对应），格式同 analyze_paragraphs，
+    只是没有 text / labels（对齐和拼结果都用不到）。
+    """
+    rows = (
+        version.sentences.select_related("sentence")
+        .prefetch_related(Prefetch("spans", queryset=Span.objects.order_by("id")))
+        .order_by("id")
+    )
+    by_key = {}
+    for row in rows:
+        text = row.sentence.text
+        attributes = {attr: [] for attr in get_attributes_for_label(row.category)}
+        pit_values = {}
+        for span in row.spans.all():
+            span_text = span.get_text(text)
+            attributes.setdefault(span.attribute, []).append(span_text)
+            if span.attribute == "Personal Information Type" and span.predicted_value is not None:
+                pit_values[span_text] = span.predicted_value
+
+        predicted_values = {
+            "Does/Does Not": row.does_or_not_value,
+            "Purpose": row.purpose_value,
+            "Personal Information Type": pit_values,
+        }
+        if row.third_party_entity is not None:
+            predicted_values["Third Party Entity"] = row.third_party_entity
+        by_key.setdefault(row.paragraph_key, []).append({
+            "sentence": text,
+            "category": row.category,
+            "attributes": attributes,
+            "predicted_values": predicted_values,
+        })
+
+    return [{"key": key, "sentences": by_key.get(key, [])} for key in version.paragraph_keys]
+
+
+def current_version(url):
+    return PolicyVersion.objects.filter(policy__url=url).select_related("policy").order_by("-id").first()
+
+
+def check_policy(url, document=None):
+    """
+    页面只下载一次：有上一次的 ETag / Last-Modified 时发条件请求。
+    已经下载好的页面（比如 analyze_corpus 在别的进程里下载的）可以直接通过 document 传进来。
+    返回 (old_records, document, last_updated, fresh_result)：
+    old_records 是当前版本的段落记录（没有存过为 []）；
+    304 或 last_updated 没变时 fresh_result 是用表里的当前版本拼出的结果，不需要重新分析。
+    """
+    version = current_version(url)
+    policy = version.policy if version else None
+    if document is None:
+        document = fetch_document(
+            url,
+            etag=policy.etag if policy else None,
+            last_modified=policy.http_last_modified if policy else None
+        )
+    old_records = load_records(version) if version else []
+    if version and document.not_modified:
+        return old_records, document, version.last_updated_date, build_pipeline_result(url, old_records)
+
+    last_updated = find_last_updated(document)
+    if version and version.last_updated_date == last_updated:
+        # 内容按日期判断没变，记下新的校验值，下次检查可以直接 304
+        policy.etag = document.etag
+        policy.http_last_modified = document.last_modified
+        policy.save(update_fields=["etag", "http_last_modified", "last_checked"])
+        return old_records, document, last_updated, build_pipeline_result(url, old_records)
+
+    return old_records, document, last_updated, None
+
+
+def store_policy_analysis(url, records, last_updated, etag=None, http_last_modified=None):
+    """
+    在一个事务里把段落分析记录存成 url 的新版本：上一版本里也有的段落，句子行直接移到新版本，
+    只插入新段落的句子和 span，然后删掉上一版本。返回结果。
+    """
+    with transaction.atomic():
+        # 事务里第一条就是写操作：SQLite 的事务先读后写时，另一个进程同时在写会直接报
+        # "database is locked"（不会等 timeout）；先写就会在这里排队拿写锁
+        Policy.objects.filter(url=url).update(last_checked=timezone.now())
+        policy, _ = Policy.objects.select_for_update().get_or_create(url=url)
+        policy.etag = etag
+        policy.http_last_modified = http_last_modified
+        policy.save()
+
+        old_version = policy.versions.order_by("-id").first()
+        version = PolicyVersion.objects.create(
+            policy=policy,
+            last_updated_date=last_updated,
+            paragraph_keys=[record["key"] for record in records]
         )
 
-    # 存入 AnalyzedSentence 表
-    AnalyzedSentence.objects.filter(url=url).delete()
-
-    for category_block in result.get("categories", {}).values():
-        for sentence_item in category_block.get("sentences", []):
-            sentence = sentence_item.get("sentence")
-            attributes = sentence_item.get("attributes", {})
-            predicted_values = sentence_item.get("predicted_values", {})
-
-            for attr, spans in attributes.items():
-                for span in spans:
-                    AnalyzedSentence.objects.create(
-                        url=url,
-                        category=sentence_item.get("category"),
-                        sentence=sentence,
-                        attribute=attr,
-                        span=span,
-                        predicted_value=predicted_values.get(attr),
-                        does_or_not_value=predicted_values.get("Does/Does Not") if attr == "Personal Information Type" else None,
-                        does_or_not_span=next(iter(attributes.get("Does/Does Not", [])), None) if attr == "Personal Information Type" else None,
-                        purpose_value=predicted_values.get("Purpose") if attr == "Personal Information Type" else None,
-                        purpose_span=next(iter(attributes.get("Purpose", [])), None) if attr == "Personal Information Type" else None,
-                        third_party_entity=predicted_values.get("Third Party Entity") if attr == "Personal Information Type" else None
-                    )
-
-    return result
+        kept = set()
+        old_sentence_ids = []
+        if old_version:
+            kept = set(old_version.paragraph_keys) & set(version.paragraph_keys)
+            old_version.sentences.filter(paragraph_key__in=kept).update(version=version)
+            old_sentence_ids = list(old_version.sentences.values_list("sentence_id", flat=True).distinct())
+            old_version.delete()
+
+        # 新段落，同一个 key 只存一份
+        new_records = {}
+        for record in records:
+            if record["key"] not in kept:
+                new_records.setdefault(record["key"], record)
+        _save_sentences(version, list(new_records.values()))
+
+        # 删掉的段落里的句子原文，别的版本 / 政策都不再引用的就一起删掉
+        for start in range(0, len(old_sentence_ids), BULK_CREATE_BATCH_SIZE):
+            chunk = old_sentence_ids[start:start + BULK_CREATE_BATCH_SIZE]
+            Sentence.objects.filter(id__in=chunk, occurrences__isnull=True).delete()
+
+    # 分析结果由段落记录重新拼出来，不需要推理
+    return build_pipeline_result(url, records)
+
+
+def analyze_and_store_document(url, document=None):
+    """
+    analyze_and_store_pipeline 的实现，另外返回改动统计：(result, changes)，
+    不需要重新分析时 changes 为 None。
+    同一个 URL 并发调用时只有一个真正检查和分析，其它的等它存好后直接用（见 single_flight）。
+    """
+    return analysis_flight(url, lambda: _analyze_and_store_document(url, document))
+
+
+def analysis_flight(url, compute):
+    """
+    同一个 URL 的检查和分析（同步请求、后台任务）共用一个 single_flight：compute() 返回 (result, changes)，
+    等过别的调用之后，它刚存好的版本直接拼出结果（changes 为 None）。
+    """
+    return single_flight(f"analyze_and_store:{url}", compute, reuse=lambda since: _stored_since(url, since))
+
+
+def _stored_since(url, since):
+    """别的 worker 在 since 之后刚存好的版本，直接拼出结果，不用再下载页面。"""
+    version = current_version(url)
+    if version is None or version.created_at < since:
+        return None
+    return build_pipeline_result(url, load_records(version)), None
+
+
+def _analyze_and_store_document(url, document=None):
+    old_records, document, last_updated, fresh_result = check_policy(url, document)
+    if fresh_result is not None:
+        return fresh_result, None
+
+    paragraphs = paragraphs_from_document(document)
+    records, changes = analyze_incrementally(paragraphs, old_records)
+    logger.info("Re-analyzed %s: %s", url, changes)
+
+    result = store_policy_analysis(url, records, last_updated, document.etag, document.last_modified)
+    return result, changes
+
+
+def analyze_and_store_pipeline(url):
+    """
+    304 或 last_updated 没变直接用表里的当前版本拼出结果；变了就和上一版本的段落列表对齐，
+    只对新增/改动的段落做推理，然后存成新版本（只插入新段落的句子）。
+    """
+    return analyze_and_store_document(url)[0]
@@ -0,0 +1,165 @@
+# privacy_classification_app/services/corpus_analysis.py
+"""
+离线批量分析（manage.py analyze_corpus）。
+
+- 父进程用线程池下载页面（有上一次的 ETag / Last-Modified 时发条件请求），
+  下载好的页面交给进程池分析；下载和推理同时进行，在途的页面数有上限，内存不会随语料增长
+- 每个子进程启动时加载一次模型（见 corpus_worker.init_worker），之后处理的所有页面共用
+- 子进程里走 analyze_and_store_document：304 / 日期没变直接跳过，变了只分析改动过的段落，
+  结果照常存成政策的新版本
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from ..attribute_predictor import ATTRIBUTE_BATCH_PREDICTORS, predict_attribute_values
+from ..document_fetcher import PolicyDocument, fetch_document
+from ..models import Policy
+from ..model_runner import load_paragraph_model
+from ..span_model_runner import load_span_model
+from .analysis_manager import analyze_and_store_document
+from .corpus_worker import init_worker
+
+
+def load_targets(path):
+    """
+    语料可以是 URL 列表文件（每行一个，# 开头的行忽略），也可以是放已保存 .html/.htm 页面的目录。
+    返回 [(url, page_path)]，URL 列表的 page_path 为 None（需要下载）；已保存页面的 url 是 file:// 路径。
+    页面内容到下载线程里才读，和下载一样受在途页面数的限制。
+    """
+    if not os.path.isdir(path):
+        with open(path, "r", encoding="utf-8") as f:
+            lines = (line.strip() for line in f)
+            return [(line, None) for line in lines if line and not line.startswith("#")]
+
+    targets = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith((".html", ".htm")):
+            page_path = os.path.abspath(os.path.join(path, name))
+            targets.append(("file://" + page_path, page_path))
+    return targets
+
+
+def warm_up():
+    load_paragraph_model()
+    load_span_model()
+    predict_attribute_values([(attr, "warm up") for attr in ATTRIBUTE_BATCH_PREDICTORS])
+
+
+def _validators(urls):
+    """上一次保存的 {url: (etag, http_last_modified)}。"""
+    validators = {}
+    for start in range(0, len(urls), 500):
+        rows = Policy.objects.filter(url__in=urls[start:start + 500]).values_list(
+            "url", "etag", "http_last_modified"
+        )
+        validators.update((url, (etag, last_modified)) for url, etag, last_modified in rows)
+    return validators
+
+
+def _fetch(url, page_path, validators):
+    """父进程的下载线程里跑，返回交给子进程的 (url, status_code, text, etag, last_modified)。"""
+    start = time.perf_counter()
+    if page_path is not None:
+        with open(page_path, "r", encoding="utf-8", errors="replace") as f:
+            return (url, 200, f.read(), None, None), time.perf_counter() - start
+
+    etag, last_modified = validators.get(url, (None, None))
+    document = fetch_document(url, etag=etag, last_modified=last_modified)
+    if not (document.ok or document.not_modified):
+        raise ValueError(f"HTTP {document.status_code}")
+    fields = (url, document.status_code, document.text, document.etag, document.last_modified)
+    return fields, time.perf_counter() - start
+
+
+def analyze_document(url, status_code, text, etag, last_modified):
+    """子进程里跑：分析并保存一个页面，返回统计。"""
+    start = time.perf_counter()
+    document = PolicyDocument(url, status_code, text=text, etag=etag, last_modified=last_modified)
+    _, changes = analyze_and_store_document(url, document)
+    return {
+        "url": url,
+        "status": "unchanged" if changes is None else "analyzed",
+        "changes": changes,
+        "sentences": changes["sentences"] if changes else 0,
+        "analysis_seconds": time.perf_counter() - start,
+    }
+
+
+def run_corpus(targets, workers, fetch_workers, torch_threads=None, on_result=None):
+    """
+    targets: load_targets() 的结果。on_result(item) 在每个页面处理完（或失败）时调用。
+    返回汇总报告。
+    """
+    validators = _validators([url for url, page_path in targets if page_path is None])
+    # 在途（下载中 + 等待/正在分析）的页面数上限
+    window = fetch_workers + 2 * workers
+    items = []
+
+    def finish(item):
+        items.append(item)
+        if on_result:
+            on_result(item)
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker, initargs=(torch_threads,)) as pool, \
+            ThreadPoolExecutor(fetch_workers, thread_name_prefix="corpus-fetch") as fetcher:
+        remaining = iter(targets)
+        fetching = {}
+        analyzing = {}
+
+        def refill():
+            while len(fetching) + len(analyzing) < window:
+                target = next(remaining, None)
+                if target is None:
+                    return
+                url, page_path = target
+                fetching[fetcher.submit(_fetch, url, page_path, validators)] = url
+
+        refill()
+        while fetching or analyzing:
+            done, _ = wait(list(fetching) + list(analyzing), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in fetching:
+                    url = fetching.pop(future)
+                    try:
+                        fields, fetch_seconds = future.result()
+                    except Exception as e:
+                        finish({"url": url, "status": "failed", "stage": "fetch", "error": str(e) or repr(e)})
+                        continue
+                    analyzing[pool.submit(analyze_document, *fields)] = (url, fetch_seconds)
+                else:
+                    url, fetch_seconds = analyzing.pop(future)
+                    try:
+                        item = future.result()
+                    except Exception as e:
+                        finish({"url": url, "status": "failed", "stage": "analysis", "error": str(e) or repr(e)})
+                        continue
+                    item["fetch_seconds"] = fetch_seconds
+                    finish(item)
+            refill()
+    elapsed = time.perf_counter() - start
+
+    succeeded = [item for item in items if item["status"] != "failed"]
+    sentences = sum(item["sentences"] for item in succeeded)
+    return {
+        "policies": len(items),
+        "analyzed": sum(item["status"] == "analyzed" for item in items),
+        "unchanged": sum(item["status"] == "unchanged" for item in items),
+        "failed": len(items) - len(succeeded),
+        "sentences": sentences,
+        "workers": workers,
+        "fetch_workers": fetch_workers,
+        "wall_seconds": round(elapsed, 2),
+        "policies_per_minute": round(len(succeeded) / elapsed * 60, 2) if elapsed else None,
+        "sentences_per_second": round(sentences / elapsed, 2) if elapsed else None,
+        "mean_fetch_seconds": round(
+            sum(item["fetch_seconds"] for item in succeeded) / len(succeeded), 3
+        ) if succeeded else None,
+        "mean_analysis_seconds": round(
+            sum(item["analysis_seconds"] for item in succeeded) / len(succeeded), 3
+        ) if succeeded else None,
+        "items": items,
+    }
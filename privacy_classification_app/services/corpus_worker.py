@@ -0,0 +1,21 @@
+"""
+corpus_worker.py
+analyze_corpus 子进程的初始化函数。
+
+子进程用 spawn 启动（不继承父进程的下载线程、CUDA 状态和数据库连接），
+子进程反序列化 initializer 时 Django 还没有 setup，所以这个模块顶层不能 import 用到模型的模块。
+"""
+import django
+
+
+def init_worker(torch_threads):
+    django.setup()
+
+    # django.setup() 之后才能导入
+    import torch
+    from .corpus_analysis import warm_up
+
+    if torch_threads:
+        # 多个进程各自占满所有核反而更慢
+        torch.set_num_threads(torch_threads)
+    warm_up()
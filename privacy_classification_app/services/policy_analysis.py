@@ -0,0 +1,273 @@
+"""
+policy_analysis.py
+所有按 URL 分析的接口共用的分析结果。以前 ExtractAttributesView、PersonalInfoSummaryView、
+CollectedPersonalInfoView、FilterSentencesByPITView、ExtractAttributesCachedView、
+extract_attributes_view 和 run_privacy_pipeline 各自跑一遍 下载/段落分类/span 抽取/属性预测，
+同一个 URL 调两个接口推理就要付两次。
+
+现在每个 (URL, 内容版本) 一个 PolicyAnalysis，存在 Django cache 里，各个接口在它上面做筛选和格式化。
+它是按需计算的：创建时只做段落分类和分句，接口声明自己要哪些属性，
+extract() 只跑缺的 (句子, 属性) QA，predict() 只跑缺的 (属性, span 文本) 分类。
+算出来的东西写回 cache，之后别的接口再要就是查表。例如 PersonalInfoSummaryView 只跑 PIT 的 QA，
+FilterSentencesByPITView 先只算 PIT 和 Does/Does Not，剩下的属性只给匹配的句子算。
+
+- records: [{"key", "text", "labels", "sentences": [{"sentence", "category", "attributes"}]}]，
+  attributes 里只有已经抽取过的属性
+- values: {(属性, span 文本): 预测值}
+
+只统计 "Does" 句子的接口（run_privacy_pipeline、CollectedPersonalInfoView）可以打开分阶段求值
+（STAGED_EVALUATION 或调用时传 staged）：先只抽取和预测 Does/Does Not，其它属性的 QA 只给 "Does"
+的句子跑，结果不变。每篇 policy 跳过了多少个 QA 和属性值分类见 staged_extract 返回的报告（也会写日志）。
+
+流式接口用 iter_policy_analysis 按段落分块算：第一块只有一个段落，之后每块翻倍（最多
+STREAM_MAX_PARAGRAPHS 个），第一个结果只等一个段落的推理。全部段落算完后整份结果才写进 cache，
+客户端中途断开时不会留下不完整的分析。
+
+内容版本是所有段落 paragraph_key 的 hash，页面改了就是新的 key，旧结果等 TTL 过期。
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ..attribute_predictor import predict_attribute_values
+from ..extraction_pipeline import fill_spans, get_attributes_for_label, plan_span_jobs, sentence_items
+from ..model_runner import predict_paragraph_categories
+from ..span_model_runner import load_span_model
+from ..views import extract_paragraphs_from_url, is_real_span
+from .privacy_pipeline import paragraph_key
+
+POLICY_ANALYSIS_CACHE_SECONDS = getattr(settings, "POLICY_ANALYSIS_CACHE_SECONDS", 3600)
+STAGED_EVALUATION = getattr(settings, "STAGED_EVALUATION", False)
+STREAM_MAX_PARAGRAPHS = getattr(settings, "STREAM_MAX_PARAGRAPHS", 8)
+
+FIRST_PARTY = "First Party Collection/Use"
+THIRD_PARTY = "Third Party Sharing/Collection"
+INCLUDE_CATEGORIES = {"first": FIRST_PARTY, "third": THIRD_PARTY}
+DOES = "Does/Does Not"
+
+logger = logging.getLogger(__name__)
+
+
+class PolicyAnalysis:
+    """一个 URL 某个内容版本的分析结果；只含普通的 dict / list，可以直接放进 cache。"""
+
+    # False 时 extract / predict 不写 cache（流式计算到一半的结果），由调用方最后 save
+    autosave = True
+
+    def __init__(self, url, version, records):
+        self.url = url
+        self.version = version
+        self.records = records
+        self.values = {}
+
+    def sentences(self, categories=None):
+        """按原顺序返回 (段落记录, 句子)；categories 不为 None 时只保留这些类别的句子。"""
+        return [
+            (record, sentence_item)
+            for record in self.records
+            for sentence_item in record["sentences"]
+            if categories is None or sentence_item["category"] in categories
+        ]
+
+    def sentence_items(self, categories=None):
+        return [sentence_item for _, sentence_item in self.sentences(categories)]
+
+    def extract(self, sentence_items, attributes=None):
+        """给这些句子补上 attributes 里的属性 span（None 表示类别下的全部属性），已经有的不再跑。"""
+        if not plan_span_jobs(sentence_items, attributes):
+            return
+        span_model, span_tokenizer = load_span_model()
+        fill_spans(sentence_items, span_model, span_tokenizer, attributes)
+        self._save()
+
+    def predict(self, queries):
+        """queries: [(属性, span 文本), ...]，没算过的一次批量预测，返回一一对应的值。"""
+        missing = [query for query in dict.fromkeys(queries) if query not in self.values]
+        if missing:
+            self.values.update(zip(missing, predict_attribute_values(missing)))
+            self._save()
+        return [self.values[query] for query in queries]
+
+    def attribute_values(self, sentence_items, attributes=None):
+        """
+        和 predict_sentence_values 一样：每个属性的真实 span 用 ", " 连接后的预测值。
+        只算 attributes 里的属性（None 表示全部），需要的 span 先按需抽取。
+        """
+        self.extract(sentence_items, attributes)
+        owners = []
+        queries = []
+        for i, sentence_item in enumerate(sentence_items):
+            real = real_attributes(sentence_item)
+            for attr in get_attributes_for_label(sentence_item["category"]):
+                joined = ", ".join(real.get(attr, []))
+                if joined and (attributes is None or attr in attributes):
+                    owners.append((i, attr))
+                    queries.append((attr, joined))
+
+        predicted_values = [{} for _ in sentence_items]
+        for (i, attr), value in zip(owners, self.predict(queries)):
+            predicted_values[i][attr] = value
+        return predicted_values
+
+    def does_sentences(self, sentence_items):
+        """Does/Does Not 的 span 用 ", " 连接后预测为 "Does" 的句子（需要时先抽取 Does/Does Not）。"""
+        self.extract(sentence_items, [DOES])
+        candidates = []
+        for sentence_item in sentence_items:
+            joined_does = ", ".join(sentence_item["attributes"].get(DOES, []))
+            if joined_does:
+                candidates.append((sentence_item, joined_does))
+        does_values = self.predict([(DOES, joined_does) for _, joined_does in candidates])
+        return [sentence_item for (sentence_item, _), value in zip(candidates, does_values) if value == "Does"]
+
+    def staged_extract(self, sentence_items, attributes, queries=None):
+        """
+        先抽取并预测 Does/Does Not，只给预测为 "Does" 的句子抽取 attributes 里的其它属性。
+        返回 ("Does" 的句子, 报告)；报告里的 span_questions 按 (属性, 句子) 去重计数
+        （和 span 模型实际要跑的一致），skipped 是不分阶段时本来要问、现在不用问的数量。
+        classifier_queries 是属性值分类器的查询，按 (属性, span 文本) 去重（和 predict 一致）；
+        queries 是调用方之后要预测的 [(属性, span 文本)]（句子列表 → 查询列表，默认同 attribute_values）。
+        跳过的句子大多还没抽取这些属性，不知道 span，按每个 (属性, 句子) 一次估算。
+        """
+        queries = queries or _value_queries
+        asked = _questions(plan_span_jobs(sentence_items, [DOES]))
+        passed = self.does_sentences(sentence_items)
+
+        rest = [attr for attr in attributes if attr != DOES]
+        passed_ids = {id(sentence_item) for sentence_item in passed}
+        failed = [sentence_item for sentence_item in sentence_items if id(sentence_item) not in passed_ids]
+        asked |= _questions(plan_span_jobs(passed, rest))
+        skipped = _questions(plan_span_jobs(failed, rest)) - asked
+        self.extract(passed, rest)
+
+        asked_queries = _classifier_queries(sentence_items, [DOES], queries)
+        asked_queries |= _classifier_queries(passed, rest, queries)
+        skipped_queries = _classifier_queries(failed, rest, queries) - asked_queries
+        report = {
+            "sentences": len(sentence_items),
+            "does_sentences": len(passed),
+            "span_questions": {"asked": len(asked), "skipped": len(skipped)},
+            "classifier_queries": {"asked": len(asked_queries), "skipped": len(skipped_queries)},
+        }
+        logger.info("Staged evaluation for %s: %s", self.url, report)
+        return passed, report
+
+    def _save(self):
+        if self.autosave:
+            self.save()
+
+    def save(self):
+        cache.set(_cache_key(self.url, self.version), self, timeout=POLICY_ANALYSIS_CACHE_SECONDS)
+
+
+def _questions(jobs):
+    return {(attr, sentence_item["sentence"]) for sentence_item, attr in jobs}
+
+
+def _value_queries(sentence_items):
+    """attribute_values 要预测的 (属性, span 文本)：每个属性的真实 span 用 ", " 连接。"""
+    return [
+        (attr, ", ".join(spans))
+        for sentence_item in sentence_items
+        for attr, spans in real_attributes(sentence_item).items()
+        if spans
+    ]
+
+
+def _classifier_queries(sentence_items, attributes, queries):
+    """这些句子在 attributes 上的分类查询；还没抽取的属性记成 (属性, 句子)。"""
+    result = set()
+    for sentence_item in sentence_items:
+        result.update(query for query in queries([sentence_item]) if query[0] in attributes)
+        result.update(
+            (attr, sentence_item["sentence"])
+            for attr in attributes
+            if attr in get_attributes_for_label(sentence_item["category"]) and attr not in sentence_item["attributes"]
+        )
+    return result
+
+
+def real_attributes(sentence_item):
+    """去掉句子里找不到的伪 span（views.is_real_span 的规则），已抽取的属性 key 全部保留（可能是空列表）。"""
+    sentence = sentence_item["sentence"]
+    return {
+        attr: [span for span in spans if is_real_span(span, sentence)]
+        for attr, spans in sentence_item["attributes"].items()
+    }
+
+
+def categories_for(include):
+    return {INCLUDE_CATEGORIES[item] for item in include}
+
+
+def content_version(paragraphs):
+    return hashlib.sha256("\n".join(paragraph_key(para) for para in paragraphs).encode("utf-8")).hexdigest()
+
+
+def _cache_key(url, version):
+    return f"policy_analysis:{hashlib.md5(url.encode()).hexdigest()}:{version}"
+
+
+def _new_records(paragraphs):
+    """段落分类 + 分句，span 和属性值都还没算。"""
+    paragraph_labels, _ = predict_paragraph_categories(paragraphs)
+    extracted = sentence_items(list(zip(paragraphs, paragraph_labels)))
+    return [
+        {"key": paragraph_key(para), "text": para, "labels": labels, "sentences": items}
+        for para, labels, items in zip(paragraphs, paragraph_labels, extracted)
+    ]
+
+
+def new_policy_analysis(url, paragraphs):
+    return PolicyAnalysis(url, content_version(paragraphs), _new_records(paragraphs))
+
+
+def get_policy_analysis(url, paragraphs=None):
+    """
+    下载（或直接用传入的段落）并返回 url 当前内容的 PolicyAnalysis。
+    同一内容版本在 POLICY_ANALYSIS_CACHE_SECONDS 内段落分类只做一次，每个 span 和属性值也只算一次。
+    """
+    if paragraphs is None:
+        paragraphs = extract_paragraphs_from_url(url)
+    analysis = cache.get(_cache_key(url, content_version(paragraphs)))
+    if analysis is None:
+        analysis = new_policy_analysis(url, paragraphs)
+        analysis._save()
+    return analysis
+
+
+def _stream_chunks(total):
+    start, size = 0, 1
+    while start < total:
+        yield start, min(start + size, total)
+        start += size
+        size = min(size * 2, STREAM_MAX_PARAGRAPHS)
+
+
+def iter_policy_analysis(url, paragraphs=None, attributes=()):
+    """
+    按段落顺序分块产出 (analysis, 这一块的段落记录)，块里的句子已经抽取了 attributes
+    （默认不抽取；None 表示全部属性）。cache 里已有这个内容版本时直接在它上面分块。
+    生成器完整跑完才写 cache。
+    """
+    if paragraphs is None:
+        paragraphs = extract_paragraphs_from_url(url)
+    version = content_version(paragraphs)
+    analysis = cache.get(_cache_key(url, version))
+    cached = analysis is not None
+    if not cached:
+        analysis = PolicyAnalysis(url, version, [])
+
+    analysis.autosave = False
+    for start, end in _stream_chunks(len(paragraphs)):
+        if cached:
+            records = analysis.records[start:end]
+        else:
+            records = _new_records(paragraphs[start:end])
+            analysis.records.extend(records)
+        analysis.extract([item for record in records for item in record["sentences"]], attributes)
+        yield analysis, records
+    analysis.autosave = True
+    analysis.save()
@@ -0,0 +1,181 @@
+# privacy_classification_app/services/precision_parity.py
+"""
+低精度（int8 / bf16）与 fp32 的对比报告。
+在同一份语料上分别用两种精度跑段落分类、span 抽取和属性分类，
+统计标签一致率、span 完全匹配率、延迟和模型内存。
+
+为了让每一步单独可比，低精度那一轮使用 fp32 的段落标签和 span 作为输入。
+硬件不支持时 model_registry 会回退到 fp32，报告里的内存是实际用到的模型的大小，
+fallback / effective_precision 标出实际用的精度。
+"""
+import os
+import time
+
+import numpy as np
+
+from .. import content_store
+from ..attribute_predictor import ATTRIBUTE_BATCH_PREDICTORS, predict_attribute_values
+from ..extraction_pipeline import extract_from_paragraphs, get_attributes_for_label
+from ..model_registry import memory_report, use_precision
+from ..model_runner import load_paragraph_model, predict_paragraph_categories
+from ..span_model_runner import load_span_model
+from ..utils import is_real_span
+
+
+def load_corpus(path):
+    """语料可以是一个 .txt 文件（每行一个段落），也可以是放 .txt 文件的目录。"""
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(path, name) for name in os.listdir(path) if name.endswith(".txt")
+        )
+    else:
+        files = [path]
+
+    paragraphs = []
+    for file_path in files:
+        with open(file_path, "r", encoding="utf-8") as f:
+            paragraphs.extend(line.strip() for line in f if line.strip())
+    return paragraphs
+
+
+def _attribute_queries(sentence_items):
+    queries = []
+    for item in sentence_items:
+        for attr in get_attributes_for_label(item["category"]):
+            spans = [s for s in item["attributes"].get(attr, []) if is_real_span(s, item["sentence"])]
+            if spans:
+                queries.append((attr, ", ".join(spans)))
+    return queries
+
+
+def _model_hits():
+    return {(m["repo"], m["subfolder"], m["precision"]): m["hits"] for m in memory_report()["models"]}
+
+
+def _used_models(hits_before):
+    """这一轮用过的模型（get_model 次数增加了的），精度回退时是 fp32 的那份。"""
+    return [
+        m for m in memory_report()["models"]
+        if m["hits"] > hits_before.get((m["repo"], m["subfolder"], m["precision"]), 0)
+    ]
+
+
+def _warm_up():
+    # 模型加载不计入延迟
+    load_paragraph_model()
+    load_span_model()
+    predict_attribute_values([(attr, "warm up") for attr in ATTRIBUTE_BATCH_PREDICTORS])
+
+
+def _run(paragraphs, precision, labeled_paragraphs=None, queries=None):
+    # 不读 content_store，否则测到的是查表而不是推理
+    hits_before = _model_hits()
+    with use_precision(precision), content_store.bypass():
+        _warm_up()
+        timings = {}
+
+        start = time.perf_counter()
+        labels, probs = predict_paragraph_categories(paragraphs)
+        timings["paragraph_classification"] = time.perf_counter() - start
+
+        if labeled_paragraphs is None:
+            labeled_paragraphs = [
+                (para, para_labels) for para, para_labels in zip(paragraphs, labels)
+                if any(l in ["First Party Collection/Use", "Third Party Sharing/Collection"] for l in para_labels)
+            ]
+
+        span_model, span_tokenizer = load_span_model()
+        start = time.perf_counter()
+        sentence_items = [
+            item
+            for extracted in extract_from_paragraphs(labeled_paragraphs, span_model, span_tokenizer)
+            for item in extracted
+        ]
+        timings["span_extraction"] = time.perf_counter() - start
+
+        if queries is None:
+            queries = _attribute_queries(sentence_items)
+        start = time.perf_counter()
+        values = predict_attribute_values(queries)
+        timings["attribute_classification"] = time.perf_counter() - start
+
+        used = _used_models(hits_before)
+
+    return {
+        "labels": labels,
+        "probs": probs,
+        "labeled_paragraphs": labeled_paragraphs,
+        "sentence_items": sentence_items,
+        "queries": queries,
+        "values": values,
+        "timings": timings,
+        "memory_bytes": sum(m["bytes"] for m in used),
+        "precisions": sorted({m["precision"] for m in used}),
+    }
+
+
+def _rate(matches, total):
+    return round(matches / total, 4) if total else None
+
+
+def run_precision_parity(paragraphs, precision):
+    """返回 fp32 与 precision 的对比报告（dict，可直接 json.dump）。"""
+    baseline = _run(paragraphs, "fp32")
+    candidate = _run(
+        paragraphs, precision,
+        labeled_paragraphs=baseline["labeled_paragraphs"],
+        queries=baseline["queries"]
+    )
+
+    label_matches = sum(
+        set(a) == set(b) for a, b in zip(baseline["labels"], candidate["labels"])
+    )
+    span_pairs = [
+        (base_item["attributes"][attr], cand_item["attributes"][attr])
+        for base_item, cand_item in zip(baseline["sentence_items"], candidate["sentence_items"])
+        for attr in base_item["attributes"]
+    ]
+    span_matches = sum(base == cand for base, cand in span_pairs)
+
+    attribute_agreement = {}
+    for attr in ATTRIBUTE_BATCH_PREDICTORS:
+        pairs = [
+            (base, cand)
+            for (query_attr, _), base, cand in zip(baseline["queries"], baseline["values"], candidate["values"])
+            if query_attr == attr
+        ]
+        attribute_agreement[attr] = {
+            "total": len(pairs),
+            "agreement": _rate(sum(base == cand for base, cand in pairs), len(pairs)),
+        }
+
+    max_prob_diff = (
+        float(np.abs(baseline["probs"] - candidate["probs"]).max()) if len(paragraphs) else 0.0
+    )
+
+    return {
+        "precision": precision,
+        "effective_precision": candidate["precisions"],
+        "fallback": any(p != precision for p in candidate["precisions"]),
+        "paragraphs": len(paragraphs),
+        "paragraph_labels": {
+            "agreement": _rate(label_matches, len(paragraphs)),
+            "max_probability_diff": round(max_prob_diff, 6),
+        },
+        "spans": {
+            "total": len(span_pairs),
+            "exact_match": _rate(span_matches, len(span_pairs)),
+        },
+        "attributes": attribute_agreement,
+        "latency_seconds": {
+            stage: {
+                "fp32": round(baseline["timings"][stage], 4),
+                precision: round(candidate["timings"][stage], 4),
+            }
+            for stage in baseline["timings"]
+        },
+        "memory_mb": {
+            "fp32": round(baseline["memory_bytes"] / (1024 * 1024), 1),
+            precision: round(candidate["memory_bytes"] / (1024 * 1024), 1),
+        },
+    }
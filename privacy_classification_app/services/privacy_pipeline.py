@@ -1,46 +1,143 @@
-from ..views_api import extract_paragraphs_from_url, predict_paragraph_category
-from ..views_api import extract_from_paragraph, span_model, span_tokenizer
-from ..attribute_predictor import predict_purpose_value, predict_does_not_label, predict_pit_value
+import hashlib
+
+from ..model_runner import predict_paragraph_categories
+from ..extraction_pipeline import extract_from_paragraphs
+from ..span_model_runner import load_span_model
+from ..attribute_predictor import predict_attribute_values
+from ..content_store import normalize_text
 from ..utils import is_real_span
 
-def run_privacy_pipeline(url):
+TARGET_LABELS = ["First Party Collection/Use", "Third Party Sharing/Collection"]
+# build_pipeline_result 用到的属性（Third Party Entity 只在存储的段落记录里用）
+PIPELINE_ATTRIBUTES = ["Does/Does Not", "Purpose", "Personal Information Type"]
+
+
+def paragraph_key(text):
+    # 只合并空白后再 hash：排版变化不算段落改动
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def analyze_paragraphs(paragraphs):
     """
-    执行完整的隐私策略分析，返回带详细信息的 JSON。
+    对一组段落做完整推理（段落分类 + span 抽取 + 属性预测），整组一起批量。
+    返回与 paragraphs 一一对应的分析记录（可直接 JSON 存储）：
+    {
+        "key": paragraph_key,
+        "text": 段落原文,
+        "labels": [...],
+        "sentences": [{"sentence", "category", "attributes", "predicted_values"}, ...]
+    }
+    predicted_values: Does/Does Not（所有 span 连接后预测）、Purpose（第一个 span）、
+    Third Party Entity（所有 span 连接后预测）、Personal Information Type（{span: value}，只含真实 span）
+    """
+    records = [
+        {"key": paragraph_key(para), "text": para, "labels": labels, "sentences": []}
+        for para, labels in zip(paragraphs, predict_paragraph_categories(paragraphs)[0])
+    ]
+    targets = [
+        record for record in records
+        if any(lbl in TARGET_LABELS for lbl in record["labels"])
+    ]
+    if not targets:
+        return records
+
+    # 整组段落的句子一起批量跑 span 模型
+    span_model, span_tokenizer = load_span_model()
+    extracted = extract_from_paragraphs(
+        [(record["text"], record["labels"]) for record in targets], span_model, span_tokenizer
+    )
+    for record, sentence_items in zip(targets, extracted):
+        record["sentences"] = sentence_items
+
+    sentence_items = [item for record in targets for item in record["sentences"]]
+    # 先收集所有需要预测的 span，再一次批量预测
+    queries = list(dict.fromkeys(pipeline_queries(sentence_items)))
+    predicted = dict(zip(queries, predict_attribute_values(queries)))
+    for sentence_item in sentence_items:
+        sentence_item["predicted_values"] = pipeline_values(sentence_item, predicted)
+
+    return records
+
+
+def pipeline_queries(sentence_items):
+    """pipeline 要预测的 (属性, span 文本)；句子里没抽取的属性不查询。"""
+    queries = []
+    for sentence_item in sentence_items:
+        attributes = sentence_item.get("attributes", {})
+        sentence = sentence_item.get("sentence", "")
+
+        does_spans = attributes.get("Does/Does Not", [])
+        if does_spans:
+            queries.append(("Does/Does Not", ", ".join(does_spans)))
+
+        purpose_spans = attributes.get("Purpose", [])
+        if purpose_spans:
+            queries.append(("Purpose", purpose_spans[0]))
+
+        tpe_spans = attributes.get("Third Party Entity", [])
+        if tpe_spans:
+            queries.append(("Third Party Entity", ", ".join(tpe_spans)))
+
+        for pit_span in attributes.get("Personal Information Type", []):
+            if is_real_span(pit_span, sentence):
+                queries.append(("Personal Information Type", pit_span))
+    return queries
+
+
+def pipeline_values(sentence_item, predicted):
+    """predicted: {(属性, span 文本): 值}，至少包含 pipeline_queries 对这个句子的查询。"""
+    attributes = sentence_item.get("attributes", {})
+    sentence = sentence_item.get("sentence", "")
+
+    does_spans = attributes.get("Does/Does Not", [])
+    purpose_spans = attributes.get("Purpose", [])
+    tpe_spans = attributes.get("Third Party Entity", [])
+    predicted_values = {
+        "Does/Does Not": predicted[("Does/Does Not", ", ".join(does_spans))] if does_spans else "Unknown",
+        "Purpose": predicted[("Purpose", purpose_spans[0])] if purpose_spans else "Unknown",
+        "Personal Information Type": {
+            pit_span: predicted[("Personal Information Type", pit_span)]
+            for pit_span in attributes.get("Personal Information Type", [])
+            if is_real_span(pit_span, sentence)
+        },
+    }
+    if tpe_spans:
+        predicted_values["Third Party Entity"] = predicted[("Third Party Entity", ", ".join(tpe_spans))]
+    return predicted_values
+
+
+def build_pipeline_result(url, records):
+    """
+    从段落分析记录拼出 run_privacy_pipeline 的输出，不做任何推理。
+    增量更新时只有改动过的段落重新分析，结果用这个函数重新拼。
     """
-    paragraphs = extract_paragraphs_from_url(url)
     first_party_map = {}
     third_party_map = {}
 
-    for para in paragraphs:
-        labels = predict_paragraph_category(para)
-        if not any(lbl in ["First Party Collection/Use", "Third Party Sharing/Collection"] for lbl in labels):
-            continue
-
-        extracted = extract_from_paragraph(para, labels, span_model, span_tokenizer)
-        for sentence_item in extracted:
+    for record in records:
+        for sentence_item in record["sentences"]:
             category = sentence_item.get("category")
             attributes = sentence_item.get("attributes", {})
             sentence = sentence_item.get("sentence", "")
+            predicted_values = sentence_item["predicted_values"]
 
             does_spans = attributes.get("Does/Does Not", [])
             does_text_span = does_spans[0] if does_spans else None
-            does_value = predict_does_not_label(", ".join(does_spans)) if does_spans else "Unknown"
+            does_value = predicted_values["Does/Does Not"]
 
             purpose_spans = attributes.get("Purpose", [])
             purpose_text_span = purpose_spans[0] if purpose_spans else None
-            purpose_value = predict_purpose_value(purpose_text_span) if purpose_text_span else "Unknown"
+            purpose_value = predicted_values["Purpose"]
 
-            for pit_span in attributes.get("Personal Information Type", []):
-                if is_real_span(pit_span, sentence):
-                    predicted_value = predict_pit_value(pit_span)
-                    detail_tuple = (
-                        pit_span, sentence, does_value, does_text_span, purpose_value, purpose_text_span
-                    )
+            for pit_span, predicted_value in predicted_values["Personal Information Type"].items():
+                detail_tuple = (
+                    pit_span, sentence, does_value, does_text_span, purpose_value, purpose_text_span
+                )
 
-                    if category == "First Party Collection/Use" and does_value == "Does":
-                        first_party_map.setdefault(predicted_value, set()).add(detail_tuple)
-                    elif category == "Third Party Sharing/Collection"and does_value == "Does":
-                        third_party_map.setdefault(predicted_value, set()).add(detail_tuple)
+                if category == "First Party Collection/Use" and does_value == "Does":
+                    first_party_map.setdefault(predicted_value, set()).add(detail_tuple)
+                elif category == "Third Party Sharing/Collection"and does_value == "Does":
+                    third_party_map.setdefault(predicted_value, set()).add(detail_tuple)
 
     def format_details(data_map):
         return [
@@ -64,3 +161,34 @@ def run_privacy_pipeline(url):
         "first_party_collected": format_details(first_party_map),
         "third_party_shared": format_details(third_party_map)
     }
+
+
+def run_privacy_pipeline(url, staged=None):
+    """
+    执行完整的隐私策略分析，返回带详细信息的 JSON。
+    和其它接口共用同一份 PolicyAnalysis（见 policy_analysis），只抽取 PIPELINE_ATTRIBUTES。
+    staged（默认 STAGED_EVALUATION）: 先判断 Does/Does Not，只有 "Does" 的句子才抽取 PIT 和 Purpose，
+    结果里多一项 "evaluation"（跳过了多少个 QA 和属性值分类）。
+    """
+    # policy_analysis 依赖本模块，在这里导入避免循环
+    from .policy_analysis import STAGED_EVALUATION, get_policy_analysis
+
+    analysis = get_policy_analysis(url)
+    sentence_items = analysis.sentence_items()
+    report = None
+    if STAGED_EVALUATION if staged is None else staged:
+        # 只有 "Does" 的句子会出现在结果里
+        sentence_items, report = analysis.staged_extract(sentence_items, PIPELINE_ATTRIBUTES, pipeline_queries)
+    else:
+        analysis.extract(sentence_items, PIPELINE_ATTRIBUTES)
+    queries = list(dict.fromkeys(pipeline_queries(sentence_items)))
+    predicted = dict(zip(queries, analysis.predict(queries)))
+    result = build_pipeline_result(url, [{
+        "sentences": [
+            dict(sentence_item, predicted_values=pipeline_values(sentence_item, predicted))
+            for sentence_item in sentence_items
+        ]
+    }])
+    if report is not None:
+        result["evaluation"] = report
+    return result
@@ -0,0 +1,92 @@
+# privacy_classification_app/services/questions.py
+"""
+用户问题的声明式定义，在数据库里用聚合查询回答，不把所有行读进 Python。
+UserQuestionFromDBView（API）和 result_view（HTML）共用。
+
+QUESTIONS 里每个问题是一个定义：
+- question: 问题原文
+- filter: Span 的过滤条件（只查 url 的当前版本，另外加）；句子上的字段通过 policy_sentence__ 访问
+- required: 这些字段不能为空（NULL 或空字符串）
+- 分组型问题：group_by 分组字段 + having {名字: Q(...)}，每个条件在组里至少命中一行；
+  结果是满足条件的分组值列表，按首次出现的顺序
+- 行型问题：fields {输出字段名: 模型字段}，结果是每行一个 dict，按写入顺序
+- result_key: 结果放在响应的哪个字段
+- yes_no: 为 True 时另外返回 "answer": "Yes" / "No"（结果是否非空）
+
+新增 question_type 只需要在 QUESTIONS 里加一个定义。
+"""
+from django.db.models import Count, Min, Q
+
+from ..models import Span
+
+PIT = "Personal Information Type"
+URL_FIELD = "policy_sentence__version__policy__url"
+
+QUESTIONS = {
+    # 第一方收集里，同一种个人信息既有 "Does" 又有 "Does Not" 的说法
+    "conflict_statement": {
+        "question": "Does this privacy policy contain any conflict statement?",
+        "filter": {"policy_sentence__category": "First Party Collection/Use", "attribute": PIT},
+        "required": ["predicted_value"],
+        "group_by": "predicted_value",
+        "having": {
+            "does": Q(policy_sentence__does_or_not_value="Does"),
+            "does_not": Q(policy_sentence__does_or_not_value="Does Not"),
+        },
+        "result_key": "conflicting_attributes",
+        "yes_no": True,
+    },
+    "third_party_sharing": {
+        "question": "What personal information is shared with third parties?",
+        "filter": {
+            "policy_sentence__category": "Third Party Sharing/Collection",
+            "attribute": PIT,
+            "policy_sentence__does_or_not_value": "Does",
+        },
+        "required": ["predicted_value", "policy_sentence__third_party_entity"],
+        "fields": {
+            "personal_info": "predicted_value",
+            "third_party": "policy_sentence__third_party_entity",
+            "sentence": "policy_sentence__sentence__text",
+        },
+        "result_key": "shared_info",
+    },
+}
+
+
+def compile_question(url, definition):
+    """把问题定义编译成查询集：分组型返回分组值（values_list flat），行型返回字段值的元组。"""
+    queryset = Span.objects.filter(**{URL_FIELD: url}, **definition["filter"])
+    for field in definition.get("required", []):
+        queryset = queryset.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+
+    if "group_by" in definition:
+        field = definition["group_by"]
+        having = {f"n_{name}": Count("id", filter=condition) for name, condition in definition["having"].items()}
+        # GROUP BY field HAVING 每个条件的计数 > 0
+        return (
+            queryset.values(field)
+            .annotate(first_id=Min("id"), **having)
+            .filter(**{f"{name}__gt": 0 for name in having})
+            .order_by("first_id")
+            .values_list(field, flat=True)
+        )
+
+    return queryset.order_by("id").values_list(*definition["fields"].values())
+
+
+def answer_question(url, question_type):
+    """返回问题的响应 dict；question_type 不在 QUESTIONS 里时抛 KeyError。"""
+    definition = QUESTIONS[question_type]
+    rows = compile_question(url, definition)
+    if "group_by" in definition:
+        results = list(rows)
+    else:
+        names = list(definition["fields"])
+        results = [dict(zip(names, row)) for row in rows]
+
+    response = {"question": definition["question"]}
+    if definition.get("yes_no"):
+        response["answer"] = "Yes" if results else "No"
+    response[definition["result_key"]] = results
+    return response
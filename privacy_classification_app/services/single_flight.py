@@ -0,0 +1,132 @@
+"""
+single_flight.py
+同一个 key（比如同一个 URL 的分析）并发请求时只算一次。热门网站的隐私政策经常同时被很多用户请求，
+以前每个请求都发现没有新结果，各自跑一遍 pipeline，再抢着写同一个 Policy。
+
+- 同一进程：第一个请求计算，其它线程等它的 Future，直接复用结果（出错也一起收到同一个异常）
+- 不同 worker 进程：数据库里的 AnalysisLock 行当互斥锁。拿不到锁就每隔 SINGLE_FLIGHT_POLL_SECONDS
+  再试一次；等过锁之后先调 reuse(since)，别的进程在 since 之后刚存好的结果能用就不再计算。
+  锁的租期是 SINGLE_FLIGHT_LOCK_SECONDS，计算期间后台线程每过三分之一个租期续一次；
+  持有锁的进程挂掉后不再续租，锁过期，可以被别的进程抢走。所以只要持有者还活着，等待的一方就一直等
+- SINGLE_FLIGHT_WAIT_SECONDS 大于 0 时是等待的上限，超过就不再等，自己计算；默认 0 不设上限
+"""
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from ..models import AnalysisLock
+
+SINGLE_FLIGHT_WAIT_SECONDS = getattr(settings, "SINGLE_FLIGHT_WAIT_SECONDS", 0)
+SINGLE_FLIGHT_LOCK_SECONDS = getattr(settings, "SINGLE_FLIGHT_LOCK_SECONDS", 60)
+SINGLE_FLIGHT_POLL_SECONDS = getattr(settings, "SINGLE_FLIGHT_POLL_SECONDS", 0.5)
+
+logger = logging.getLogger(__name__)
+
+_inflight = {}
+_lock = threading.Lock()
+
+
+def lock_key(name):
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+
+def _acquire(key, owner):
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=SINGLE_FLIGHT_LOCK_SECONDS)
+    # 过期的锁直接接手（条件 UPDATE，只有一个进程能成功）
+    if AnalysisLock.objects.filter(key=key, expires_at__lt=now).update(owner=owner, expires_at=expires_at):
+        return True
+    try:
+        with transaction.atomic():
+            AnalysisLock.objects.create(key=key, owner=owner, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        return False
+
+
+def _release(key, owner):
+    AnalysisLock.objects.filter(key=key, owner=owner).delete()
+
+
+def _renew(key, owner, stop):
+    """持有锁期间在后台线程里续租，直到 stop 被设置。"""
+    try:
+        while not stop.wait(SINGLE_FLIGHT_LOCK_SECONDS / 3):
+            try:
+                AnalysisLock.objects.filter(key=key, owner=owner).update(
+                    expires_at=timezone.now() + timedelta(seconds=SINGLE_FLIGHT_LOCK_SECONDS)
+                )
+            except Exception:
+                logger.exception("Failed to renew lock %s", key[:12])
+    finally:
+        # 不是 request 线程，自己关掉数据库连接
+        connection.close()
+
+
+def _compute_with_lock(key, compute, reuse):
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    since = timezone.now()
+    deadline = time.monotonic() + SINGLE_FLIGHT_WAIT_SECONDS if SINGLE_FLIGHT_WAIT_SECONDS > 0 else None
+    waited = False
+    while not _acquire(key, owner):
+        if deadline is not None and time.monotonic() >= deadline:
+            logger.warning("Timed out waiting for lock %s, computing without it", key[:12])
+            return compute()
+        waited = True
+        time.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+
+    stop = threading.Event()
+    renewer = threading.Thread(target=_renew, args=(key, owner, stop), daemon=True)
+    renewer.start()
+    try:
+        if waited and reuse is not None:
+            result = reuse(since)
+            if result is not None:
+                return result
+        return compute()
+    finally:
+        stop.set()
+        renewer.join()
+        _release(key, owner)
+
+
+def single_flight(name, compute, reuse=None):
+    """
+    name 相同的并发调用只执行一次 compute()，其它调用复用它的结果。
+    reuse(since): 等过别的进程的锁之后调用，返回那个进程在 since 之后算好的结果，没有返回 None。
+    """
+    key = lock_key(name)
+    with _lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+
+    if not leader:
+        try:
+            return future.result(timeout=SINGLE_FLIGHT_WAIT_SECONDS if SINGLE_FLIGHT_WAIT_SECONDS > 0 else None)
+        except FutureTimeout:
+            logger.warning("Timed out waiting for in-flight %s, computing again", key[:12])
+            return compute()
+
+    try:
+        result = _compute_with_lock(key, compute, reuse)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
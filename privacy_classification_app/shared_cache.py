@@ -0,0 +1,224 @@
+"""
+shared_cache.py
+同一台机器上所有 worker 共用的 Django cache 后端（CACHES 里配置，LOCATION 是 SQLite 文件路径）。
+默认的 LocMemCache 每个 gunicorn worker 一份，各自冷启动，重启就没了；
+views_api_cached 和 policy_analysis 的结果放在这里，一个 worker 算过，其它 worker 直接命中。
+
+- 值 pickle 后用 zlib 压缩存成 BLOB
+- 所有值压缩后的总大小超过 OPTIONS["MAX_BYTES"] 时，先删过期的，再按最近访问时间（LRU）
+  淘汰到上限的 90%；单个值超过上限就不存。总大小由触发器维护在 cache_stats 的 "bytes" 行里，不用每次写都扫表
+- 命中 / 未命中 / 淘汰次数存在同一个文件里，是整台机器的计数，stats() 返回（见 manage.py shared_cache_stats）。
+  每个进程先在内存里累计，随下一次写事务、或者距上次写入超过 OPTIONS["STATS_FLUSH_SECONDS"] 时写进去
+  （进程退出时没写进去的几秒计数会丢）
+- 命中只读不写：最近访问时间比 OPTIONS["ACCESS_RESOLUTION_SECONDS"] 还旧时才更新，LRU 只精确到这个粒度
+- WAL 模式，读写可以并发；每个进程一个连接（gunicorn fork 之后不能共用父进程的连接）
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+STAT_NAMES = ["hits", "misses", "evictions", "expired"]
+
+
+class SharedCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.path = location
+        self.max_bytes = options.get("MAX_BYTES", 512 * 1024 * 1024)
+        self.compress_level = options.get("COMPRESS_LEVEL", 6)
+        self.access_resolution = options.get("ACCESS_RESOLUTION_SECONDS", 5)
+        self.stats_flush_seconds = options.get("STATS_FLUSH_SECONDS", 10)
+        # pending: 本进程还没写进文件的计数
+        self._db = {"pid": None, "conn": None, "pending": None, "flushed_at": None}
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        """调用方持有 self._lock。"""
+        if self._db["pid"] != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+                " expires REAL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            for name, event, change in [
+                ("insert", "INSERT", "NEW.size"), ("delete", "DELETE", "-OLD.size"),
+                ("resize", "UPDATE OF size", "NEW.size - OLD.size"),
+            ]:
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS cache_entries_{name} AFTER {event} ON cache_entries BEGIN"
+                    f" UPDATE cache_stats SET value = value + {change} WHERE name = 'bytes'; END"
+                )
+            conn.executemany("INSERT OR IGNORE INTO cache_stats (name, value) VALUES (?, 0)", [(n,) for n in STAT_NAMES])
+            # 触发器建好之后再初始化，中间别的进程写进来的值也算得到
+            conn.execute(
+                "INSERT OR IGNORE INTO cache_stats (name, value) SELECT 'bytes', COALESCE(SUM(size), 0) FROM cache_entries"
+            )
+            conn.commit()
+            self._db.update(
+                pid=os.getpid(), conn=conn, pending=dict.fromkeys(STAT_NAMES, 0), flushed_at=time.monotonic()
+            )
+        return self._db["conn"]
+
+    def _encode(self, value):
+        return zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.compress_level)
+
+    def _count(self, name, amount=1):
+        """调用方持有 self._lock。"""
+        self._db["pending"][name] += amount
+
+    def _flush(self, conn):
+        """在写事务里把本进程累计的计数写进文件。"""
+        pending = self._db["pending"]
+        conn.executemany(
+            "UPDATE cache_stats SET value = value + ? WHERE name = ?",
+            [(amount, name) for name, amount in pending.items() if amount]
+        )
+        pending.update(dict.fromkeys(pending, 0))
+        self._db["flushed_at"] = time.monotonic()
+
+    @staticmethod
+    def _total_bytes(conn):
+        return conn.execute("SELECT value FROM cache_stats WHERE name = 'bytes'").fetchone()[0]
+
+    def _delete_expired(self, conn, now, key=None):
+        where = "expires IS NOT NULL AND expires <= ?"
+        params = [now]
+        if key is not None:
+            where += " AND key = ?"
+            params.append(key)
+        removed = conn.execute(f"DELETE FROM cache_entries WHERE {where}", params).rowcount
+        self._count("expired", removed)
+        return removed
+
+    def _write(self, key, value, timeout, version, replace):
+        key = self.make_and_validate_key(key, version=version)
+        blob = self._encode(value)
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._delete_expired(conn, now, key)
+                if len(blob) > self.max_bytes:
+                    conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+                    written = False
+                else:
+                    # 不用 INSERT OR REPLACE：REPLACE 删旧行时不触发 DELETE 触发器，总大小会算错
+                    conflict = (
+                        "DO UPDATE SET value = excluded.value, size = excluded.size,"
+                        " expires = excluded.expires, accessed = excluded.accessed"
+                    ) if replace else "DO NOTHING"
+                    written = conn.execute(
+                        "INSERT INTO cache_entries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)"
+                        f" ON CONFLICT (key) {conflict}",
+                        (key, blob, len(blob), expires, now)
+                    ).rowcount == 1
+                    if written:
+                        self._cull(conn, now)
+                self._flush(conn)
+            return written
+
+    def _cull(self, conn, now):
+        if self._total_bytes(conn) <= self.max_bytes:
+            return
+        self._delete_expired(conn, now)
+        total = self._total_bytes(conn)
+        target = self.max_bytes * 0.9
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM cache_entries ORDER BY accessed"):
+            if total <= target:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM cache_entries WHERE key = ?", evicted)
+        self._count("evictions", len(evicted))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._write(key, value, timeout, version, replace=False)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write(key, value, timeout, version, replace=True)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, expires, accessed FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                # 过期的顺手删掉（只有这时才需要写锁）
+                with conn:
+                    self._delete_expired(conn, now, key)
+                    self._count("misses")
+                    self._flush(conn)
+                return default
+
+            self._count("hits" if row is not None else "misses")
+            touch = row is not None and now - row[2] >= self.access_resolution
+            if touch or time.monotonic() - self._db["flushed_at"] >= self.stats_flush_seconds:
+                with conn:
+                    if touch:
+                        conn.execute("UPDATE cache_entries SET accessed = ? WHERE key = ?", (now, key))
+                    self._flush(conn)
+        if row is None:
+            return default
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                return conn.execute(
+                    "UPDATE cache_entries SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                    (self.get_backend_timeout(timeout), key, now)
+                ).rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            conn = self._connection()
+            return conn.execute(
+                "SELECT 1 FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+            ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._flush(conn)
+                return conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,)).rowcount == 1
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._flush(conn)
+                conn.execute("DELETE FROM cache_entries")
+
+    def stats(self):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._flush(conn)
+            entries = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+            counters = dict(conn.execute("SELECT name, value FROM cache_stats"))
+        return {
+            "path": self.path, "entries": entries, "bytes": counters.pop("bytes"), "max_bytes": self.max_bytes,
+            **counters
+        }
@@ -13,6 +13,8 @@ def load_span_model(model_path):
     return model, tokenizer
 '''
 from django.conf import settings
+from .inference_backend import model_revision
+from .model_registry import get_model
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
 BASE_REPO = "mianyangacd/privacy-policy-spanbert"
@@ -20,61 +22,105 @@ SUBFOLDER = "spanbert-finetuned"
 HF_TOKEN = settings.HF_TOKEN
 
 def load_span_model():
-    tokenizer = AutoTokenizer.from_pretrained(
-        BASE_REPO,
-        subfolder=SUBFOLDER,
-        token=HF_TOKEN
-    )
-    model = AutoModelForQuestionAnswering.from_pretrained(
-        BASE_REPO,
-        subfolder=SUBFOLDER,
-        token=HF_TOKEN
-    )
-    model.to(device)
-    model.eval()
-    return model, tokenizer
+    # 通过 model_registry 懒加载，所有 view 共用同一份 QA 模型
+    return get_model(SUBFOLDER, model_class=AutoModelForQuestionAnswering, device=device)
 
 
-def run_span_model(sentence, category_label, attribute_list, model, tokenizer):
-    """
-    对一个句子和它的 label 分类下要提取的属性，挨个提问，抽取 span。
-    """
-    results = {}
+SPAN_BATCH_SIZE = getattr(settings, "SPAN_BATCH_SIZE", 32)
+MAX_LENGTH = 512
 
-    for attr in attribute_list:
-        question = f"What part of the text refers to {attr}?"
 
-        # Tokenize with offset mapping for answer span
-        encoded = tokenizer(
-            question, sentence,
-            return_tensors="pt",
-            truncation=True,
-            max_length=512,
-            return_offsets_mapping=True
-        )
+def build_question(attr):
+    return f"What part of the text refers to {attr}?"
 
-        offset_mapping = encoded.pop("offset_mapping")[0].tolist()
 
-        with torch.no_grad():
-            outputs = model(**encoded)
+# (模型 revision, 属性) -> 问题的 token id
+_question_cache = {}
+
+
+def _question_ids(tokenizer, revision, attr):
+    # 问题只有四种，每个 revision 每种只 tokenize 一次；
+    # key 不用 tokenizer 对象本身，否则 model_registry 卸载模型后 tokenizer 还一直被引用着
+    key = (revision, attr)
+    if key not in _question_cache:
+        _question_cache[key] = tokenizer(build_question(attr), add_special_tokens=False)["input_ids"]
+    return _question_cache[key]
 
-        start_idx = torch.argmax(outputs.start_logits).item()
-        end_idx = torch.argmax(outputs.end_logits).item() + 1
 
-        # Convert tokens to string span
-        span_tokens = encoded["input_ids"][0][start_idx:end_idx]
-        span_text = tokenizer.convert_tokens_to_string(tokenizer.convert_ids_to_tokens(span_tokens))
+def _encode_pair(question_ids, sentence_ids, tokenizer):
+    """
+    拼成 [CLS] question [SEP] sentence [SEP]，
+    与 tokenizer(question, sentence, truncation=True, max_length=512) 的结果一致：
+    问题很短，所以 longest_first 截断只会截 sentence。
+    """
+    budget = MAX_LENGTH - tokenizer.num_special_tokens_to_add(pair=True) - len(question_ids)
+    sentence_ids = sentence_ids[:max(budget, 0)]
+    input_ids = tokenizer.build_inputs_with_special_tokens(question_ids, sentence_ids)
+    token_type_ids = tokenizer.create_token_type_ids_from_sequences(question_ids, sentence_ids)
+    return input_ids, token_type_ids
 
-        if span_text.strip() and span_text.lower().strip() != question.lower().strip():
-            results[attr] = [span_text]
-        else:
-            results[attr] = []
 
-        # Optionally: get exact character start/end from offset mapping
-        char_start = offset_mapping[start_idx][0]
-        char_end = offset_mapping[end_idx - 1][1]
+def run_span_model_batch(pairs, model, tokenizer, batch_size=SPAN_BATCH_SIZE):
+    """
+    批量版 run_span_model。
+    pairs: [(sentence, attr), ...]，可以来自一个段落，也可以是整篇 policy
+    返回: 与 pairs 一一对应的 span 列表，每项是 [span_text] 或 []
+    """
+    if not pairs:
+        return []
+
+    sentences = list(dict.fromkeys(sentence for sentence, _ in pairs))
+    sentence_ids = dict(zip(
+        sentences,
+        tokenizer(sentences, add_special_tokens=False)["input_ids"]
+    ))
+    revision = model_revision(model)
+    encoded = [
+        _encode_pair(_question_ids(tokenizer, revision, attr), sentence_ids[sentence], tokenizer)
+        for sentence, attr in pairs
+    ]
+
+    # 按长度排序后再切 batch，尽量减少 padding
+    order = sorted(range(len(encoded)), key=lambda i: len(encoded[i][0]))
+    results = [None] * len(pairs)
+    model_device = model.device
+
+    for start in range(0, len(order), batch_size):
+        batch_idx = order[start:start + batch_size]
+        width = max(len(encoded[i][0]) for i in batch_idx)
+
+        input_ids = torch.full((len(batch_idx), width), tokenizer.pad_token_id, dtype=torch.long)
+        token_type_ids = torch.zeros((len(batch_idx), width), dtype=torch.long)
+        attention_mask = torch.zeros((len(batch_idx), width), dtype=torch.long)
+        for row, i in enumerate(batch_idx):
+            ids, types = encoded[i]
+            input_ids[row, :len(ids)] = torch.tensor(ids)
+            token_type_ids[row, :len(types)] = torch.tensor(types)
+            attention_mask[row, :len(ids)] = 1
 
-        results[attr] = [span_text] if span_text.strip() else []
+        with torch.no_grad():
+            outputs = model(
+                input_ids=input_ids.to(model_device),
+                token_type_ids=token_type_ids.to(model_device),
+                attention_mask=attention_mask.to(model_device)
+            )
+
+        # padding 位置不参与 argmax，保证和逐条推理的结果一致
+        padding = (attention_mask == 0).to(model_device)
+        start_idx = outputs.start_logits.masked_fill(padding, float("-inf")).argmax(dim=1).tolist()
+        end_idx = (outputs.end_logits.masked_fill(padding, float("-inf")).argmax(dim=1) + 1).tolist()
+
+        for row, i in enumerate(batch_idx):
+            span_tokens = encoded[i][0][start_idx[row]:end_idx[row]]
+            span_text = tokenizer.convert_tokens_to_string(tokenizer.convert_ids_to_tokens(span_tokens))
+            results[i] = [span_text] if span_text.strip() else []
 
     return results
 
+
+def run_span_model(sentence, category_label, attribute_list, model, tokenizer):
+    """
+    对一个句子和它的 label 分类下要提取的属性，挨个提问，抽取 span。
+    """
+    spans = run_span_model_batch([(sentence, attr) for attr in attribute_list], model, tokenizer)
+    return dict(zip(attribute_list, spans))
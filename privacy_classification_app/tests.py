@@ -1,3 +1,1527 @@
-from django.test import TestCase
+import gzip
+import importlib.util
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import requests
+import spacy
+import torch
+from bs4 import BeautifulSoup
+from transformers import BertConfig, BertForQuestionAnswering, BertForSequenceClassification, BertTokenizerFast
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import (
+    attribute_predictor, content_store, document_fetcher, extraction_pipeline, inference_backend, model_registry,
+    model_runner, prediction_cache, span_model_runner, views_api, views_stream
+)
+from .extraction_pipeline import get_attributes_for_label
+from .html_extraction import extract_policy_content
+from .models import AnalysisJob, AnalysisLock, ContentResult, PolicySentence, PolicyVersion, Sentence, Span
+from .services import corpus_analysis, policy_analysis, precision_parity, privacy_pipeline, single_flight
+from .services import analysis_jobs, analysis_manager
+from .services.analysis_manager import current_version, load_records, store_policy_analysis
+from .services.privacy_pipeline import paragraph_key
+from .services.questions import QUESTIONS, answer_question, compile_question
+from .shared_cache import SharedCache
+
+PAGE = b"<html><body><p>Last updated: 2024-01-01</p><p>We collect your email address to provide the service.</p></body></html>"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才会保持连接，用来检查连接复用
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/gzip":
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                self._send(200, gzip.compress(PAGE), {"Content-Type": "text/html; charset=utf-8", "Content-Encoding": "gzip"})
+            else:
+                self._send(200, PAGE, {"Content-Type": "text/html; charset=utf-8"})
+        elif self.path == "/etag":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self._send(304, headers={"ETag": '"v1"'})
+            else:
+                self._send(200, PAGE, {"Content-Type": "text/html; charset=utf-8", "ETag": '"v1"'})
+        elif self.path == "/declared-large":
+            self._send(200, b"x" * 4096, {"Content-Type": "text/html"})
+        elif self.path == "/stream-large":
+            # 没有 Content-Length，一直写到客户端断开
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            try:
+                for _ in range(1000):
+                    self.wfile.write(b"x" * 65536)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        elif self.path == "/slow":
+            time.sleep(1)
+            self._send(200, PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+class DocumentFetcherTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        # 每个测试一个新的连接池
+        document_fetcher._session.update(pid=None, session=None)
+        _StubHandler.connections = 0
+
+    def test_gzip_body_is_decoded_and_connection_reused(self):
+        first = document_fetcher.fetch_document(self.base_url + "/gzip")
+        second = document_fetcher.fetch_document(self.base_url + "/gzip")
+
+        self.assertEqual(first.text, PAGE.decode())
+        self.assertEqual(second.text, PAGE.decode())
+        self.assertEqual(first.content, (["We collect your email address to provide the service."], "2024-01-01"))
+        self.assertEqual(_StubHandler.connections, 1)
+
+    def test_conditional_get_returns_not_modified(self):
+        first = document_fetcher.fetch_document(self.base_url + "/etag")
+        second = document_fetcher.fetch_document(self.base_url + "/etag", etag=first.etag)
+
+        self.assertEqual(first.etag, '"v1"')
+        self.assertTrue(second.not_modified)
+        self.assertEqual(second.text, "")
+        self.assertEqual(second.etag, '"v1"')
+
+    def test_declared_length_over_cap_is_rejected(self):
+        with self.assertRaises(document_fetcher.DocumentTooLarge):
+            document_fetcher.fetch_document(self.base_url + "/declared-large", max_bytes=1024)
+
+    def test_streamed_body_over_cap_is_aborted(self):
+        with self.assertRaises(document_fetcher.DocumentTooLarge):
+            document_fetcher.fetch_document(self.base_url + "/stream-large", max_bytes=256 * 1024)
+
+    def test_read_timeout(self):
+        with mock.patch.object(document_fetcher, "FETCH_READ_TIMEOUT", 0.2):
+            with self.assertRaises(requests.Timeout):
+                document_fetcher.fetch_document(self.base_url + "/slow")
+
+
+class HtmlExtractionTests(SimpleTestCase):
+
+    def test_matches_beautifulsoup_on_malformed_html(self):
+        html = (
+            "<html><head><title>Privacy</title><style>p{color:red}</style></head><body>"
+            "<div><p>We collect your email address <b>and</b> phone number<div>when you register</div>"
+            "dropped tail</p></div>"
+            "<p>Last updated:<br/>\n   <span>2024-03-01</span></p>"
+            "<p>We share &amp; sell &#150; nothing<script>var x = 1;</script><!-- note --> with third parties.<p>"
+            "Nested paragraph that is long enough to keep.</p><template><p>Template text is not content at all</p>"
+            "</template></body></html>"
+        )
+        soup = BeautifulSoup(html, "html.parser")
+        paragraphs = [p.get_text(strip=True) for p in soup.find_all("p")]
+
+        self.assertEqual(
+            extract_policy_content(html),
+            ([p for p in paragraphs if len(p) > 30], "2024-03-01")
+        )
+
+
+POLICY_PARAGRAPHS = [
+    "We collect information you provide directly to us. For example, we collect information when you create "
+    "an account, make a purchase, or contact customer support. The types of information we may collect include "
+    "your name, email address, postal address and phone number.",
+    "We may share your personal information with third-party service providers who perform services on our "
+    "behalf, e.g. payment processing and analytics. These partners are not allowed to use it for their own "
+    "marketing purposes!",
+    "Do we sell your data? No. We do not sell or rent personal information to advertisers.",
+    "Cookies help us remember your preferences (such as language) and understand how you use the Services. "
+    "You can disable cookies in your browser settings, but some features may stop working.",
+]
+
+
+@skipUnless(spacy.util.is_package("en_core_web_sm"), "en_core_web_sm is not installed")
+class SentenceSegmentationTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        full = spacy.load("en_core_web_sm")
+        # 原来的做法：完整 pipeline，一段一段地跑
+        cls.expected = [[sent.text.strip() for sent in full(p).sents] for p in POLICY_PARAGRAPHS]
+
+    def _split(self, segmenter):
+        from .extraction_pipeline import load_sentence_splitter
+        splitter = load_sentence_splitter(segmenter)
+        return [[sent.text.strip() for sent in doc.sents] for doc in splitter.pipe(POLICY_PARAGRAPHS)]
+
+    def test_parser_mode_matches_full_pipeline(self):
+        self.assertEqual(self._split("parser"), self.expected)
+
+    def test_sentencizer_mostly_agrees_with_full_pipeline(self):
+        agreed = total = 0
+        for expected, actual in zip(self.expected, self._split("sentencizer")):
+            agreed += len(set(expected) & set(actual))
+            total += len(set(expected) | set(actual))
+        self.assertGreaterEqual(agreed / total, 0.8)
+
+
+FIRST_PARTY = "First Party Collection/Use"
+THIRD_PARTY = "Third Party Sharing/Collection"
+PIT = "Personal Information Type"
+
+
+def _attributes(category, spans):
+    # 抽取结果里类别对应的每个属性都有一项，没有 span 时是空列表
+    return {attr: spans.get(attr, []) for attr in get_attributes_for_label(category)}
+
+
+def _sentence_item(category, value, does, third_party=None, span="email address"):
+    """analyze_paragraphs 格式的一个句子：一个 PIT span，预测值为 value。"""
+    predicted_values = {"Does/Does Not": does, "Purpose": "Unknown", PIT: {span: value}}
+    if third_party is not None:
+        predicted_values["Third Party Entity"] = third_party
+    return {
+        "sentence": f"{value} {does} {third_party}: we use your {span}.",
+        "category": category,
+        "attributes": _attributes(category, {PIT: [span]}),
+        "predicted_values": predicted_values,
+    }
+
+
+def _record(key, *items):
+    return {"key": key, "sentences": list(items)}
+
+
+@skipUnless(connection.vendor == "sqlite", "query plan format is SQLite specific")
+class QuestionQueryPlanTests(TestCase):
+    url = "https://example.com/privacy"
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(20):
+            store_policy_analysis(f"https://example.com/{i}", [
+                _record(f"p{i}-{j}", _sentence_item(FIRST_PARTY, "Contact", "Does"),
+                        _sentence_item(THIRD_PARTY, "Contact", "Does", "Advertiser"))
+                for j in range(5)
+            ], None)
+
+    def assertSearchesIndexes(self, queryset, index_names):
+        plan = queryset.explain()
+        for index_name in index_names:
+            self.assertIn(index_name, plan)
+        # 每张表都是按索引查找，没有全表扫描
+        self.assertNotIn("SCAN", plan)
+
+    def test_question_lookups_use_indexes(self):
+        for question_type in QUESTIONS:
+            with self.subTest(question_type):
+                self.assertSearchesIndexes(
+                    compile_question(self.url, QUESTIONS[question_type]),
+                    ["policy_sentence_question_idx", "span_attribute_idx"]
+                )
+
+    def test_paragraph_move_lookup_uses_index(self):
+        self.assertSearchesIndexes(
+            PolicySentence.objects.filter(version_id=1, paragraph_key__in=["a", "b"]),
+            ["policy_sentence_paragraph_idx"]
+        )
+
+
+class QuestionEngineTests(TestCase):
+    url = "https://example.com/privacy"
+
+    @classmethod
+    def setUpTestData(cls):
+        items = [
+            _sentence_item(FIRST_PARTY, "Location", "Does"),
+            _sentence_item(FIRST_PARTY, "Contact", "Does"),
+            _sentence_item(FIRST_PARTY, "Contact", "Does Not"),
+            _sentence_item(FIRST_PARTY, "Location", "Does Not"),
+            _sentence_item(FIRST_PARTY, "Financial", "Does"),
+            _sentence_item(FIRST_PARTY, "", "Does Not"),
+            _sentence_item(FIRST_PARTY, "", "Does"),
+            _sentence_item(THIRD_PARTY, "Contact", "Does", "Advertiser"),
+            _sentence_item(THIRD_PARTY, "Location", "Does Not", "Advertiser"),
+            _sentence_item(THIRD_PARTY, "Financial", "Does", ""),
+            _sentence_item(THIRD_PARTY, "Cookies", "Does", "Analytics"),
+        ]
+        store_policy_analysis(cls.url, [_record(f"p{i}", item) for i, item in enumerate(items)], None)
+
+    def test_conflict_statement_groups_in_first_appearance_order(self):
+        self.assertEqual(answer_question(self.url, "conflict_statement"), {
+            "question": "Does this privacy policy contain any conflict statement?",
+            "answer": "Yes",
+            "conflicting_attributes": ["Location", "Contact"],
+        })
+
+    def test_third_party_sharing_skips_empty_values(self):
+        self.assertEqual(answer_question(self.url, "third_party_sharing")["shared_info"], [
+            {
+                "personal_info": "Contact", "third_party": "Advertiser",
+                "sentence": "Contact Does Advertiser: we use your email address.",
+            },
+            {
+                "personal_info": "Cookies", "third_party": "Analytics",
+                "sentence": "Cookies Does Analytics: we use your email address.",
+            },
+        ])
+
+    def test_unknown_question_type(self):
+        with self.assertRaises(KeyError):
+            answer_question(self.url, "data_retention")
+
+
+class PolicyStorageTests(TestCase):
+    url = "https://example.com/privacy"
+
+    def test_records_round_trip(self):
+        records = [
+            _record("a", _sentence_item(FIRST_PARTY, "Contact", "Does")),
+            _record("b"),
+            _record("c", {
+                "sentence": "We share location data with Partners.",
+                "category": THIRD_PARTY,
+                "attributes": _attributes(THIRD_PARTY, {
+                    "Does/Does Not": ["share"],
+                    PIT: ["location data", "GPS"],
+                    "Third Party Entity": ["partners"],
+                }),
+                "predicted_values": {
+                    "Does/Does Not": "Does",
+                    "Purpose": "Unknown",
+                    PIT: {"location data": "Location"},
+                    "Third Party Entity": "Named third party",
+                },
+            }),
+            _record("a", _sentence_item(FIRST_PARTY, "Contact", "Does")),
+        ]
+        store_policy_analysis(self.url, records, "2024-01-01")
+
+        version = current_version(self.url)
+        self.assertEqual(load_records(version), records)
+        self.assertEqual(version.last_updated_date, "2024-01-01")
+        # 重复的段落只存一份；句子里找不到原文的 span（"partners"）存文本，其它只存位置
+        self.assertEqual(version.sentences.count(), 2)
+        self.assertEqual(
+            list(
+                Span.objects.filter(policy_sentence__version=version)
+                .order_by("id").values_list("attribute", "start", "text")
+            ),
+            [("Personal Information Type", 31, ""),
+             ("Personal Information Type", 9, ""), ("Personal Information Type", None, "GPS"),
+             ("Does/Does Not", 3, ""), ("Third Party Entity", None, "partners")]
+        )
+
+    def test_new_version_moves_unchanged_paragraphs(self):
+        store_policy_analysis(self.url, [
+            _record("a", _sentence_item(FIRST_PARTY, "Contact", "Does")),
+            _record("b", _sentence_item(FIRST_PARTY, "Location", "Does")),
+        ], "2024-01-01")
+        kept = PolicySentence.objects.get(paragraph_key="a")
+
+        records = [
+            _record("c", _sentence_item(THIRD_PARTY, "Contact", "Does", "Advertiser")),
+            _record("a", _sentence_item(FIRST_PARTY, "Contact", "Does")),
+        ]
+        store_policy_analysis(self.url, records, "2024-02-01")
+
+        version = current_version(self.url)
+        self.assertEqual(PolicyVersion.objects.filter(policy__url=self.url).count(), 1)
+        self.assertEqual(load_records(version), records)
+        self.assertEqual(PolicySentence.objects.get(paragraph_key="a").pk, kept.pk)
+        self.assertFalse(PolicySentence.objects.filter(paragraph_key="b").exists())
+        # 同一个句子文本只存一次
+        self.assertEqual(Sentence.objects.filter(text__startswith="Contact Does None").count(), 1)
+
+    def test_new_version_deletes_orphaned_sentences(self):
+        other = "https://example.com/other"
+        store_policy_analysis(other, [_record("x", _sentence_item(FIRST_PARTY, "Contact", "Does"))], "2024-01-01")
+        store_policy_analysis(self.url, [
+            _record("a", _sentence_item(FIRST_PARTY, "Contact", "Does")),
+            _record("b", _sentence_item(FIRST_PARTY, "Location", "Does")),
+        ], "2024-01-01")
+
+        store_policy_analysis(self.url, [_record("c", _sentence_item(THIRD_PARTY, "Health", "Does"))], "2024-02-01")
+
+        # "b" 的句子没人引用了，删掉；"a" 的句子另一个政策还在用，留着
+        self.assertEqual(
+            sorted(Sentence.objects.values_list("text", flat=True)),
+            sorted(item["sentence"] for item in [
+                _sentence_item(FIRST_PARTY, "Contact", "Does"), _sentence_item(THIRD_PARTY, "Health", "Does")
+            ])
+        )
+
+    def test_failed_write_keeps_previous_version(self):
+        records = [
+            _record("a", _sentence_item(FIRST_PARTY, "Contact", "Does")),
+            _record("b", _sentence_item(FIRST_PARTY, "Location", "Does")),
+        ]
+        store_policy_analysis(self.url, records, "2024-01-01", etag='"v1"')
+        version = current_version(self.url)
+
+        # 新版本写到最后一步（插入 span）时失败：整个事务回滚
+        with mock.patch.object(Span.objects, "bulk_create", side_effect=DatabaseError("disk I/O error")):
+            with self.assertRaises(DatabaseError):
+                store_policy_analysis(self.url, [
+                    _record("a", _sentence_item(FIRST_PARTY, "Contact", "Does")),
+                    _record("c", _sentence_item(THIRD_PARTY, "Contact", "Does", "Advertiser")),
+                ], "2024-02-01", etag='"v2"')
+
+        self.assertEqual(current_version(self.url).pk, version.pk)
+        self.assertEqual(current_version(self.url).policy.etag, '"v1"')
+        self.assertEqual(load_records(version), records)
+        self.assertFalse(PolicySentence.objects.filter(paragraph_key="c").exists())
+
+
+# 测试里的 cache.clear() 不能清掉本机共享的 cache 文件
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class PolicyAnalysisTests(SimpleTestCase):
+    url = "https://example.com/privacy"
+    paragraph = "We use your email address."
+
+    def setUp(self):
+        cache.clear()
+        patches = {
+            "classify": mock.patch.object(
+                policy_analysis, "predict_paragraph_categories",
+                side_effect=lambda paragraphs: ([[FIRST_PARTY]] * len(paragraphs), None)
+            ),
+            "split": mock.patch.object(
+                policy_analysis, "sentence_items",
+                side_effect=lambda labeled: [
+                    [{"sentence": para, "category": FIRST_PARTY, "attributes": {}}] for para, _ in labeled
+                ]
+            ),
+            "model": mock.patch.object(policy_analysis, "load_span_model", return_value=(None, None)),
+            "spans": mock.patch.object(
+                extraction_pipeline, "extract_spans",
+                side_effect=lambda pairs, model, tokenizer: [
+                    ["not in the sentence"] if attr == "Purpose" else [sentence.split()[1]]
+                    for sentence, attr in pairs
+                ]
+            ),
+            "predict": mock.patch.object(
+                policy_analysis, "predict_attribute_values",
+                side_effect=lambda queries: [f"{attr}={text}" for attr, text in queries]
+            ),
+        }
+        self.mocks = {name: patch.start() for name, patch in patches.items()}
+        self.addCleanup(mock.patch.stopall)
+
+    def test_classification_runs_once_per_content_version(self):
+        policy_analysis.get_policy_analysis(self.url, [self.paragraph])
+        policy_analysis.get_policy_analysis(self.url, ["We  use your email address."])
+        self.assertEqual(self.mocks["classify"].call_count, 1)
+
+        policy_analysis.get_policy_analysis(self.url, ["We use your phone number."])
+        self.assertEqual(self.mocks["classify"].call_count, 2)
+
+    def test_only_declared_attributes_are_evaluated(self):
+        analysis = policy_analysis.get_policy_analysis(self.url, [self.paragraph])
+        analysis.attribute_values(analysis.sentence_items(), [PIT])
+        self.mocks["spans"].assert_called_once_with([(self.paragraph, PIT)], None, None)
+        self.mocks["predict"].assert_called_once_with([(PIT, "use")])
+
+        # 之后要全部属性时只补缺的 QA 和分类，结果也写回了 cache
+        analysis = policy_analysis.get_policy_analysis(self.url, [self.paragraph])
+        item = analysis.sentence_items()[0]
+        self.assertEqual(
+            analysis.attribute_values([item]),
+            [{"Does/Does Not": "Does/Does Not=use", PIT: "Personal Information Type=use"}]
+        )
+        self.assertEqual(
+            self.mocks["spans"].call_args.args[0],
+            [(self.paragraph, "Does/Does Not"), (self.paragraph, "Purpose")]
+        )
+        self.assertEqual(self.mocks["predict"].call_args.args[0], [("Does/Does Not", "use")])
+        self.assertEqual(list(item["attributes"]), get_attributes_for_label(FIRST_PARTY))
+        self.assertEqual(policy_analysis.real_attributes(item)["Purpose"], [])
+
+    def test_staged_extract_skips_questions_for_other_sentences(self):
+        self.mocks["predict"].side_effect = lambda queries: [
+            ("Does" if text == "use" else "Does Not") if attr == "Does/Does Not" else "Contact"
+            for attr, text in queries
+        ]
+        analysis = policy_analysis.get_policy_analysis(self.url, [self.paragraph, "We never sell your data."])
+        passed, report = analysis.staged_extract(analysis.sentence_items(), ["Does/Does Not", PIT, "Purpose"])
+
+        self.assertEqual([item["sentence"] for item in passed], [self.paragraph])
+        self.assertEqual(
+            report,
+            {
+                "sentences": 2,
+                "does_sentences": 1,
+                "span_questions": {"asked": 4, "skipped": 2},
+                # Purpose 的 span 不在句子里，不用问分类器
+                "classifier_queries": {"asked": 3, "skipped": 2},
+            }
+        )
+        self.assertEqual(list(analysis.sentence_items()[1]["attributes"]), ["Does/Does Not"])
+
+    def test_stream_caches_only_complete_analysis(self):
+        paragraphs = [f"We use paragraph {i}." for i in range(4)]
+        stream = policy_analysis.iter_policy_analysis(self.url, paragraphs)
+        next(stream)
+        stream.close()
+        self.assertIsNone(cache.get(policy_analysis._cache_key(self.url, policy_analysis.content_version(paragraphs))))
+
+        chunks = [len(records) for _, records in policy_analysis.iter_policy_analysis(self.url, paragraphs, [PIT])]
+        self.assertEqual(chunks, [1, 2, 1])
+        classified = self.mocks["classify"].call_count
+        analysis = policy_analysis.get_policy_analysis(self.url, paragraphs)
+        self.assertEqual(self.mocks["classify"].call_count, classified)
+        self.assertEqual([record["text"] for record in analysis.records], paragraphs)
+        self.assertEqual(list(analysis.sentence_items()[3]["attributes"]), [PIT])
+
+
+class SingleFlightTests(TransactionTestCase):
+    def setUp(self):
+        for name, value in [("SINGLE_FLIGHT_POLL_SECONDS", 0.01), ("SINGLE_FLIGHT_WAIT_SECONDS", 5)]:
+            patch = mock.patch.object(single_flight, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _hold_lock(self, name, seconds):
+        return AnalysisLock.objects.create(
+            key=single_flight.lock_key(name), owner="other-worker",
+            expires_at=timezone.now() + timedelta(seconds=seconds)
+        )
+
+    def test_concurrent_calls_share_one_computation(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"calls": len(calls)}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight.single_flight("u", compute)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"calls": 1}] * 5)
+        self.assertFalse(AnalysisLock.objects.exists())
+
+    def test_waiter_reuses_result_of_other_worker(self):
+        lock = self._hold_lock("u", 60)
+        threading.Timer(0.1, lock.delete).start()
+        compute = mock.Mock(return_value="computed")
+
+        self.assertEqual(single_flight.single_flight("u", compute, reuse=lambda since: "stored"), "stored")
+        compute.assert_not_called()
+
+    def test_expired_lock_is_taken_over(self):
+        self._hold_lock("u", -1)
+        self.assertEqual(single_flight.single_flight("u", lambda: "computed", reuse=lambda since: "stored"), "computed")
+
+    def test_lock_is_renewed_while_computing(self):
+        # 租期比计算短：不续租的话等待的一方会当锁过期，自己再算一遍
+        key = single_flight.lock_key("u")
+        calls = []
+        stored = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(1)
+            stored.append("stored")
+            return "computed"
+
+        def reuse(since):
+            return stored[0] if stored else None
+
+        with mock.patch.object(single_flight, "SINGLE_FLIGHT_LOCK_SECONDS", 0.3):
+            leader = threading.Thread(target=single_flight._compute_with_lock, args=(key, compute, reuse))
+            leader.start()
+            time.sleep(0.1)
+            # 绕过进程内的 Future，相当于另一个 worker 进程
+            self.assertEqual(single_flight._compute_with_lock(key, compute, reuse), "stored")
+            leader.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(AnalysisLock.objects.exists())
+
+    def test_wait_times_out_to_computing(self):
+        self._hold_lock("u", 60)
+        with mock.patch.object(single_flight, "SINGLE_FLIGHT_WAIT_SECONDS", 0.05):
+            self.assertEqual(single_flight.single_flight("u", lambda: "computed"), "computed")
+        self.assertEqual(AnalysisLock.objects.get().owner, "other-worker")
+
+
+class SharedCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite3")
+
+    def _cache(self, max_bytes=1024 * 1024, **options):
+        return SharedCache(self.path, {"OPTIONS": {"MAX_BYTES": max_bytes, **options}})
+
+    def test_entries_are_compressed_and_shared_between_workers(self):
+        value = {"sentences": ["We collect your email address."] * 200}
+        self._cache().set("k", value)
+
+        other = self._cache()
+        self.assertEqual(other.get("k"), value)
+        self.assertIsNone(other.get("missing"))
+        stats = other.stats()
+        self.assertEqual((stats["entries"], stats["hits"], stats["misses"]), (1, 1, 1))
+        self.assertLess(stats["bytes"], len(repr(value)) // 10)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        # 访问时间默认只精确到 5 秒，这里每次命中都更新
+        cache = self._cache(max_bytes=3000, ACCESS_RESOLUTION_SECONDS=0)
+        for key in "abc":
+            cache.set(key, os.urandom(900))
+            time.sleep(0.01)
+        cache.get("a")
+        cache.set("d", os.urandom(900))
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("d"))
+        stats = cache.stats()
+        self.assertLessEqual(stats["bytes"], 3000)
+        self.assertGreaterEqual(stats["evictions"], 1)
+        self.assertFalse(cache.add("huge", os.urandom(4000)))
+
+    def test_expired_entries_miss(self):
+        cache = self._cache()
+        cache.set("k", "v", timeout=0.05)
+        self.assertTrue(cache.add("other", 1))
+        self.assertFalse(cache.add("other", 2))
+        time.sleep(0.1)
+
+        self.assertIsNone(cache.get("k"))
+        self.assertFalse(cache.has_key("k"))
+        self.assertEqual(cache.get("other"), 1)
+        self.assertEqual(cache.stats()["expired"], 1)
+
+    def test_running_total_matches_stored_sizes(self):
+        cache = self._cache(max_bytes=3000)
+        cache.set("a", os.urandom(500))
+        cache.set("a", os.urandom(900))
+        cache.add("a", os.urandom(100))
+        for key in "bcd":
+            cache.set(key, os.urandom(900))
+        cache.set("e", "v", timeout=0.01)
+        cache.delete("b")
+        time.sleep(0.02)
+        cache.get("e")
+        cache.add("huge", os.urandom(4000))
+
+        with sqlite3.connect(self.path) as conn:
+            stored = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        self.assertEqual(cache.stats()["bytes"], stored)
+        cache.clear()
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+    def test_hits_do_not_write(self):
+        cache = self._cache()
+        cache.set("k", "v")
+        conn = cache._db["conn"]
+        changes = conn.total_changes
+
+        for _ in range(3):
+            self.assertEqual(cache.get("k"), "v")
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(conn.total_changes, changes)
+        # 计数还在本进程里，stats() 时才写进文件
+        self.assertEqual(self._cache().stats()["hits"], 0)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (3, 1))
+
+
+class _FakeModel:
+    def __init__(self, subfolder, nbytes):
+        self.subfolder = subfolder
+        self.nbytes = nbytes
+        self.config = BertConfig(_commit_hash=f"rev-{subfolder}")
+
+
+class FakeRegistryTestCase(SimpleTestCase):
+    """model_registry 加载的是 _FakeModel：大小 sizes[subfolder]，int8 时是四分之一。"""
+    sizes = {}
+
+    def setUp(self):
+        self.loads = []
+
+        def load(subfolder, model_class, repo):
+            self.loads.append(subfolder)
+            time.sleep(0.05)
+            return _FakeModel(subfolder, self.sizes[subfolder]), f"tokenizer-{subfolder}"
+
+        def prepare(model, subfolder, precision, device=None):
+            return _FakeModel(subfolder, model.nbytes // 4) if precision == "int8" else model
+
+        for patch in [
+            mock.patch.dict(model_registry._models, clear=True),
+            mock.patch.dict(model_registry._load_locks, clear=True),
+            mock.patch.dict(model_registry._revisions, clear=True),
+            mock.patch.object(model_registry, "load_model_and_tokenizer", side_effect=load),
+            mock.patch.object(model_registry, "prepare_model", side_effect=prepare),
+            mock.patch.object(model_registry, "_model_nbytes", side_effect=lambda model: model.nbytes),
+            mock.patch.object(model_registry, "MODEL_PRECISION", "fp32"),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class ModelRegistryTests(FakeRegistryTestCase):
+    sizes = {"A": 400 * 1024, "B": 400 * 1024, "C": 400 * 1024}
+
+    def test_concurrent_callers_load_once(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(model_registry.get_model("A"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.loads, ["A"])
+        self.assertEqual(len({id(model) for model, _ in results}), 1)
+        self.assertEqual(model_registry.memory_report()["models"][0]["hits"], 8)
+
+    @mock.patch.object(model_registry, "MODEL_MEMORY_BUDGET_MB", 1)
+    @mock.patch.object(model_registry, "EVICTABLE_SUBFOLDERS", {"A", "B"})
+    def test_least_recently_used_evictable_model_is_unloaded(self):
+        def loaded():
+            return [m["subfolder"] for m in model_registry.memory_report()["models"]]
+
+        for subfolder in "ABC":
+            model_registry.get_model(subfolder)
+        # 超出 1 MB：卸载最久没用的可卸载模型 A；C 不可卸载
+        self.assertEqual(loaded(), ["B", "C"])
+
+        model_registry.get_model("B")
+        model_registry.get_model("A")
+        self.assertEqual(loaded(), ["C", "A"])
+        self.assertEqual(self.loads, ["A", "B", "C", "A"])
+        self.assertLessEqual(model_registry.memory_report()["total_bytes"], 1024 * 1024)
+
+    @mock.patch.object(model_registry, "MODEL_MEMORY_BUDGET_MB", 1)
+    @mock.patch.object(model_registry, "EVICTABLE_SUBFOLDERS", {"A", "B"})
+    def test_revision_does_not_load_or_touch_models(self):
+        with mock.patch.object(model_registry, "load_model_config", return_value=BertConfig(_commit_hash="rev-A")):
+            self.assertEqual(model_registry.get_revision("A"), "rev-A")
+        self.assertEqual(self.loads, [])
+
+        for subfolder in "AB":
+            model_registry.get_model(subfolder)
+        # 查 revision 不算使用：LRU 顺序不变，接下来加载 C 时卸载的还是 A
+        self.assertEqual(model_registry.get_revision("A"), "rev-A")
+        self.assertEqual(model_registry.get_revision("B"), "rev-B")
+        model_registry.get_model("C")
+        self.assertEqual([m["subfolder"] for m in model_registry.memory_report()["models"]], ["B", "C"])
+        # 卸载之后也不用重新读 config
+        self.assertEqual(model_registry.get_revision("A"), "rev-A")
+
+
+def _tiny_qa_model(vocab_size, seed=1):
+    """随机初始化的两层小 BERT QA 模型，测试里代替 SpanBERT。"""
+    torch.manual_seed(seed)
+    return BertForQuestionAnswering(BertConfig(
+        vocab_size=vocab_size, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=512
+    )).eval()
+
+
+class SpanBatchParityTests(SimpleTestCase):
+    sentences = [
+        "We collect your email address.",
+        "We share your location with advertising partners for marketing purposes.",
+        "Cookies.",
+        "We do not sell your data to third parties, and we keep your email address only while your account is open.",
+        " ".join(["We collect your email address and location."] * 80),  # 超过 512 个 token，会被截断
+    ]
+    attributes = ["Does/Does Not", "Personal Information Type", "Purpose"]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        words = {
+            word.strip(".,?").lower()
+            for text in self.sentences + [span_model_runner.build_question(attr) for attr in self.attributes]
+            for word in text.replace("/", " / ").split()
+        }
+        vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", ".", ",", "?", "/"] + sorted(words)
+        vocab_path = os.path.join(directory.name, "vocab.txt")
+        with open(vocab_path, "w") as f:
+            f.write("\n".join(vocab))
+        self.tokenizer = BertTokenizerFast(vocab_file=vocab_path)
+
+        self.model = _tiny_qa_model(len(vocab))
+        patch = mock.patch.dict(span_model_runner._question_cache, clear=True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _run_one(self, sentence, attr):
+        """改成批量之前 run_span_model 对一个 (句子, 属性) 的做法。"""
+        encoded = self.tokenizer(
+            span_model_runner.build_question(attr), sentence, return_tensors="pt", truncation=True, max_length=512
+        )
+        with torch.no_grad():
+            outputs = self.model(**encoded)
+        start_idx = torch.argmax(outputs.start_logits).item()
+        end_idx = torch.argmax(outputs.end_logits).item() + 1
+        span_tokens = encoded["input_ids"][0][start_idx:end_idx]
+        span_text = self.tokenizer.convert_tokens_to_string(self.tokenizer.convert_ids_to_tokens(span_tokens))
+        return [span_text] if span_text.strip() else []
+
+    def test_batched_spans_match_per_sentence_spans(self):
+        pairs = [(sentence, attr) for sentence in self.sentences for attr in self.attributes]
+        expected = [self._run_one(sentence, attr) for sentence, attr in pairs]
+
+        # batch 里长短不一，短的要 pad 到同一 batch 里最长的
+        for batch_size in (1, 4, len(pairs)):
+            self.assertEqual(
+                span_model_runner.run_span_model_batch(pairs, self.model, self.tokenizer, batch_size=batch_size),
+                expected
+            )
+        self.assertTrue(any(expected))
+
+
+class AttributeBatchParityTests(TestCase):
+    spans = [
+        "email address",
+        "your precise location when you use the app and the websites of our advertising partners",
+        "cookies",
+        "email address",
+        "to provide and improve the service, including customer support and fraud prevention",
+        "advertisers",
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        words = sorted({word.strip(",") for span in self.spans for word in span.split()})
+        vocab_path = os.path.join(directory.name, "vocab.txt")
+        with open(vocab_path, "w") as f:
+            f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", ","] + words))
+        self.tokenizer = BertTokenizerFast(vocab_file=vocab_path)
+        # 默认的 initializer_range 太小，随机模型对所有 span 都给同一个 label
+        torch.manual_seed(2)
+        self.model = BertForSequenceClassification(BertConfig(
+            vocab_size=len(words) + 6, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+            intermediate_size=64, num_labels=4, initializer_range=0.5
+        )).eval()
+        self.id_to_label = {0: "Contact", 1: "Location", 2: "Advertising", 3: "Other"}
+
+        self.get_model = mock.Mock(return_value=(self.model, self.tokenizer))
+        for patch in [
+            mock.patch.object(attribute_predictor, "get_model", self.get_model),
+            mock.patch.object(attribute_predictor, "get_revision", return_value="rev1"),
+            mock.patch.object(prediction_cache, "PREDICTION_CACHE_PATH", os.path.join(directory.name, "p.sqlite3")),
+            mock.patch.dict(prediction_cache._db, {"pid": None, "conn": None}),
+            mock.patch.object(content_store, "CONTENT_STORE_ENABLED", True),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+        prediction_cache.clear()
+        self.addCleanup(prediction_cache.clear)
+
+    def _predict_one(self, span, max_length):
+        """改成批量之前的做法：每个 span 单独 pad 到 max_length。"""
+        encoding = self.tokenizer(span, padding="max_length", truncation=True, max_length=max_length, return_tensors="pt")
+        with torch.no_grad():
+            label_id = torch.argmax(self.model(**encoding).logits, dim=1).item()
+        return self.id_to_label[label_id]
+
+    def test_batched_labels_match_per_span_labels(self):
+        expected = [self._predict_one(span, 256) for span in self.spans]
+        self.assertGreater(len(set(expected)), 1)
+
+        for batch_size in (1, 2, len(self.spans)):
+            prediction_cache.clear()
+            ContentResult.objects.all().delete()
+            self.assertEqual(
+                attribute_predictor._classify_batch(
+                    self.spans, "PIT", self.id_to_label, max_length=256, batch_size=batch_size
+                ),
+                expected
+            )
+
+        # 全部命中缓存时不加载模型
+        self.get_model.reset_mock()
+        self.assertEqual(attribute_predictor._classify_batch(self.spans, "PIT", self.id_to_label, 256), expected)
+        self.get_model.assert_not_called()
+
+
+class ParagraphBatchParityTests(TestCase):
+    paragraphs = [
+        "We collect your email address and phone number when you register.",
+        "Cookies.",
+        " ".join(["We share your location with advertising partners for marketing purposes."] * 60),  # 截断到 512
+        "We keep your data for as long as your account is open, and delete it within thirty days after.",
+        "Cookies.",  # 重复的段落
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        words = sorted({word.strip(".,") for para in self.paragraphs for word in para.lower().split()})
+        vocab_path = os.path.join(directory.name, "vocab.txt")
+        with open(vocab_path, "w") as f:
+            f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", ".", ","] + words))
+        self.tokenizer = BertTokenizerFast(vocab_file=vocab_path)
+        torch.manual_seed(0)
+        self.model = BertForSequenceClassification(BertConfig(
+            vocab_size=len(words) + 7, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+            intermediate_size=64, num_labels=len(model_runner.category_labels), initializer_range=0.5
+        )).eval()
+        self.forward = mock.Mock(wraps=self.model.forward)
+        for patch in [
+            mock.patch.object(model_runner, "load_paragraph_model", return_value=(self.model, self.tokenizer)),
+            mock.patch.object(model_runner, "device", torch.device("cpu")),
+            mock.patch.object(self.model, "forward", self.forward),
+            mock.patch.object(content_store, "CONTENT_STORE_ENABLED", True),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _predict_one(self, paragraph):
+        """改成批量之前 predict_paragraph_category 的做法：一个段落单独跑，返回 sigmoid 概率。"""
+        inputs = self.tokenizer(paragraph, return_tensors="pt", truncation=True, padding=True, max_length=512)
+        with torch.no_grad():
+            return torch.sigmoid(self.model(**inputs).logits).numpy()[0]
+
+    def test_batched_probs_match_per_paragraph_probs(self):
+        expected = np.stack([self._predict_one(para) for para in self.paragraphs])
+        expected_labels = [
+            [label for label, prob in zip(model_runner.category_labels, row) if prob > 0.5] or ["None"]
+            for row in expected
+        ]
+        self.assertGreater(len({tuple(labels) for labels in expected_labels}), 1)
+        self.forward.reset_mock()
+
+        labels, probs = model_runner.predict_paragraph_categories(self.paragraphs, batch_size=2)
+        np.testing.assert_allclose(probs, expected, atol=1e-5)
+        self.assertEqual(labels, expected_labels)
+        # 4 个不同的段落，每个 batch 2 个
+        self.assertEqual(self.forward.call_count, 2)
+
+        # 之后都从 content_store 取，不再推理
+        self.forward.reset_mock()
+        self.assertEqual([model_runner.predict_paragraph_category(para) for para in self.paragraphs], expected_labels)
+        np.testing.assert_allclose(model_runner.predict_paragraph_categories(self.paragraphs)[1], expected, atol=1e-5)
+        self.forward.assert_not_called()
+
+
+class PrecisionParityTests(FakeRegistryTestCase):
+    sizes = {"paragraph": 4 * 1024 * 1024, "span": 2 * 1024 * 1024}
+
+    def setUp(self):
+        super().setUp()
+        model_registry._resolve_precision.cache_clear()
+        self.addCleanup(model_registry._resolve_precision.cache_clear)
+        for patch in [
+            mock.patch.object(model_registry, "bf16_supported", return_value=False),
+            mock.patch.object(precision_parity, "_warm_up", side_effect=lambda: model_registry.get_model("paragraph")),
+            mock.patch.object(precision_parity, "load_span_model", side_effect=lambda: model_registry.get_model("span")),
+            mock.patch.object(
+                precision_parity, "predict_paragraph_categories",
+                side_effect=lambda paragraphs: ([[FIRST_PARTY]] * len(paragraphs), np.zeros((len(paragraphs), 10)))
+            ),
+            mock.patch.object(precision_parity, "extract_from_paragraphs", return_value=[]),
+            mock.patch.object(precision_parity, "predict_attribute_values", return_value=[]),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_memory_of_the_models_actually_used(self):
+        report = precision_parity.run_precision_parity([self.id()], "int8")
+        self.assertEqual(report["memory_mb"], {"fp32": 6.0, "int8": 1.5})
+        self.assertEqual((report["effective_precision"], report["fallback"]), (["int8"], False))
+
+    def test_unsupported_bf16_reports_fp32_fallback(self):
+        report = precision_parity.run_precision_parity([self.id()], "bf16")
+        self.assertEqual(report["memory_mb"], {"fp32": 6.0, "bf16": 6.0})
+        self.assertEqual((report["effective_precision"], report["fallback"]), (["fp32"], True))
+        self.assertEqual(self.loads, ["paragraph", "span"])
+
+
+class InferenceBackendTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patch = mock.patch.object(inference_backend, "MODEL_EXPORT_DIR", directory.name)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.export_dir = directory.name
+
+        self.model = _tiny_qa_model(50)
+        self.model.config._commit_hash = "rev1"
+        self.inputs = {
+            "input_ids": torch.tensor([[2, 10, 11, 12, 3, 0], [2, 13, 3, 14, 15, 3]]),
+            "attention_mask": torch.tensor([[1, 1, 1, 1, 1, 0], [1, 1, 1, 1, 1, 1]]),
+            "token_type_ids": torch.tensor([[0, 0, 0, 0, 0, 0], [0, 0, 0, 1, 1, 1]]),
+        }
+
+    def _assert_same_outputs(self, wrapped):
+        with torch.no_grad():
+            expected = self.model(**self.inputs)
+        outputs = wrapped(**self.inputs)
+        for name in ("start_logits", "end_logits"):
+            torch.testing.assert_close(outputs[name], expected[name], rtol=1e-4, atol=1e-4)
+
+    def test_unsupported_combinations_fall_back_to_eager(self):
+        self.assertEqual(inference_backend.resolve_backend("bf16", backend="onnx"), "eager")
+        self.assertEqual(inference_backend.resolve_backend("int8", backend="torchscript"), "eager")
+        self.assertEqual(inference_backend.resolve_backend("int8", backend="onnx"), "onnx")
+        with self.assertRaises(ValueError):
+            inference_backend.resolve_backend("fp32", backend="tensorrt")
+
+    def test_torchscript_exports_once_per_revision(self):
+        with mock.patch.object(torch.jit, "save", wraps=torch.jit.save) as save:
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(
+                    inference_backend.wrap_model(self.model, "qa", "fp32", "torchscript")
+                ))
+                for _ in range(3)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(save.call_count, 1)
+            for wrapped in results:
+                self._assert_same_outputs(wrapped)
+
+            self.model.config._commit_hash = "rev2"
+            inference_backend.wrap_model(self.model, "qa", "fp32", "torchscript")
+            self.assertEqual(save.call_count, 2)
+
+        export_dir = os.path.join(self.export_dir, "qa", "torchscript-fp32")
+        self.assertEqual(sorted(name for name in os.listdir(export_dir) if not name.endswith(".lock")),
+                         ["meta.json", "model.pt"])
+
+    def test_failed_export_leaves_no_model(self):
+        with mock.patch.object(torch.jit, "save", side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                inference_backend.wrap_model(self.model, "qa", "fp32", "torchscript")
+        export_dir = os.path.join(self.export_dir, "qa", "torchscript-fp32")
+        self.assertEqual([name for name in os.listdir(export_dir) if not name.endswith(".lock")], [])
+
+    @skipUnless(importlib.util.find_spec("onnxruntime"), "onnxruntime is not installed")
+    def test_onnx_matches_eager(self):
+        self._assert_same_outputs(inference_backend.wrap_model(self.model, "qa", "fp32", "onnx"))
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "predictions.sqlite3")
+        for patch in [
+            mock.patch.object(prediction_cache, "PREDICTION_CACHE_PATH", self.path),
+            mock.patch.object(prediction_cache, "PREDICTION_CACHE_SIZE", 2),
+            mock.patch.dict(prediction_cache._db, {"pid": None, "conn": None}),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+        prediction_cache.clear()
+        self.addCleanup(prediction_cache.clear)
+        self.addCleanup(self._close)
+
+    def _close(self):
+        if prediction_cache._db["conn"] is not None:
+            prediction_cache._db["conn"].close()
+
+    def _restart(self):
+        """模拟重启：内存层和连接都是新的，磁盘上的还在。"""
+        self._close()
+        prediction_cache._db.update(pid=None, conn=None)
+        prediction_cache.clear()
+
+    def test_memory_is_bounded_lru_in_front_of_disk(self):
+        mid = prediction_cache.model_id("PIT", "rev1", "fp32")
+        prediction_cache.set_many("PIT", mid, {"email": "Contact", "phone": "Contact", "gps": "Location"})
+        self.assertEqual(prediction_cache.stats()["size"], 2)
+
+        self.assertEqual(prediction_cache.get_many("PIT", mid, ["gps", "email", "name"]),
+                         {"gps": "Location", "email": "Contact"})
+        self.assertEqual(prediction_cache.stats()["models"][mid], {"hits": 1, "disk_hits": 1, "misses": 1})
+
+        self._restart()
+        self.assertEqual(prediction_cache.get_many("PIT", mid, ["phone"]), {"phone": "Contact"})
+        self.assertEqual(prediction_cache.stats()["models"][mid], {"hits": 0, "disk_hits": 1, "misses": 0})
+
+    def test_new_revision_drops_old_rows_but_keeps_other_precisions(self):
+        old, fp32, int8 = (
+            prediction_cache.model_id("PIT", "rev1", "fp32"),
+            prediction_cache.model_id("PIT", "rev2", "fp32"),
+            prediction_cache.model_id("PIT", "rev2", "int8"),
+        )
+        prediction_cache.set_many("PIT", old, {"email": "Contact"})
+        prediction_cache.set_many("PIT", fp32, {"email": "Contact"})
+        prediction_cache.set_many("PIT", int8, {"email": "Contact"})
+
+        self._restart()
+        self.assertEqual(prediction_cache.get_many("PIT", fp32, ["email"]), {"email": "Contact"})
+        self.assertEqual(prediction_cache.get_many("PIT", int8, ["email"]), {"email": "Contact"})
+        self.assertEqual(prediction_cache.get_many("PIT", old, ["email"]), {})
+
+
+class ContentStoreTests(TestCase):
+    def setUp(self):
+        for patch in [
+            mock.patch.object(content_store, "CONTENT_STORE_ENABLED", True),
+            mock.patch.object(content_store, "CONTENT_STORE_PRUNE_SECONDS", 0),
+            mock.patch.dict(content_store._stats, clear=True),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_lookup_hits_and_misses_per_model_revision(self):
+        rev1 = prediction_cache.model_id("PIT", "rev1", "fp32")
+        content_store.set_many("value", rev1, {"email address": "Contact"})
+        content_store.set_many("value", rev1, {"email address": "Other"})
+
+        self.assertEqual(content_store.get_many("value", rev1, ["email address", "phone"]), {"email address": "Contact"})
+        # 模型 revision 变了就不命中
+        rev2 = prediction_cache.model_id("PIT", "rev2", "fp32")
+        self.assertEqual(content_store.get_many("value", rev2, ["email address"]), {})
+        self.assertEqual(content_store.get_many("paragraph", rev1, ["email address"]), {})
+        self.assertEqual(content_store.stats()["kinds"]["value"], {"hits": 1, "misses": 2})
+
+        with content_store.bypass():
+            self.assertEqual(content_store.get_many("value", rev1, ["email address"]), {})
+
+    def test_prune_by_age_then_row_count(self):
+        mid = prediction_cache.model_id("PIT", "rev1", "fp32")
+        content_store.set_many("value", mid, {f"span {i}": "Contact" for i in range(5)})
+        now = timezone.now()
+        for i, key in enumerate(ContentResult.objects.order_by("key").values_list("key", flat=True)):
+            ContentResult.objects.filter(key=key).update(created_at=now - timedelta(days=i * 30))
+
+        self.assertEqual(content_store.prune(max_age_days=100, max_rows=0), 1)
+        self.assertEqual(content_store.prune(max_age_days=0, max_rows=2), 2)
+        kept = ContentResult.objects.values_list("created_at", flat=True)
+        self.assertEqual(sorted(kept, reverse=True), [now, now - timedelta(days=30)])
+
+
+class ParagraphAlignmentTests(SimpleTestCase):
+    old = ["Intro.", "We collect email.", "We share location.", "Contact us."]
+
+    def _records(self, paragraphs):
+        return [{"key": paragraph_key(para), "text": para, "sentences": []} for para in paragraphs]
+
+    def _align(self, new):
+        old_records = self._records(self.old)
+        records, changes = analysis_manager.align_paragraphs(old_records, new)
+        return [record and record["text"] for record in records], changes
+
+    def test_inserted_paragraph_is_the_only_one_analyzed(self):
+        records, changes = self._align(
+            ["Intro.", "We collect email.", "New cookies section.", "We share location.", "Contact us."]
+        )
+        self.assertEqual(records, ["Intro.", "We collect email.", None, "We share location.", "Contact us."])
+        self.assertEqual(changes, {"unchanged": 4, "moved": 0, "analyzed": 1, "removed": 0})
+
+    def test_deleted_and_edited_paragraphs(self):
+        records, changes = self._align(["Intro.", "We share  location.", "Contact us by mail."])
+        # 只有空白不同不算改动
+        self.assertEqual(records, ["Intro.", "We share location.", None])
+        self.assertEqual(changes, {"unchanged": 2, "moved": 0, "analyzed": 1, "removed": 2})
+
+    def test_moved_paragraph_reuses_its_record(self):
+        records, changes = self._align(["Contact us.", "Intro.", "We collect email.", "We share location."])
+        self.assertEqual(records, ["Contact us.", "Intro.", "We collect email.", "We share location."])
+        self.assertEqual(changes, {"unchanged": 3, "moved": 1, "analyzed": 0, "removed": 0})
+
+    def test_duplicate_paragraphs_are_matched_once_each(self):
+        old_records = self._records(["Contact us.", "Intro.", "Contact us."])
+        records, changes = analysis_manager.align_paragraphs(
+            old_records, ["Intro.", "Contact us.", "Contact us.", "Contact us."]
+        )
+        # 旧版本里有两份一样的段落：各复用一次，多出来的第三份要重新分析
+        self.assertEqual([id(record) if record else None for record in records],
+                         [id(old_records[1]), id(old_records[2]), id(old_records[0]), None])
+        self.assertEqual(changes, {"unchanged": 2, "moved": 1, "analyzed": 1, "removed": 0})
+
+    def test_only_changed_paragraphs_are_reanalyzed(self):
+        new = ["Intro.", "We collect email and phone.", "We share location.", "Contact us.", "Cookies."]
+        with mock.patch.object(
+            analysis_manager, "analyze_paragraphs",
+            side_effect=lambda paragraphs: [
+                {"key": paragraph_key(para), "text": para, "sentences": [{"sentence": para}]} for para in paragraphs
+            ]
+        ) as analyze:
+            records, changes = analysis_manager.analyze_incrementally(new, self._records(self.old))
+
+        analyze.assert_called_once_with(["We collect email and phone.", "Cookies."])
+        self.assertEqual([record["text"] for record in records], new)
+        self.assertEqual(changes["analyzed"], 2)
+        self.assertEqual(changes["sentences"], 2)
+
+
+class AnalysisJobTests(TestCase):
+    url = "https://example.com/privacy"
+    paragraphs = ["Intro.", "We collect email.", "We share location."]
+
+    def setUp(self):
+        for patch in [
+            mock.patch.object(analysis_jobs, "_schedule"),
+            mock.patch.object(analysis_jobs, "JOB_CHECKPOINT_PARAGRAPHS", 1),
+            # run_job 结束时会关数据库连接，测试里不能关
+            mock.patch.object(analysis_jobs, "connection"),
+            mock.patch.object(analysis_jobs, "check_policy", side_effect=AssertionError("should resume from checkpoint")),
+            mock.patch.object(analysis_jobs, "store_policy_analysis", return_value={"url": self.url}),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.analyze = mock.patch.object(
+            analysis_jobs, "analyze_paragraphs",
+            side_effect=lambda paragraphs: [{"key": paragraph_key(para), "sentences": []} for para in paragraphs]
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _job(self, url=url, heartbeat_age=3600, worker="dead-host:1", done=1):
+        """running 的任务，checkpoint 里前 done 个段落已经分析完。"""
+        records = [{"key": paragraph_key(para), "sentences": []} for para in self.paragraphs[:done]]
+        return AnalysisJob.objects.create(
+            url=url, status="running", worker=worker,
+            heartbeat=timezone.now() - timedelta(seconds=heartbeat_age),
+            checkpoint={
+                "paragraphs": self.paragraphs,
+                "records": records + [None] * (len(self.paragraphs) - done),
+                "last_updated": None, "etag": None, "http_last_modified": None,
+            }
+        )
+
+    def test_concurrent_submit_reuses_the_other_requests_job(self):
+        existing = AnalysisJob.objects.create(url=self.url)
+        # 两个请求都没查到未完成的任务，另一个先建好了：这里建的时候违反唯一约束，改用它的
+        with mock.patch.object(analysis_jobs, "_active_job", side_effect=[None, existing]):
+            self.assertEqual(analysis_jobs.submit_job(self.url), existing)
+        self.assertEqual(AnalysisJob.objects.count(), 1)
+
+        AnalysisJob.objects.update(status="done")
+        self.assertNotEqual(analysis_jobs.submit_job(self.url), existing)
+
+    def test_only_one_worker_claims_a_job(self):
+        job = AnalysisJob.objects.create(url=self.url)
+        self.assertTrue(analysis_jobs._claim(job.id))
+        self.assertFalse(analysis_jobs._claim(job.id))
+        self.assertEqual(AnalysisJob.objects.get().worker, analysis_jobs._worker_id())
+
+    def test_stale_running_job_is_resumed(self):
+        self._job(url="https://example.org/privacy", heartbeat_age=0, worker="live-host:1")
+        stale = self._job()
+        analysis_jobs.resume_stale_jobs()
+        analysis_jobs._schedule.assert_called_once_with(stale.id)
+
+    def test_job_reuses_analysis_stored_by_another_worker(self):
+        # 别的 worker 正在分析同一个 URL：等它的锁，然后直接用它存好的版本
+        AnalysisLock.objects.create(
+            key=single_flight.lock_key(f"analyze_and_store:{self.url}"), owner="other-worker",
+            expires_at=timezone.now() + timedelta(seconds=0.2)
+        )
+        job = self._job()
+        reused = {"url": self.url, "reused": True}
+        with mock.patch.object(single_flight, "SINGLE_FLIGHT_POLL_SECONDS", 0.01), \
+                mock.patch.object(analysis_manager, "_stored_since", return_value=(reused, None)):
+            analysis_jobs.run_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), ("done", reused))
+        self.analyze.assert_not_called()
+
+    def test_resumes_from_checkpoint(self):
+        job = self._job()
+        analysis_jobs.run_job(job.id)
+
+        self.assertEqual(
+            [c.args[0] for c in self.analyze.call_args_list], [["We collect email."], ["We share location."]]
+        )
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.checkpoint), ("done", {"url": self.url}, None))
+        self.assertEqual((job.completed_paragraphs, job.total_paragraphs), (3, 3))
+
+    def test_lost_claim_stops_without_failing_the_job(self):
+        job = self._job()
+
+        def taken_over(paragraphs):
+            # 本进程被当成挂掉了，别的 worker 接手
+            AnalysisJob.objects.filter(id=job.id).update(worker="other-host:2")
+            return [{"key": paragraph_key(para), "sentences": []} for para in paragraphs]
+
+        self.analyze.side_effect = taken_over
+        analysis_jobs.run_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.completed_paragraphs), ("running", "other-host:2", 0))
+        self.assertEqual(self.analyze.call_count, 1)
+        analysis_jobs.store_policy_analysis.assert_not_called()
+
+
+class NormalizedStorageMigrationTests(TransactionTestCase):
+    app = "privacy_classification_app"
+
+    def _migrate(self, name):
+        executor = MigrationExecutor(connection)
+        executor.migrate([(self.app, name)])
+        return executor.loader.project_state([(self.app, name)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_policy_without_stored_sentences_is_reanalyzed(self):
+        apps = self._migrate("0005_lookup_indexes")
+        PolicyCache = apps.get_model(self.app, "PolicyCache")
+        AnalyzedSentence = apps.get_model(self.app, "AnalyzedSentence")
+        PolicyCache.objects.create(
+            url="https://example.com/empty", last_updated_date="January 1, 2024", paragraphs=[], etag='"v1"',
+            cached_result={"url": "https://example.com/empty", "first_party_collected": ["Contact"]}
+        )
+        PolicyCache.objects.create(
+            url="https://example.com/legacy", last_updated_date="January 1, 2024", paragraphs=[],
+            cached_result={}
+        )
+        AnalyzedSentence.objects.create(
+            url="https://example.com/legacy", category=FIRST_PARTY, sentence="We use your email address.",
+            attribute=PIT, span="email address", predicted_value="Contact", does_or_not_value="Does",
+            purpose_value="Unknown"
+        )
+
+        apps = self._migrate("0006_normalized_storage")
+        Policy = apps.get_model(self.app, "Policy")
+        PolicyVersion = apps.get_model(self.app, "PolicyVersion")
+
+        # 没有任何句子的旧数据只建 Policy，不建版本，也不带旧的 ETag
+        empty = Policy.objects.get(url="https://example.com/empty")
+        self.assertIsNone(empty.etag)
+        self.assertFalse(PolicyVersion.objects.filter(policy=empty).exists())
+        legacy = PolicyVersion.objects.get(policy__url="https://example.com/legacy")
+        self.assertEqual(legacy.last_updated_date, "January 1, 2024")
+        self.assertEqual(legacy.sentences.count(), 1)
+
+
+class StreamingViewTests(SimpleTestCase):
+    url = "https://example.com/privacy"
+    records = [
+        {"key": "a", "text": "Intro.", "labels": [FIRST_PARTY], "sentences": []},
+        {"key": "b", "text": "Contact us.", "labels": [THIRD_PARTY], "sentences": []},
+    ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.endpoint = reverse("classify_url_stream")
+
+    def _stream(self, chunks, error=None):
+        def fake_iter(url, attributes=None):
+            for chunk in chunks:
+                yield None, chunk
+            if error:
+                raise error
+        patcher = mock.patch.object(views_stream, "iter_policy_analysis", side_effect=fake_iter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _body(response):
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_ndjson_lines(self):
+        self._stream([self.records[:1], self.records[1:]])
+        response = self.client.post(self.endpoint, {"url": self.url}, format="json")
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        self.assertEqual(
+            [json.loads(line) for line in self._body(response).splitlines()],
+            [
+                {"type": "paragraph", "index": 0, "text": "Intro.", "predicted_labels": [FIRST_PARTY]},
+                {"type": "paragraph", "index": 1, "text": "Contact us.", "predicted_labels": [THIRD_PARTY]},
+                {"type": "done", "url": self.url, "paragraphs": 2},
+            ]
+        )
+
+    def test_sse_framing(self):
+        self._stream([self.records[:1]])
+        expected = (
+            'event: paragraph\ndata: {"type": "paragraph", "index": 0, "text": "Intro.", '
+            f'"predicted_labels": ["{FIRST_PARTY}"]}}\n\n'
+            f'event: done\ndata: {{"type": "done", "url": "{self.url}", "paragraphs": 1}}\n\n'
+        )
+        # EventSource 只能 GET
+        response = self.client.get(self.endpoint, {"url": self.url, "format": "sse"})
+        self.assertEqual(response["Content-Type"], "text/event-stream; charset=utf-8")
+        self.assertEqual(self._body(response), expected)
+
+        response = self.client.post(self.endpoint, {"url": self.url}, format="json", HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(self._body(response), expected)
+
+    def test_missing_url_is_rendered_as_error_event(self):
+        response = self.client.post(self.endpoint, {}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {"type": "error", "error": "Missing 'url'"})
+
+        response = self.client.get(self.endpoint, {"format": "sse"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content.decode(), 'event: error\ndata: {"type": "error", "error": "Missing \'url\'"}\n\n')
+
+    def test_error_mid_stream_ends_with_error_event(self):
+        self._stream([self.records[:1]], error=RuntimeError("model crashed"))
+        with self.assertLogs(views_stream.logger, "ERROR"):
+            response = self.client.post(self.endpoint, {"url": self.url}, format="json")
+            events = [json.loads(line) for line in self._body(response).splitlines()]
+        self.assertEqual([event["type"] for event in events], ["paragraph", "error"])
+        self.assertEqual(events[-1], {"type": "error", "message": "model crashed"})
+
+
+class CorpusAnalysisTests(TransactionTestCase):
+    """进程池换成线程池（不跑 init_worker 加载模型），模型换成桩。"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        for name in ["a", "b"]:
+            with open(os.path.join(self.directory, f"{name}.html"), "wb") as f:
+                f.write(PAGE)
+        with open(os.path.join(self.directory, "notes.txt"), "w") as f:
+            f.write("not a page")
+
+        def extract(pairs, model, tokenizer):
+            return [
+                [{
+                    "sentence": text, "category": FIRST_PARTY,
+                    "attributes": _attributes(FIRST_PARTY, {"Does/Does Not": ["collect"], PIT: ["email address"]}),
+                }] if "email" in text else []
+                for text, labels in pairs
+            ]
+
+        for patch in [
+            mock.patch.object(
+                corpus_analysis, "ProcessPoolExecutor", lambda workers, **kwargs: ThreadPoolExecutor(workers)
+            ),
+            mock.patch.object(
+                privacy_pipeline, "predict_paragraph_categories",
+                side_effect=lambda paragraphs: ([[FIRST_PARTY]] * len(paragraphs), None)
+            ),
+            mock.patch.object(privacy_pipeline, "load_span_model", return_value=(None, None)),
+            mock.patch.object(privacy_pipeline, "extract_from_paragraphs", side_effect=extract),
+            mock.patch.object(
+                privacy_pipeline, "predict_attribute_values",
+                side_effect=lambda queries: ["Does" if attr == "Does/Does Not" else "Contact" for attr, _ in queries]
+            ),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_corpus_is_stored_like_analyze_and_store(self):
+        targets = corpus_analysis.load_targets(self.directory)
+        urls = ["file://" + os.path.join(os.path.abspath(self.directory), f"{name}.html") for name in "ab"]
+        self.assertEqual([url for url, _ in targets], urls)
+
+        # 测试库是共享缓存的内存 SQLite，不能两个线程同时写，分析只用一个线程
+        report = corpus_analysis.run_corpus(targets, workers=1, fetch_workers=2)
+        self.assertEqual(
+            (report["policies"], report["analyzed"], report["unchanged"], report["failed"], report["sentences"]),
+            (2, 2, 0, 0, 2)
+        )
+        self.assertGreater(report["policies_per_minute"], 0)
+        self.assertGreater(report["sentences_per_second"], 0)
+
+        versions = {url: current_version(url) for url in urls}
+        for url, version in versions.items():
+            self.assertEqual(version.last_updated_date, "2024-01-01")
+            [sentence] = [item for record in load_records(version) for item in record["sentences"]]
+            self.assertEqual(sentence["predicted_values"]["Does/Does Not"], "Does")
+            self.assertEqual(sentence["predicted_values"][PIT], {"email address": "Contact"})
+
+        # 再跑一遍：日期没变，直接用存好的版本
+        out = io.StringIO()
+        call_command("analyze_corpus", self.directory, workers=1, fetch_workers=1, stdout=out, stderr=io.StringIO())
+        self.assertIn("Analyzed: 0  unchanged: 2  failed: 0", out.getvalue())
+        self.assertRegex(out.getvalue(), r"Throughput: [\d.]+ policies/min, [\d.]+ sentences/s")
+        self.assertEqual({url: current_version(url) for url in urls}, versions)
+        privacy_pipeline.predict_paragraph_categories.assert_called()
+        self.assertEqual(privacy_pipeline.extract_from_paragraphs.call_count, 2)
+
+
+class CollectedPersonalInfoViewTests(SimpleTestCase):
+    url = "https://example.com/privacy"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.endpoint = reverse("collected_pit")
+        self.analysis = mock.Mock()
+        self.analysis.sentence_items.return_value = []
+        self.analysis.does_sentences.return_value = []
+        self.analysis.staged_extract.return_value = ([], {"sentences": 0})
+        self.analysis.predict.return_value = []
+        patch = mock.patch.object(views_api, "get_policy_analysis", return_value=self.analysis)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _staged(self, data, format="json"):
+        self.analysis.staged_extract.reset_mock()
+        response = self.client.post(self.endpoint, {"url": self.url, **data}, format=format)
+        self.assertEqual(response.status_code, 200, response.content)
+        return self.analysis.staged_extract.called
+
+    def test_staged_flag_is_parsed_as_boolean(self):
+        self.assertTrue(self._staged({"staged": True}))
+        self.assertFalse(self._staged({"staged": False}))
+        # 表单里的值都是字符串，"false" / "0" 不能当成真
+        for value, expected in [("true", True), ("1", True), ("false", False), ("0", False), ("False", False)]:
+            self.assertEqual(self._staged({"staged": value}, format="multipart"), expected, value)
+        with mock.patch.object(views_api, "STAGED_EVALUATION", False):
+            self.assertFalse(self._staged({}))
+
+    def test_invalid_staged_value_is_rejected(self):
+        for value in ["maybe", ""]:
+            response = self.client.post(self.endpoint, {"url": self.url, "staged": value}, format="multipart")
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["error"], "Invalid value for 'staged' parameter.")
+        self.analysis.sentence_items.assert_not_called()
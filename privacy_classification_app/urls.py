@@ -26,6 +26,8 @@ from .views_api_cached import AnalyzeAndStoreView
 from .views_user_question import UserQuestionFromDBView
 from .views_user_question import result_view
 from .views_user_question import form_view
+from .views_jobs import AnalysisJobView, AnalysisJobStatusView
+from .views_stream import ClassifyURLStreamView, ExtractAttributesStreamView, ExtractAttributesCachedStreamView
 
 urlpatterns = [
     path('classify-url/', ClassifyURLView.as_view(), name='classify_url'),
@@ -37,9 +39,16 @@ urlpatterns = [
     path('test/filter-sentences/', test_filter_sentences_page, name='test_filter_sentences_page'),
 
     path("extract-attributes-cached/", ExtractAttributesCachedView.as_view(), name="extract_attributes_cached"),
+
+    path("classify-url/stream/", ClassifyURLStreamView.as_view(), name="classify_url_stream"),
+    path("extract-attributes-api/stream/", ExtractAttributesStreamView.as_view(), name="extract_attributes_api_stream"),
+    path("extract-attributes-cached/stream/", ExtractAttributesCachedStreamView.as_view(),
+         name="extract_attributes_cached_stream"),
     path('collected-and-shared-detailed/', CollectedAndSharedDetailedView.as_view(), name='collected_and_shared_detailed'),
 
     path("analyze-and-store/", AnalyzeAndStoreView.as_view(), name="analyze_and_store"),
+    path("analysis-jobs/", AnalysisJobView.as_view(), name="analysis_jobs"),
+    path("analysis-jobs/<uuid:job_id>/", AnalysisJobStatusView.as_view(), name="analysis_job_status"),
 
     path("user-question-from-db/", UserQuestionFromDBView.as_view(), name="user_question_from_db"),
 
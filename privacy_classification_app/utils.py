@@ -1,29 +1,22 @@
-import requests
-from bs4 import BeautifulSoup
-import re
+from .document_fetcher import fetch_document
+
+def find_last_updated(document):
+    """
+    从已经下载好的 PolicyDocument 里找“Last Updated”或类似字段。
+    返回 YYYY-MM-DD 格式 或 None。
+    """
+    if not document.ok:
+        return None
+    return document.content[1]
 
 def extract_last_updated(url):
     """
     从隐私政策页面提取“Last Updated”或类似字段。
     返回 YYYY-MM-DD 格式 或 None。
+    同一个请求里还要抽段落的话，用 fetch_document + find_last_updated，避免下载两次。
     """
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code != 200:
-            return None
-
-        soup = BeautifulSoup(response.text, 'html.parser')
-        text = soup.get_text().lower()
-
-        for keyword in ["last updated", "effective date", "last modified"]:
-            idx = text.find(keyword)
-            if idx != -1:
-                snippet = text[idx: idx + 100]
-                match = re.search(r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})', snippet)
-                if match:
-                    return match.group(1)
-        return None
+        return find_last_updated(fetch_document(url))
     except Exception:
         return None
 
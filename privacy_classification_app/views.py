@@ -1,23 +1,18 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import requests
-from bs4 import BeautifulSoup
-
-from .model_runner import predict_paragraph_category
+from .document_fetcher import fetch_document
+from .model_runner import predict_paragraph_category, predict_paragraph_categories
 from django.shortcuts import render
 from collections import Counter
 import matplotlib.pyplot as plt
 import os
 import uuid
 
-from .extraction_pipeline import extract_from_paragraph,get_attributes_for_label
-from .span_model_runner import load_span_model
+from .extraction_pipeline import get_attributes_for_label
 import re
 
-from .attribute_predictor import predict_pit_value, predict_purpose_value, predict_does_not_label, predict_tpe_value
 
-span_model, span_tokenizer = load_span_model()
 
 def get_display_attr(attr,category):
     if attr == "Action Third Party" and category == "First Party Collection/Use":
@@ -66,68 +61,40 @@ def is_real_span(span,sentence):
 
 def extract_attributes_view(request):
     if request.method == "POST":
+        # services.policy_analysis 依赖本模块，在这里导入避免循环
+        from .services.policy_analysis import get_policy_analysis, real_attributes
+
         url = request.POST.get("url")
-        paragraphs = extract_paragraphs_from_url(url)
-        results = []
+        analysis = get_policy_analysis(url)
+        sentence_items = analysis.sentence_items()
         extracted_sentences = []
-
-        for para in paragraphs:
-            labels = predict_paragraph_category(para)
-            results.append({"text": para, "labels": labels})
-
-            extracted = extract_from_paragraph(para, labels, span_model, span_tokenizer)
-
-            for sentence_item in extracted:
-                # 去除伪 span（例如 "what part of the text refers to purpose"）
-                cleaned_attributes = {}
-                for attr, spans in sentence_item["attributes"].items():
-                    real_spans = [s for s in spans if is_real_span(s, sentence_item["sentence"])]
-                    if real_spans:
-                        cleaned_attributes[attr] = real_spans
-                sentence_item["attributes"] = cleaned_attributes
-
+        for sentence_item, predicted_values in zip(sentence_items, analysis.attribute_values(sentence_items)):
+            # 去除伪 span（例如 "what part of the text refers to purpose"）
+            cleaned_attributes = {
+                attr: spans for attr, spans in real_attributes(sentence_item).items() if spans
+            }
+
+            display_attributes = {}
+            for attr in get_attributes_for_label(sentence_item["category"]):
+                display_name = get_display_attr(attr, sentence_item["category"])
+                spans = cleaned_attributes.get(attr, [])
+
+                if attr in predicted_values:
+                    joined_span = ", ".join(spans)
+                    display_attributes[display_name] = [f"{joined_span} [Predicted: {predicted_values[attr]}]"]
+                else:
+                    display_attributes[display_name] = spans
+
+            extracted_sentences.append({
+                "sentence": sentence_item["sentence"],
+                "category": sentence_item["category"],
+                "attributes": cleaned_attributes,
                 # 高亮 + 展示 friendly 名称
-                sentence_item["highlighted"] = highlight_spans(
-                    sentence_item["sentence"],
-                    sentence_item["attributes"],
-                    sentence_item["category"]
-                )
-
-
-                expected_attrs = get_attributes_for_label(sentence_item["category"])
-
-
-                display_attributes = {}
-                for attr in expected_attrs:
-                    display_name = get_display_attr(attr, sentence_item["category"])
-                    spans = sentence_item["attributes"].get(attr, [])
-
-
-                    if attr == "Personal Information Type" and spans:
-                        joined_span = ", ".join(spans)
-                        predicted = predict_pit_value(joined_span)
-                        display_attributes[display_name] = [f"{joined_span} [Predicted: {predicted}]"]
-
-                    elif attr == "Purpose" and spans:
-                        joined_span = ", ".join(spans)
-                        predicted = predict_purpose_value(joined_span)
-                        display_attributes[display_name] = [f"{joined_span} [Predicted: {predicted}]"]
-
-                    elif attr == "Does/Does Not" and spans:
-                        joined_span = ", ".join(spans)
-                        predicted = predict_does_not_label(joined_span)
-                        display_attributes[display_name] = [f"{joined_span} [Predicted: {predicted}]"]
-
-                    elif attr == "Third Party Entity" and spans:
-                        joined_span = ", ".join(spans)
-                        predicted = predict_tpe_value(joined_span)
-                        display_attributes[display_name] = [f"{joined_span} [Predicted: {predicted}]"]
-                    else:
-                        display_attributes[display_name] = spans
-
-                sentence_item["display_attributes"] = display_attributes
-
-            extracted_sentences.extend(extracted)
+                "highlighted": highlight_spans(
+                    sentence_item["sentence"], cleaned_attributes, sentence_item["category"]
+                ),
+                "display_attributes": display_attributes,
+            })
 
         print("Extracted Sentences Count:", len(extracted_sentences))
         return render(request, "privacy_classification_app/attribute_results.html", {
@@ -144,11 +111,12 @@ def extract_attributes_view(request):
 
 
 #Extract the paragraph from url
+def paragraphs_from_document(document):
+    # 所有 <p> 的文本，只保留长度 > 30 的（见 html_extraction）
+    return document.content[0]
+
 def extract_paragraphs_from_url(url):
-    response = requests.get(url, timeout=10)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    paragraphs = [p.get_text(strip=True) for p in soup.find_all('p')]
-    return [p for p in paragraphs if len(p) > 30]
+    return paragraphs_from_document(fetch_document(url))
 
 def classify_and_show(request):
     if request.method == "POST":
@@ -157,8 +125,8 @@ def classify_and_show(request):
         results = []
         all_labels = []
 
-        for para in paragraphs:
-            labels = predict_paragraph_category(para)
+        paragraph_labels, _ = predict_paragraph_categories(paragraphs)
+        for para, labels in zip(paragraphs, paragraph_labels):
             results.append({"text": para, "labels": labels})
             all_labels.extend(labels)
 
@@ -196,8 +164,8 @@ class ClassifyPolicyView(APIView):
         try:
             paragraphs = extract_paragraphs_from_url(url)
             results = []
-            for para in paragraphs:
-                predicted_labels = predict_paragraph_category(para)
+            paragraph_labels, _ = predict_paragraph_categories(paragraphs)
+            for para, predicted_labels in zip(paragraphs, paragraph_labels):
                 results.append({
                     "paragraph": para,
                     "predicted_labels": predicted_labels
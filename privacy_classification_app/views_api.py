@@ -7,17 +7,12 @@ from rest_framework import status
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
-from .model_runner import predict_paragraph_category
-from .extraction_pipeline import extract_from_paragraph, get_attributes_for_label
-from .span_model_runner import load_span_model
-from .attribute_predictor import (
-    predict_pit_value, predict_purpose_value,
-    predict_does_not_label, predict_tpe_value
-)
-from .views import extract_paragraphs_from_url, get_display_attr, highlight_spans, is_real_span
+from .model_runner import predict_paragraph_category, predict_paragraph_categories
+from .services.policy_analysis import STAGED_EVALUATION, categories_for, get_policy_analysis, real_attributes
+from .services.privacy_pipeline import pipeline_queries
+from .views import extract_paragraphs_from_url, highlight_spans, is_real_span
 import traceback
 
-span_model, span_tokenizer = load_span_model()
 
 #1. Classify, giving url, classify each paragraph with some labels
 @method_decorator(csrf_exempt,name = 'dispatch')
@@ -32,8 +27,8 @@ class ClassifyURLView(APIView):
         try:
             paragraphs = extract_paragraphs_from_url(url)
             result = []
-            for para in paragraphs:
-                labels = predict_paragraph_category(para)
+            paragraph_labels, _ = predict_paragraph_categories(paragraphs)
+            for para, labels in zip(paragraphs, paragraph_labels):
                 result.append({"text": para, "predicted_labels": labels})
 
             return Response({"paragraphs": result}, status=status.HTTP_200_OK)
@@ -57,6 +52,18 @@ class ClassifyParagraphView(APIView):
         labels = predict_paragraph_category(paragraph)
         return Response({"paragraph": paragraph, "predicted_labels": labels})
 
+def extracted_sentence(sentence_item, predicted_values):
+    """ExtractAttributesView 返回的一个句子：真实 span、高亮 HTML 和属性预测值。"""
+    attributes = real_attributes(sentence_item)
+    return {
+        "sentence": sentence_item["sentence"],
+        "category": sentence_item["category"],
+        "attributes": attributes,
+        "highlighted_html": highlight_spans(sentence_item["sentence"], attributes, sentence_item["category"]),
+        "predicted_values": predicted_values,
+    }
+
+
 # 3. extract attributes (full span info)
 @method_decorator(csrf_exempt, name='dispatch')
 class ExtractAttributesView(APIView):
@@ -65,42 +72,12 @@ class ExtractAttributesView(APIView):
         if not url:
             return Response({"error": "Missing 'url'"}, status=400)
 
-        paragraphs = extract_paragraphs_from_url(url)
-        extracted_sentences = []
-
-        for para in paragraphs:
-            labels = predict_paragraph_category(para)
-            extracted = extract_from_paragraph(para, labels, span_model, span_tokenizer)
-
-            for sentence_item in extracted:
-                cleaned_attributes = {
-                    attr: [s for s in spans if is_real_span(s, sentence_item["sentence"])]
-                    for attr, spans in sentence_item["attributes"].items()
-                }
-                sentence_item["attributes"] = cleaned_attributes
-
-                sentence_item["highlighted_html"] = highlight_spans(
-                    sentence_item["sentence"],
-                    sentence_item["attributes"],
-                    sentence_item["category"]
-                )
-
-                expected_attrs = get_attributes_for_label(sentence_item["category"])
-                predicted_values = {}
-                for attr in expected_attrs:
-                    joined = ", ".join(sentence_item["attributes"].get(attr, []))
-                    if attr == "Personal Information Type" and joined:
-                        predicted_values[attr] = predict_pit_value(joined)
-                    elif attr == "Purpose" and joined:
-                        predicted_values[attr] = predict_purpose_value(joined)
-                    elif attr == "Does/Does Not" and joined:
-                        predicted_values[attr] = predict_does_not_label(joined)
-                    elif attr == "Third Party Entity" and joined:
-                        predicted_values[attr] = predict_tpe_value(joined)
-
-                sentence_item["predicted_values"] = predicted_values
-
-            extracted_sentences.extend(extracted)
+        analysis = get_policy_analysis(url)
+        sentence_items = analysis.sentence_items()
+        extracted_sentences = [
+            extracted_sentence(sentence_item, predicted_values)
+            for sentence_item, predicted_values in zip(sentence_items, analysis.attribute_values(sentence_items))
+        ]
 
         return Response({"sentences": extracted_sentences})
 
@@ -113,23 +90,20 @@ class PersonalInfoSummaryView(APIView):
         if not url:
             return Response({"error": "Missing 'url'"}, status=400)
 
-        paragraphs = extract_paragraphs_from_url(url)
+        analysis = get_policy_analysis(url)
+        # 只看 First Party 段落（段落里的 Third Party 句子也算），只需要 PIT
+        sentence_items = [
+            sentence_item for record, sentence_item in analysis.sentences()
+            if "First Party Collection/Use" in record["labels"]
+        ]
+        analysis.extract(sentence_items, ["Personal Information Type"])
+
         personal_spans = []
-        predicted_labels = []
-
-        for para in paragraphs:
-            labels = predict_paragraph_category(para)
-            if "First Party Collection/Use" not in labels:
-                continue
-
-            extracted = extract_from_paragraph(para, labels, span_model, span_tokenizer)
-            for item in extracted:
-                spans = item["attributes"].get("Personal Information Type", [])
-                if spans:
-                    joined = ", ".join(spans)
-                    label = predict_pit_value(joined)
-                    personal_spans.append(joined)
-                    predicted_labels.append(label)
+        for sentence_item in sentence_items:
+            spans = sentence_item["attributes"].get("Personal Information Type", [])
+            if spans:
+                personal_spans.append(", ".join(spans))
+        predicted_labels = analysis.predict([("Personal Information Type", spans) for spans in personal_spans])
 
         return Response({
             "personal_info_types": personal_spans,
@@ -142,6 +116,13 @@ Following code is previous code that only return pit for First Party Collection/
 '''
 '''
 
+def parse_bool(value):
+    """JSON 布尔值，或者表单/查询参数里的 "true" / "false" / "1" / "0"（不区分大小写）；其它返回 None。"""
+    if isinstance(value, bool):
+        return value
+    return {"true": True, "1": True, "false": False, "0": False}.get(str(value).strip().lower())
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class CollectedPersonalInfoView(APIView):
     def post(self, request):
@@ -191,15 +172,28 @@ class CollectedPersonalInfoView(APIView):
 Following code support both pit for First Party and Third Party
 '''
 
+def parse_bool(value):
+    """JSON 布尔值，或者表单/查询参数里的 "true" / "false" / "1" / "0"（不区分大小写）；其它返回 None。"""
+    if isinstance(value, bool):
+        return value
+    return {"true": True, "1": True, "false": False, "0": False}.get(str(value).strip().lower())
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class CollectedPersonalInfoView(APIView):
     def post(self, request):
         url = request.data.get("url")
         include = request.data.get("include", ["first", "third"])
         include = [item.lower() for item in include]
+        staged = parse_bool(request.data.get("staged", STAGED_EVALUATION))
 
         if not url:
             return Response({"error": "Missing 'url' in POST data."}, status=status.HTTP_400_BAD_REQUEST)
+        if staged is None:
+            return Response({
+                "error": "Invalid value for 'staged' parameter.",
+                "allowed_values": ["true", "false", "1", "0"],
+            }, status=status.HTTP_400_BAD_REQUEST)
 
 
         allowed_values = {"first", "third"}
@@ -212,50 +206,45 @@ class CollectedPersonalInfoView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            paragraphs = extract_paragraphs_from_url(url)
+            analysis = get_policy_analysis(url)
             first_party_info = set()
             third_party_info = set()
 
-            for para in paragraphs:
-                labels = predict_paragraph_category(para)
-
-
-                need_process = (
-                    ("first" in include and "First Party Collection/Use" in labels) or
-                    ("third" in include and "Third Party Sharing/Collection" in labels)
+            # 只需要 Does/Does Not 和 PIT；staged 时 PIT 的 QA 也只给 "Does" 的句子跑
+            sentence_items = analysis.sentence_items(categories_for(include))
+            report = None
+            if staged:
+                # 下面 PIT 按单个 span 预测，和 pipeline 一样
+                does_items, report = analysis.staged_extract(
+                    sentence_items, ["Does/Does Not", "Personal Information Type"], pipeline_queries
                 )
-                if not need_process:
-                    continue
-
-                extracted = extract_from_paragraph(para, labels, span_model, span_tokenizer)
-                for sentence_item in extracted:
-                    category = sentence_item["category"]
-                    if category == "First Party Collection/Use" and "first" not in include:
-                        continue
-                    if category == "Third Party Sharing/Collection" and "third" not in include:
-                        continue
-
-                    attributes = sentence_item["attributes"]
-                    sentence = sentence_item["sentence"]
-
-                    does_spans = attributes.get("Does/Does Not", [])
-                    joined_does = ", ".join(does_spans)
-                    if not joined_does or predict_does_not_label(joined_does) != "Does":
-                        continue
-
-                    for pit_span in attributes.get("Personal Information Type", []):
-                        if is_real_span(pit_span, sentence):
-                            predicted_value = predict_pit_value(pit_span)
-                            if category == "First Party Collection/Use":
-                                first_party_info.add(predicted_value)
-                            elif category == "Third Party Sharing/Collection":
-                                third_party_info.add(predicted_value)
+            else:
+                analysis.extract(sentence_items, ["Does/Does Not", "Personal Information Type"])
+                does_items = analysis.does_sentences(sentence_items)
+
+            # 只对 "Does" 的句子批量预测 PIT
+            pit_categories = []
+            pit_spans = []
+            for sentence_item in does_items:
+                for pit_span in sentence_item["attributes"].get("Personal Information Type", []):
+                    if is_real_span(pit_span, sentence_item["sentence"]):
+                        pit_categories.append(sentence_item["category"])
+                        pit_spans.append(pit_span)
+
+            pit_values = analysis.predict([("Personal Information Type", pit_span) for pit_span in pit_spans])
+            for category, predicted_value in zip(pit_categories, pit_values):
+                if category == "First Party Collection/Use":
+                    first_party_info.add(predicted_value)
+                elif category == "Third Party Sharing/Collection":
+                    third_party_info.add(predicted_value)
 
             response_data = {"url": url}
             if "first" in include:
                 response_data["first_party_collected_personal_information"] = sorted(first_party_info)
             if "third" in include:
                 response_data["third_party_collected_personal_information"] = sorted(third_party_info)
+            if report is not None:
+                response_data["evaluation"] = report
 
             return Response(response_data)
 
@@ -283,58 +272,29 @@ class FilterSentencesByPITView(APIView):
                 "invalid_values": invalid_values
             }, status=400)
 
-        paragraphs = extract_paragraphs_from_url(url)
-        matched_sentences = []
+        analysis = get_policy_analysis(url)
+        # 先只算 PIT 和 Does/Does Not 做筛选，其它属性只给匹配的句子算
+        sentence_items = analysis.sentence_items(categories_for(include))
+        filter_values = analysis.attribute_values(sentence_items, ["Personal Information Type", "Does/Does Not"])
+        matched_items = [
+            sentence_item for sentence_item, predicted_values in zip(sentence_items, filter_values)
+            if predicted_values.get("Personal Information Type") == pit_value and
+            predicted_values.get("Does/Does Not") == "Does"
+        ]
 
-        for para in paragraphs:
-            labels = predict_paragraph_category(para)
-
-            need_process = (
-                ("first" in include and "First Party Collection/Use" in labels) or
-                ("third" in include and "Third Party Sharing/Collection" in labels)
-            )
-            if not need_process:
-                continue
-
-            extracted = extract_from_paragraph(para, labels, span_model, span_tokenizer)
-            for sentence_item in extracted:
-                category = sentence_item["category"]
-                if category == "First Party Collection/Use" and "first" not in include:
-                    continue
-                if category == "Third Party Sharing/Collection" and "third" not in include:
-                    continue
-
-                attributes = {
-                    attr: [s for s in spans if is_real_span(s, sentence_item["sentence"])]
-                    for attr, spans in sentence_item["attributes"].items()
-                }
-                sentence_item["attributes"] = attributes
-
-                sentence_item["highlighted_html"] = highlight_spans(
+        matched_sentences = []
+        for sentence_item, predicted_values in zip(matched_items, analysis.attribute_values(matched_items)):
+            attributes = real_attributes(sentence_item)
+            matched_sentences.append({
+                "sentence": sentence_item["sentence"],
+                "category": sentence_item["category"],
+                "attributes": attributes,
+                "highlighted_html": highlight_spans(
                     sentence_item["sentence"],
-                    {"Personal Information Type": sentence_item["attributes"].get("Personal Information Type", [])},
+                    {"Personal Information Type": attributes.get("Personal Information Type", [])},
                     sentence_item["category"]
-                )
-
-                expected_attrs = get_attributes_for_label(category)
-                predicted_values = {}
-                for attr in expected_attrs:
-                    joined = ", ".join(attributes.get(attr, []))
-                    if attr == "Personal Information Type" and joined:
-                        predicted_values[attr] = predict_pit_value(joined)
-                    elif attr == "Purpose" and joined:
-                        predicted_values[attr] = predict_purpose_value(joined)
-                    elif attr == "Does/Does Not" and joined:
-                        predicted_values[attr] = predict_does_not_label(joined)
-                    elif attr == "Third Party Entity" and joined:
-                        predicted_values[attr] = predict_tpe_value(joined)
-
-                sentence_item["predicted_values"] = predicted_values
-
-
-                if (predicted_values.get("Personal Information Type") == pit_value and
-                    predicted_values.get("Does/Does Not") == "Does"):
-                    matched_sentences.append(sentence_item)
+                ),
+                "predicted_values": predicted_values,
+            })
 
         return Response({"matched_sentences": matched_sentences})
-
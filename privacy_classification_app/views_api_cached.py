@@ -11,17 +11,9 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.core.cache import cache
 
-from .span_model_runner import load_span_model
-from .extraction_pipeline import extract_from_paragraph, get_attributes_for_label
-from .model_runner import predict_paragraph_category
-from .attribute_predictor import (
-    predict_pit_value, predict_purpose_value,
-    predict_does_not_label, predict_tpe_value
-)
-from .views import extract_paragraphs_from_url, highlight_spans, is_real_span
+from .services.policy_analysis import get_policy_analysis, real_attributes
+from .views import highlight_spans
 
-# 加载Span模型（全局只加载一次）
-span_model, span_tokenizer = load_span_model()
 
 
 # 缓存Key生成
@@ -29,6 +21,39 @@ def make_key(prefix: str, text: str) -> str:
     return f"{prefix}:{hashlib.md5(text.encode()).hexdigest()}"
 
 
+CACHED_CATEGORIES = ["First Party Collection/Use", "Third Party Sharing/Collection"]
+
+
+def collected_sentences(analysis, sentence_items):
+    """
+    句子里必须有 PIT 且 Does/Does Not 预测为 "Does"；先只算这两个属性，
+    匹配的句子再算全部属性，返回带高亮 HTML 的句子。
+    """
+    sentence_items = [item for item in sentence_items if item["category"] in CACHED_CATEGORIES]
+    filter_values = analysis.attribute_values(sentence_items, ["Does/Does Not", "Personal Information Type"])
+    matched_items = [
+        sentence_item for sentence_item, predicted_values in zip(sentence_items, filter_values)
+        if predicted_values.get("Does/Does Not") == "Does" and
+        real_attributes(sentence_item).get("Personal Information Type")  # 确保句子中确实有 PIT span
+    ]
+
+    sentences = []
+    for sentence_item, predicted_values in zip(matched_items, analysis.attribute_values(matched_items)):
+        # ✅ 清理 attributes
+        cleaned_attributes = real_attributes(sentence_item)
+        sentences.append({
+            "sentence": sentence_item["sentence"],
+            "category": sentence_item["category"],
+            "attributes": cleaned_attributes,
+            "predicted_values": predicted_values,
+            # ✅ 生成高亮 HTML
+            "highlighted_html": highlight_spans(
+                sentence_item["sentence"], cleaned_attributes, sentence_item["category"], predicted_values
+            ),
+        })
+    return sentences
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class ExtractAttributesCachedView(APIView):
     def post(self, request):
@@ -42,73 +67,20 @@ class ExtractAttributesCachedView(APIView):
             if cached_result:
                 return Response(cached_result)
 
-            paragraphs = extract_paragraphs_from_url(url)
+            analysis = get_policy_analysis(url)
 
             result = {
                 "url": url,
-                "categories": {
-                    "First Party Collection/Use": {"attributes": {}, "sentences": []},
-                    "Third Party Sharing/Collection": {"attributes": {}, "sentences": []}
-                }
+                "categories": {cat: {"attributes": {}, "sentences": []} for cat in CACHED_CATEGORIES}
             }
 
-            for para in paragraphs:
-                labels = predict_paragraph_category(para)
-                extracted = extract_from_paragraph(para, labels, span_model, span_tokenizer)
-
-                for sentence_item in extracted:
-                    cat = sentence_item["category"]
-                    if cat not in result["categories"]:
-                        continue
-
-                    # ✅ 清理 attributes
-                    cleaned_attributes = {
-                        attr: [s for s in spans if is_real_span(s, sentence_item["sentence"])]
-                        for attr, spans in sentence_item["attributes"].items()
-                    }
-                    sentence_item["attributes"] = cleaned_attributes
-
-                    # ✅ 预测属性值
-                    expected_attrs = get_attributes_for_label(cat)
-                    predicted_values = {}
-                    for attr in expected_attrs:
-                        joined = ", ".join(cleaned_attributes.get(attr, []))
-                        if attr == "Personal Information Type" and joined:
-                            predicted_values[attr] = predict_pit_value(joined)
-                        elif attr == "Purpose" and joined:
-                            predicted_values[attr] = predict_purpose_value(joined)
-                        elif attr == "Does/Does Not" and joined:
-                            predicted_values[attr] = predict_does_not_label(joined)
-                        elif attr == "Third Party Entity" and joined:
-                            predicted_values[attr] = predict_tpe_value(joined)
-
-                    sentence_item["predicted_values"] = predicted_values
-
-                    # ✅ 过滤逻辑：必须 Does 且有 PIT
-                    if (
-                            predicted_values.get("Does/Does Not") != "Does" or
-                            not cleaned_attributes.get("Personal Information Type")  # 确保句子中确实有 PIT span
-                    ):
-                        continue
-
-                    # ✅ 生成高亮 HTML
-                    sentence_item["highlighted_html"] = highlight_spans(
-                        sentence_item["sentence"], cleaned_attributes, cat, predicted_values
-                    )
-
-                    # ✅ 合并 attributes
-                    for attr, spans in cleaned_attributes.items():
-                        if attr not in result["categories"][cat]["attributes"]:
-                            result["categories"][cat]["attributes"][attr] = []
-                        result["categories"][cat]["attributes"][attr].extend(spans)
-
-                    # 去重
-                    for attr in result["categories"][cat]["attributes"]:
-                        result["categories"][cat]["attributes"][attr] = list(
-                            set(result["categories"][cat]["attributes"][attr])
-                        )
-
-                    result["categories"][cat]["sentences"].append(sentence_item)
+            for sentence in collected_sentences(analysis, analysis.sentence_items()):
+                cat = sentence["category"]
+                # ✅ 合并 attributes（去重）
+                for attr, spans in sentence["attributes"].items():
+                    merged = result["categories"][cat]["attributes"].setdefault(attr, [])
+                    result["categories"][cat]["attributes"][attr] = list(set(merged + spans))
+                result["categories"][cat]["sentences"].append(sentence)
 
             cache.set(key, result, timeout=3600)
             return Response(result)
@@ -301,9 +273,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-from .models import PolicyCache
-from .utils import extract_last_updated
-from .services.privacy_pipeline import run_privacy_pipeline
+from .services.analysis_manager import analyze_and_store_pipeline
 import traceback
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -313,7 +283,7 @@ class CollectedAndSharedDetailedView(APIView):
     输出: First Party & Third Party 的 Personal Information (带缓存)
     缓存逻辑:
         - 如果 URL 存在并且 last_updated_date 一致，返回缓存
-        - 否则调用 pipeline 处理，并更新缓存
+        - 否则和上一版本的段落对齐，只对新增/改动的段落跑 pipeline，并增量更新缓存
     """
     def post(self, request):
         url = request.data.get("url")
@@ -321,28 +291,8 @@ class CollectedAndSharedDetailedView(APIView):
             return Response({"error": "Missing 'url'"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # 检查缓存
-            cached_entry = PolicyCache.objects.filter(url=url).first()
-            latest_date = extract_last_updated(url)
-
-            if cached_entry and cached_entry.last_updated_date == latest_date:
-                return Response(cached_entry.cached_result)
-
-            # 重新跑 pipeline
-            result = run_privacy_pipeline(url)
-
-            # 更新缓存
-            if cached_entry:
-                cached_entry.cached_result = result
-                cached_entry.last_updated_date = latest_date
-                cached_entry.save()
-            else:
-                PolicyCache.objects.create(
-                    url=url,
-                    last_updated_date=latest_date,
-                    cached_result=result
-                )
-
+            # 检查缓存；日期变了只重新分析改动过的段落（见 analyze_and_store_pipeline）
+            result = analyze_and_store_pipeline(url)
             return Response(result)
 
         except Exception as e:
@@ -354,8 +304,6 @@ class CollectedAndSharedDetailedView(APIView):
 
 
 
-from .services.analysis_manager import analyze_and_store_pipeline
-
 @method_decorator(csrf_exempt, name='dispatch')
 class AnalyzeAndStoreView(APIView):
     def post(self, request):
@@ -0,0 +1,37 @@
+"""
+views_jobs.py
+异步分析任务 API：长的隐私政策在请求里跑完会超过 gunicorn 的超时。
+    POST analysis-jobs/            {"url": ...}  -> 202，返回 job_id
+    GET  analysis-jobs/<job_id>/                 -> 状态、进度（已完成/总段落数）、完成后的结果
+"""
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+
+from .models import AnalysisJob
+from .services.analysis_jobs import job_status, resume_stale_jobs, submit_job
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AnalysisJobView(APIView):
+    def post(self, request):
+        url = request.data.get("url")
+        if not url:
+            return Response({"error": "Missing 'url'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = submit_job(url)
+        return Response(job_status(job), status=status.HTTP_202_ACCEPTED)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AnalysisJobStatusView(APIView):
+    def get(self, request, job_id):
+        job = AnalysisJob.objects.filter(id=job_id).first()
+        if job is None:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        # 顺便接手崩掉的 worker 留下的任务
+        resume_stale_jobs()
+        return Response(job_status(job))
@@ -0,0 +1,153 @@
+"""
+views_stream.py
+ClassifyURLView / ExtractAttributesView / ExtractAttributesCachedView 的流式版本：
+段落按块推理（第一块一个段落，之后翻倍，见 policy_analysis.iter_policy_analysis），
+每块算完就把这些段落的结果发出去，不用等整篇 policy，也不在内存里拼整个响应。
+    POST classify-url/stream/                {"url": ...}
+    POST extract-attributes-api/stream/      {"url": ...}
+    POST extract-attributes-cached/stream/   {"url": ...}
+也可以 GET ?url=...：浏览器的 EventSource 只能发 GET，用 GET ?url=...&format=sse。
+
+默认是 NDJSON（application/x-ndjson，每行一个 JSON）；Accept: text/event-stream 或 ?format=sse
+时是 Server-Sent Events。每个段落一条 {"type": "paragraph", "index", "text", ...}，
+最后一条 {"type": "done", ...}；中途出错发一条 {"type": "error", "message"} 后结束。
+"""
+import json
+import logging
+
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .services.policy_analysis import iter_policy_analysis
+from .views_api import extracted_sentence
+from .views_api_cached import CACHED_CATEGORIES, collected_sentences
+
+logger = logging.getLogger(__name__)
+
+
+def _ndjson(event):
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+
+def _sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # 只用于流开始之前的错误响应（比如缺少 url）
+        return _ndjson({"type": "error", **data})
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return _sse({"type": "error", **data})
+
+
+class StreamingAnalysisView(APIView):
+    """子类实现 events(url)，产出不带 type 的段落结果，最后返回 done 事件的内容。"""
+    renderer_classes = [NDJSONRenderer, EventStreamRenderer]
+    attributes = ()
+
+    def get(self, request):
+        return self._respond(request, request.query_params.get("url"))
+
+    def post(self, request):
+        return self._respond(request, request.data.get("url"))
+
+    def _respond(self, request, url):
+        if not url:
+            return Response({"error": "Missing 'url'"}, status=400)
+
+        renderer = request.accepted_renderer
+        encode = _sse if renderer.format == "sse" else _ndjson
+        # ensure_ascii=False，要声明编码
+        response = StreamingHttpResponse(
+            self._stream(url, encode), content_type=f"{renderer.media_type}; charset={renderer.charset}"
+        )
+        response["Cache-Control"] = "no-cache"
+        # 让 nginx 之类的反向代理不要缓冲整个响应
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def _stream(self, url, encode):
+        try:
+            index = 0
+            summary = self.start(url)
+            for analysis, records in iter_policy_analysis(url, attributes=self.attributes):
+                for record in records:
+                    event = {"type": "paragraph", "index": index, "text": record["text"]}
+                    event.update(self.paragraph(analysis, record, summary))
+                    yield encode(event)
+                    index += 1
+            yield encode({"type": "done", "url": url, "paragraphs": index, **self.done(summary)})
+        except Exception as e:
+            logger.exception("Streaming analysis of %s failed", url)
+            yield encode({"type": "error", "message": str(e)})
+
+    def start(self, url):
+        """整个流共用的累计状态（done 事件用）。"""
+        return {}
+
+    def paragraph(self, analysis, record, summary):
+        raise NotImplementedError
+
+    def done(self, summary):
+        return {}
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ClassifyURLStreamView(StreamingAnalysisView):
+    def paragraph(self, analysis, record, summary):
+        return {"predicted_labels": record["labels"]}
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ExtractAttributesStreamView(StreamingAnalysisView):
+    attributes = None
+
+    def paragraph(self, analysis, record, summary):
+        sentence_items = record["sentences"]
+        return {
+            "labels": record["labels"],
+            "sentences": [
+                extracted_sentence(sentence_item, predicted_values)
+                for sentence_item, predicted_values in zip(sentence_items, analysis.attribute_values(sentence_items))
+            ],
+        }
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ExtractAttributesCachedStreamView(StreamingAnalysisView):
+    """段落里 Does 且有 PIT 的句子；done 事件里是每个类别合并去重后的 attributes。"""
+    attributes = ["Does/Does Not", "Personal Information Type"]
+
+    def start(self, url):
+        return {cat: {} for cat in CACHED_CATEGORIES}
+
+    def paragraph(self, analysis, record, summary):
+        sentences = collected_sentences(analysis, record["sentences"])
+        for sentence in sentences:
+            for attr, spans in sentence["attributes"].items():
+                summary[sentence["category"]].setdefault(attr, set()).update(spans)
+        return {"labels": record["labels"], "sentences": sentences}
+
+    def done(self, summary):
+        return {
+            "categories": {
+                cat: {"attributes": {attr: sorted(spans) for attr, spans in attributes.items()}}
+                for cat, attributes in summary.items()
+            }
+        }